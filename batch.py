@@ -0,0 +1,298 @@
+import argparse
+import json
+import logging
+import os
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+# Load .env before anything reads its settings at import time
+load_dotenv()
+
+from tools.price_simulator import fetch_market_data, slice_window, STRESS_TEST_YEARS
+from tools.returns import compute_returns, DEFAULT_NAN_POLICY
+from tools.risk_metrics import historical_var, annualized_volatility, sharpe_ratio
+from tools.stress_test import (log_wealth, worst_windows, drawdown_depths, run_stress_test,
+                               DEFAULT_STRESS_WINDOWS)
+from tools.correlation import correlation_matrix
+from tools.backtest import backtest_var, summarize_backtest, DEFAULT_CONFIDENCES
+from tools.covariance import estimate_covariance, risk_decomposition
+from tools.scenarios import run_scenarios
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(tickers: list, assets: list) -> list:
+    """ Column of each asset in `tickers` — one dict, so O(tickers) not O(tickers²). """
+    column = {ticker: i for i, ticker in enumerate(tickers)}
+    return [column[asset] for asset in assets]
+
+
+def load_batch_data(tickers: list, time_horizon: int, stress_years: int = None,
+                    nan_policy: str = None) -> dict:
+    """
+    One fetch covering the longest window and one returns matrix for
+    everybody — the inputs run_batch and run_scenario_batch share.
+
+    Args:
+        tickers: list of ticker symbols
+        time_horizon: number of calendar days for VaR / volatility / Sharpe
+        stress_years: stress-test look-back (default STRESS_TEST_YEARS)
+        nan_policy: missing-price policy, see tools/returns.py
+    Returns:
+        dict with "returns" (the whole fetch), the "returns_history" (VaR)
+        and "stress_returns" windows of it, and the shrunk "covariance" of
+        the VaR window
+    """
+    stress_days = 365 * (stress_years or STRESS_TEST_YEARS)
+    market_data = fetch_market_data(list(tickers), max(time_horizon, stress_days))
+    returns = compute_returns(market_data, nan_policy or DEFAULT_NAN_POLICY)
+    returns_history = slice_window(returns, time_horizon)
+    return {
+        "returns": returns,
+        "returns_history": returns_history,
+        "stress_returns": slice_window(returns, stress_days),
+        "covariance": estimate_covariance(returns_history)
+    }
+
+
+def run_batch(weights, tickers: list, time_horizon: int, names: list = None,
+              reports=False, stress_years: int = None, stress_windows: list = None,
+              nan_policy: str = None, var_confidences: tuple = None,
+              data: dict = None) -> pd.DataFrame:
+    """
+    Evaluates many portfolios over the same tickers with one fetch and one
+    matrix multiply, instead of one graph run (and download) per portfolio.
+
+    Args:
+        weights: (portfolios × tickers) weight matrix — one portfolio per row
+        tickers: ticker for each column of `weights`
+        time_horizon: number of calendar days for VaR / volatility / Sharpe
+        names: optional name per portfolio (defaults to the row number)
+        reports: False for numbers only, True for an LLM report on every
+            portfolio, or a list of names to write reports for
+        stress_years: stress-test look-back (default STRESS_TEST_YEARS)
+        stress_windows: stress-test windows in trading days (default DEFAULT_STRESS_WINDOWS)
+        nan_policy: missing-price policy, see tools/returns.py
+        var_confidences: VaR backtest levels (default DEFAULT_CONFIDENCES)
+        data: load_batch_data() result for the same tickers and settings,
+            to reuse one fetch across calls (default: fetched here)
+    Returns:
+        DataFrame with one row per portfolio: value_at_risk, sharpe_ratio,
+        volatility, max_drawdown, parametric_var, top_var_contributor, the worst loss / start / end date of each
+        stress window and, per backtest level, the VaR exceedances and the
+        Kupiec / Christoffersen p-values — plus final_report and risk_rating
+        when reports are on.
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    names = list(names) if names is not None else list(range(len(weights)))
+    stress_years = stress_years or STRESS_TEST_YEARS
+    stress_windows = stress_windows or DEFAULT_STRESS_WINDOWS
+    nan_policy = nan_policy or DEFAULT_NAN_POLICY
+    var_confidences = tuple(var_confidences or DEFAULT_CONFIDENCES)
+
+    logger.info(f"[Batch] Evaluating {len(weights)} portfolios over {len(tickers)} tickers...")
+
+    # One fetch covering the longest window, one returns matrix for everybody
+    data = data or load_batch_data(tickers, time_horizon, stress_years, nan_policy)
+    returns, returns_history = data["returns"], data["returns_history"]
+    stress_returns, covariance = data["stress_returns"], data["covariance"]
+
+    # Line the weight columns up with the assets that actually have data
+    columns = _columns(tickers, returns["tickers"])
+    aligned_weights = weights[:, columns]
+
+    # Portfolio returns for every portfolio at once — (days × assets) @ (assets × portfolios)
+    var_returns = np.nan_to_num(returns_history["returns"], nan=0.0) @ aligned_weights.T
+    full_returns = np.nan_to_num(stress_returns["returns"], nan=0.0) @ aligned_weights.T
+
+    # Parametric VaR and volatility for every portfolio from one shrunk
+    # covariance — Σ @ W is the only product, and the largest contributor
+    # falls out per column
+    decomposition = risk_decomposition(covariance, aligned_weights.T)
+
+    results = pd.DataFrame(index=pd.Index(names, name="portfolio"))
+    results["value_at_risk"] = np.round(historical_var(var_returns, 0.95), 4)
+    results["sharpe_ratio"] = np.round(sharpe_ratio(var_returns), 4)
+    # √(wᵀΣw) annualized — the same figure node C reports for a portfolio
+    results["volatility"] = np.round(decomposition["annualized_volatility"], 4)
+
+    # Stress windows — one prefix sum, then one pass per window for all portfolios
+    prefix = log_wealth(full_returns)
+    dates = np.asarray([str(d) for d in stress_returns["dates"]] + ["N/A"])
+    results["max_drawdown"] = np.round(drawdown_depths(prefix), 4)
+    for window in stress_windows:
+        loss, start_idx = worst_windows(prefix, window)
+        found = start_idx >= 0
+        results[f"worst_{window}d_loss"] = np.round(loss, 4)
+        # Index -1 picks the trailing "N/A" when history is shorter than the window
+        results[f"worst_{window}d_start"] = dates[np.where(found, start_idx, -1)]
+        results[f"worst_{window}d_end"] = dates[np.where(found, start_idx + window - 1, -1)]
+
+    results["parametric_var"] = np.round(decomposition["var"], 4)
+    results["top_var_contributor"] = np.asarray(returns["tickers"])[np.argmax(decomposition["component_var"], axis=0)]
+
+    # VaR backtest over the stress history — every portfolio and level in one call
+    window = len(returns_history["dates"])
+    backtest = backtest_var(full_returns, window, var_confidences)
+    for k, confidence in enumerate(var_confidences):
+        level = f"var_{confidence * 100:g}"
+        results[f"{level}_exceedances"] = backtest["exceedances"][:, k]
+        results[f"{level}_kupiec_p"] = np.round(backtest["kupiec_pvalue"][:, k], 4)
+        results[f"{level}_christoffersen_p"] = np.round(backtest["christoffersen_pvalue"][:, k], 4)
+
+    logger.info("[Batch] Quant metrics complete.")
+
+    if reports:
+        wanted = names if reports is True else [name for name in names if name in reports]
+        _add_reports(results, wanted, names, aligned_weights, returns_history,
+                     full_returns, stress_returns, stress_windows, stress_years, var_confidences,
+                     covariance)
+
+    return results
+
+
+def run_scenario_batch(weights, tickers: list, time_horizon: int, scenarios: list,
+                       names: list = None, sectors: dict = None, nan_policy: str = None,
+                       workers: int = None, returns_history: dict = None,
+                       covariance: dict = None) -> pd.DataFrame:
+    """
+    Hypothetical scenarios for many portfolios: one fetch, the returns and
+    covariance in shared memory once, scenario × portfolio blocks spread
+    over a process pool (see tools/scenarios.py). Pass the returns and
+    covariance run_batch already used (load_batch_data()) to skip the fetch.
+
+    Args:
+        weights: (portfolios × tickers) weight matrix — one portfolio per row
+        tickers: ticker for each column of `weights`
+        time_horizon: calendar days of history the stressed VaR uses
+        scenarios: scenario dicts, see tools.scenarios.compile_scenarios
+        names: optional name per portfolio (defaults to the row number)
+        sectors: ticker -> sector, for sector shocks
+        nan_policy: missing-price policy, see tools/returns.py
+        workers: worker processes (default: decided by the amount of work)
+        returns_history: precomputed returns of the last `time_horizon` days,
+            as from tools.returns (default: fetched here)
+        covariance: precomputed estimate_covariance() of `returns_history`
+            (default: estimated here)
+    Returns:
+        DataFrame indexed by (scenario, portfolio) with pnl, stressed_var
+        and stressed_parametric_var
+    """
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    names = list(names) if names is not None else list(range(len(weights)))
+
+    logger.info(f"[Batch] {len(scenarios)} scenarios × {len(weights)} portfolios over {len(tickers)} tickers...")
+    if returns_history is None:
+        market_data = fetch_market_data(list(tickers), time_horizon)
+        returns_history = compute_returns(market_data, nan_policy or DEFAULT_NAN_POLICY)
+    columns = _columns(tickers, returns_history["tickers"])
+
+    covariance = covariance or estimate_covariance(returns_history)
+    results = run_scenarios(returns_history["returns"], weights[:, columns].T, scenarios,
+                            returns_history["tickers"], covariance["matrix"], sectors, workers=workers)
+
+    index = pd.MultiIndex.from_product([results["names"], names], names=["scenario", "portfolio"])
+    table = pd.DataFrame({key: np.round(results[key], 4).ravel()
+                          for key in ("pnl", "stressed_var", "stressed_parametric_var")}, index=index)
+    logger.info("[Batch] Scenarios complete.")
+    return table
+
+
+def _add_reports(results, wanted, names, aligned_weights, returns_history,
+                 full_returns, stress_returns, stress_windows, stress_years, var_confidences,
+                 covariance) -> None:
+    """ Runs report synthesis (Node D) for the selected portfolios, in place. """
+    from nodes.report_synthesis import report_synthesis_node
+
+    # Asset-level metrics are shared by every portfolio — compute them once
+    assets = returns_history["tickers"]
+    asset_volatility = annualized_volatility(returns_history["returns"])
+    correlation = correlation_matrix(returns_history["returns"])
+    dates = stress_returns["dates"]
+
+    results["final_report"] = None
+    results["risk_rating"] = None
+    for name in wanted:
+        row = names.index(name)
+        held = np.nonzero(aligned_weights[row])[0]
+
+        # Same fields nodes B and C would have written for this portfolio
+        stress_test = run_stress_test(full_returns[:, row], dates, stress_windows)
+        stress_test["years"] = stress_years
+        backtest = backtest_var(full_returns[:, row], len(returns_history["dates"]), var_confidences)
+        decomposition = risk_decomposition(covariance, aligned_weights[row])
+        state = {
+            "portfolio": {assets[j]: float(aligned_weights[row, j]) for j in held},
+            "value_at_risk": float(results.at[name, "value_at_risk"]),
+            "stress_test": stress_test,
+            "var_backtest": summarize_backtest(backtest, dates),
+            "parametric_var": {
+                "confidence": decomposition["confidence"],
+                "var": float(results.at[name, "parametric_var"]),
+                "shrinkage": covariance["shrinkage"],
+                "tickers": assets,
+                "marginal_var": decomposition["marginal_var"],
+                "component_var": decomposition["component_var"],
+                "percent_of_var": decomposition["percent_of_var"]
+            },
+            "volatility_scores": {assets[j]: float(round(asset_volatility[j], 4)) for j in held},
+            "sharpe_ratio": float(results.at[name, "sharpe_ratio"]),
+            "correlation_matrix": {
+                "tickers": [assets[j] for j in held],
+                "matrix": correlation[np.ix_(held, held)]
+            }
+        }
+        report = report_synthesis_node(state)
+        results.at[name, "final_report"] = report["final_report"]
+        results.at[name, "risk_rating"] = report["risk_rating"]
+
+
+def main():
+    """
+    Command line entry point.
+    Reads a CSV with one portfolio per row (first column = name, one column per ticker)
+    and writes the results table as CSV.
+    """
+    parser = argparse.ArgumentParser(description="Evaluate many portfolios in one pass.")
+    parser.add_argument("portfolios", help="CSV file: name column + one weight column per ticker")
+    parser.add_argument("--horizon", type=int, default=90, help="time horizon in calendar days")
+    parser.add_argument("--reports", action="store_true", help="also write an LLM report per portfolio")
+    parser.add_argument("--output", default="batch_results.csv", help="where to write the results")
+    parser.add_argument("--scenarios", help="JSON file with a list of scenarios (see tools/scenarios.py), "
+                                            "or {\"scenarios\": [...], \"sectors\": {...}}")
+    parser.add_argument("--scenario-output", default="scenario_results.csv",
+                        help="where to write the scenario P&L table")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+    portfolios = pd.read_csv(args.portfolios, index_col=0).fillna(0.0)
+    # One fetch for the metrics and the scenarios
+    data = load_batch_data(list(portfolios.columns), args.horizon)
+    results = run_batch(
+        portfolios.to_numpy(),
+        list(portfolios.columns),
+        args.horizon,
+        names=list(portfolios.index),
+        reports=args.reports,
+        data=data
+    )
+    results.to_csv(args.output)
+    logger.info(f"[Batch] Results for {len(results)} portfolios written to {args.output}")
+
+    if args.scenarios:
+        with open(args.scenarios) as f:
+            spec = json.load(f)
+        if isinstance(spec, list):
+            spec = {"scenarios": spec}
+        table = run_scenario_batch(portfolios.to_numpy(), list(portfolios.columns), args.horizon,
+                                   spec["scenarios"], names=list(portfolios.index),
+                                   sectors=spec.get("sectors"), returns_history=data["returns_history"],
+                                   covariance=data["covariance"])
+        table.to_csv(args.scenario_output)
+        logger.info(f"[Batch] Scenario P&L for {len(table)} scenario × portfolio pairs "
+                    f"written to {args.scenario_output}")
+
+
+if __name__ == "__main__":
+    main()
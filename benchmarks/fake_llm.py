@@ -0,0 +1,56 @@
+import asyncio
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+
+DEFAULT_REPORT = (
+    "Executive summary: synthetic benchmark report.\n"
+    "Key risks: concentration and correlation.\n"
+    "Diversification: moderate.\n"
+    "RISK RATING: Medium"
+)
+
+
+class LatencyFakeChatModel(SimpleChatModel):
+    """
+    Local stand-in for the report LLM with configurable latency.
+    Waits `latency` seconds before the first token, then streams the report
+    word by word with `token_latency` seconds between words.
+    """
+
+    report: str = DEFAULT_REPORT
+    latency: float = 0.0
+    token_latency: float = 0.0
+    model_name: str = "latency-fake"
+
+    @property
+    def _llm_type(self) -> str:
+        return "latency-fake-chat-model"
+
+    def _tokens(self) -> List[str]:
+        words = self.report.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+              run_manager: Any = None, **kwargs: Any) -> str:
+        time.sleep(self.latency + self.token_latency * len(self._tokens()))
+        return self.report
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for token in self._tokens():
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for token in self._tokens():
+            if self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
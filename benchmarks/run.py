@@ -0,0 +1,251 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+# Run from anywhere: python benchmarks/run.py or python -m benchmarks.run
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.synthetic import SyntheticPriceProvider, synthetic_tickers
+from benchmarks.fake_llm import LatencyFakeChatModel
+from graph import risk_analyzer_graph
+from nodes.data_preparation import data_preparation_node
+from nodes.market_risk import market_risk_node
+from nodes.volatility import volatility_node
+from nodes.report_synthesis import report_synthesis_node
+
+DEFAULT_TICKERS = [10, 100, 1000, 5000]
+DEFAULT_STRESS_YEARS = [1, 3, 10]
+DEFAULT_WINDOW_SETS = [[30, 60, 90], list(range(5, 255, 5))]
+DEFAULT_TIME_HORIZON = 90
+# "drop" keeps only days on which every ticker traded, which leaves almost no
+# history once thousands of tickers (some with gaps) are involved
+DEFAULT_NAN_POLICY = "ffill"
+# Node D's prompt is compacted to the token budget (clusters and the most
+# extreme pairs instead of every pair), so the report step runs at every size
+# by default. --report-max-tickers skips it above a size for quicker runs
+DEFAULT_REPORT_MAX_TICKERS = None
+# A case is flagged as a regression when it is this much slower than the baseline
+DEFAULT_REGRESSION_THRESHOLD = 0.25
+
+
+def _git_commit() -> str:
+    """ Commit the benchmark ran against, so results can be compared over time. """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, cwd=os.path.dirname(__file__)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def _best_of(repeat: int, func):
+    """ Runs func `repeat` times and returns (best seconds, last result).
+    The minimum is the least noisy estimate of what the code itself costs. """
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def run_case(num_tickers: int, stress_years: int, stress_windows: list, repeat: int = 1,
+             seed: int = 0, llm_latency: float = 0.0, nan_policy: str = DEFAULT_NAN_POLICY,
+             report: bool = True, end_to_end: bool = True) -> dict:
+    """
+    Times every node and the whole graph for one point of the grid.
+
+    Args:
+        num_tickers: size of the synthetic equal-weight portfolio
+        stress_years: stress-test look-back, i.e. the history length fetched
+        stress_windows: stress-test windows in trading days
+        repeat: runs per measurement, the fastest is kept
+        seed: seed for the synthetic prices
+        llm_latency: seconds the fake LLM waits before answering
+        nan_policy: missing-price policy, see tools/returns.py
+        report: False to skip node D (and end-to-end, which includes it)
+        end_to_end: False to time the nodes only
+    Returns:
+        dict with the case parameters, input sizes and seconds per node / end to end
+    """
+    tickers = synthetic_tickers(num_tickers)
+    portfolio = {ticker: 1.0 / num_tickers for ticker in tickers}
+    config = {"configurable": {
+        "price_provider": SyntheticPriceProvider(seed=seed),
+        "chat_model": LatencyFakeChatModel(latency=llm_latency),
+        # Every run must reach the (fake) LLM, or node D would only time a cache lookup
+        "llm_cache": False,
+        # Same for nodes B and C — repeats would only time a node cache lookup
+        "node_cache": False
+    }}
+    state = {
+        "portfolio": portfolio,
+        "time_horizon": DEFAULT_TIME_HORIZON,
+        "stress_years": stress_years,
+        "stress_windows": stress_windows,
+        "nan_policy": nan_policy
+    }
+
+    case = {
+        "tickers": num_tickers,
+        "stress_years": stress_years,
+        "stress_windows": len(stress_windows),
+        "max_window": max(stress_windows),
+        "seconds": {}
+    }
+    seconds = case["seconds"]
+    # Each node gets the state the nodes before it would have produced
+    seconds["data_preparation"], update = _best_of(
+        repeat, lambda: data_preparation_node(state, config))
+    state.update(update)
+    case["assets"] = len(state["returns"]["tickers"])
+    case["days"] = len(state["returns"]["dates"])
+
+    seconds["market_risk"], update = _best_of(repeat, lambda: market_risk_node(state))
+    state.update(update)
+    seconds["volatility"], update = _best_of(repeat, lambda: volatility_node(state))
+    state.update(update)
+
+    if report:
+        seconds["report_synthesis"], _ = _best_of(
+            repeat, lambda: report_synthesis_node(state, config))
+        if end_to_end:
+            app = risk_analyzer_graph()
+            initial_state = {key: state[key] for key in
+                             ("portfolio", "time_horizon", "stress_years",
+                              "stress_windows", "nan_policy")}
+            seconds["end_to_end"], _ = _best_of(
+                repeat, lambda: app.invoke(initial_state, config))
+
+    case["seconds"] = {name: round(value, 6) for name, value in seconds.items()}
+    return case
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> list:
+    """
+    Lists every (case, step) that got more than `threshold` slower than in `baseline`.
+
+    Returns:
+        list of dicts with the case parameters, step, old and new seconds and the ratio
+    """
+    def key(case):
+        return (case["tickers"], case["stress_years"], case["stress_windows"], case["max_window"])
+
+    previous = {key(case): case["seconds"] for case in baseline.get("results", [])}
+    regressions = []
+    for case in results["results"]:
+        old = previous.get(key(case), {})
+        for step, new_seconds in case["seconds"].items():
+            if step not in old or old[step] <= 0:
+                continue
+            ratio = new_seconds / old[step]
+            if ratio > 1 + threshold:
+                regressions.append({
+                    "tickers": case["tickers"], "stress_years": case["stress_years"],
+                    "stress_windows": case["stress_windows"], "step": step,
+                    "baseline": old[step], "current": new_seconds, "ratio": round(ratio, 3)
+                })
+    return regressions
+
+
+def run_grid(tickers: list, stress_years: list, window_sets: list, repeat: int = 1,
+             seed: int = 0, llm_latency: float = 0.0, nan_policy: str = DEFAULT_NAN_POLICY,
+             report_max_tickers: int = DEFAULT_REPORT_MAX_TICKERS,
+             end_to_end: bool = True) -> dict:
+    """ Runs run_case over every combination and collects the results with run metadata. """
+    results = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+            "seed": seed,
+            "llm_latency": llm_latency,
+            "nan_policy": nan_policy,
+            "time_horizon": DEFAULT_TIME_HORIZON
+        },
+        "results": []
+    }
+
+    for num_tickers in tickers:
+        for years in stress_years:
+            for windows in window_sets:
+                case = run_case(num_tickers, years, windows, repeat=repeat, seed=seed,
+                                llm_latency=llm_latency, nan_policy=nan_policy,
+                                report=report_max_tickers is None or num_tickers <= report_max_tickers,
+                                end_to_end=end_to_end)
+                results["results"].append(case)
+                timings = ", ".join(f"{step} {value:.3f}s" for step, value in case["seconds"].items())
+                print(f"[Bench] {num_tickers} tickers, {years}y, {len(windows)} windows: {timings}",
+                      file=sys.stderr)
+    return results
+
+
+def _int_list(text: str) -> list:
+    return [int(value) for value in text.split(",") if value]
+
+
+def main():
+    """
+    Command line entry point, e.g.
+        python benchmarks/run.py --tickers 10,100 --years 1,3 --output bench.json
+        python benchmarks/run.py --baseline bench_main.json   # exit code 1 on regressions
+    """
+    parser = argparse.ArgumentParser(description="Offline benchmark of the risk analyzer graph.")
+    parser.add_argument("--tickers", type=_int_list, default=DEFAULT_TICKERS,
+                        help="comma-separated portfolio sizes")
+    parser.add_argument("--years", type=_int_list, default=DEFAULT_STRESS_YEARS,
+                        help="comma-separated stress-test look-backs in years")
+    parser.add_argument("--windows", action="append", type=_int_list,
+                        help="comma-separated stress windows; repeat for several sets")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement (best is kept)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-latency", type=float, default=0.0,
+                        help="seconds the fake LLM takes to answer")
+    parser.add_argument("--nan-policy", default=DEFAULT_NAN_POLICY,
+                        help="missing-price policy: drop, ffill or mask")
+    parser.add_argument("--report-max-tickers", type=int, default=DEFAULT_REPORT_MAX_TICKERS,
+                        help="skip node D and end-to-end above this many tickers (default: never)")
+    parser.add_argument("--nodes-only", action="store_true", help="skip the end-to-end graph run")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier results to check for regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="slowdown ratio above 1 counted as a regression")
+    parser.add_argument("--verbose", action="store_true", help="show the nodes' log output")
+    args = parser.parse_args()
+    # Node logging would drown the results and cost time of its own
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.ERROR, format="%(message)s")
+
+    results = run_grid(args.tickers, args.years, args.windows or DEFAULT_WINDOW_SETS,
+                       repeat=args.repeat, seed=args.seed, llm_latency=args.llm_latency,
+                       nan_policy=args.nan_policy,
+                       report_max_tickers=args.report_max_tickers,
+                       end_to_end=not args.nodes_only)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        results["regressions"] = regressions
+        for r in regressions:
+            print(f"[Bench] REGRESSION {r['step']} ({r['tickers']} tickers, {r['stress_years']}y): "
+                  f"{r['baseline']:.3f}s → {r['current']:.3f}s (×{r['ratio']})", file=sys.stderr)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[Bench] {len(results['results'])} cases written to {args.output}", file=sys.stderr)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
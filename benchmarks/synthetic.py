@@ -0,0 +1,111 @@
+import random
+import threading
+import time
+import zlib
+import numpy as np
+
+# Every ticker has one fixed daily series over the business days from here on;
+# a request is a slice of it, so overlapping requests always agree
+CALENDAR_START = np.datetime64("2000-01-03")
+
+
+class SyntheticPriceProvider:
+    """
+    Seeded stand-in for Yahoo Finance — correlated geometric Brownian motion prices.
+
+    Every ticker follows a one-factor model: a shared market return scaled by the
+    ticker's beta plus its own noise, so the correlation matrix has real structure.
+    Some tickers come back with gaps (missing bars) and some not at all, like the
+    real feed, and a fraction of calls can fail outright to exercise retries.
+    Each ticker has one fixed series over the business days since
+    CALENDAR_START and a request returns its [start, end) slice, so the same
+    seed gives the same price for a ticker on a date whatever window is asked
+    for — overlapping and delta fetches line up like the real feed's.
+
+    Usable anywhere a price provider is accepted, e.g.
+    config={"configurable": {"price_provider": SyntheticPriceProvider(seed=1)}}
+    """
+
+    def __init__(self, seed: int = 0, annual_vol=(0.15, 0.60), beta=(0.3, 1.5),
+                 gap_fraction: float = 0.02, missing_fraction: float = 0.01,
+                 latency: float = 0.0, error_rate: float = 0.0):
+        """
+        Args:
+            seed: base seed for all generated prices
+            annual_vol: range of annualized volatilities tickers are drawn from
+            beta: range of market betas tickers are drawn from
+            gap_fraction: fraction of bars randomly dropped from a ticker with gaps
+                (one ticker in five has gaps)
+            missing_fraction: fraction of tickers that return no data at all
+            latency: seconds to sleep per call, to mimic network time
+            error_rate: fraction of calls that raise ConnectionError after the
+                latency, like a throttled or dropped request
+        """
+        self.seed = seed
+        self.annual_vol = annual_vol
+        self.beta = beta
+        self.gap_fraction = gap_fraction
+        self.missing_fraction = missing_fraction
+        self.latency = latency
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+        # Calls can come from several fetcher threads at once
+        self._lock = threading.Lock()
+        self._errors_rng = random.Random(seed)
+
+    def _ticker_rng(self, ticker: str, salt: int = 0):
+        # Each ticker's stream depends only on the seed and its name,
+        # not on which other tickers are in the same request
+        return np.random.default_rng([self.seed, zlib.crc32(ticker.encode()), salt])
+
+    def __call__(self, tickers: list, start, end) -> dict:
+        with self._lock:
+            self.calls += 1
+            failed = self.error_rate and self._errors_rng.random() < self.error_rate
+            self.errors += bool(failed)
+        if self.latency:
+            time.sleep(self.latency)
+        if failed:
+            raise ConnectionError(f"synthetic error for a request of {len(tickers)} tickers")
+
+        # Business days from the fixed calendar start up to `end`; the request
+        # is the tail of them from `start`
+        calendar = np.arange(CALENDAR_START, max(np.datetime64(end.date()), CALENDAR_START))
+        calendar = calendar[np.is_busday(calendar)]
+        first = np.searchsorted(calendar, np.datetime64(start.date()))
+        if first == len(calendar):
+            return {}
+        dates = calendar[first:]
+
+        # Shared market factor — drawn in calendar order, so the returns up
+        # to a date never depend on how far the request reaches
+        market = np.random.default_rng([self.seed, 0]).normal(0.0003, 0.01, len(calendar))
+
+        prices = {}
+        for ticker in tickers:
+            rng = self._ticker_rng(ticker)
+            if rng.random() < self.missing_fraction:
+                continue                       # ticker "not found"
+
+            daily_vol = rng.uniform(*self.annual_vol) / np.sqrt(252)
+            beta = rng.uniform(*self.beta)
+            level = rng.uniform(10, 500)
+            has_gaps = rng.random() < 0.2
+            # Idiosyncratic noise sized so total volatility matches daily_vol
+            idio_vol = np.sqrt(max(daily_vol ** 2 - (beta * 0.01) ** 2, (0.2 * daily_vol) ** 2))
+            noise = self._ticker_rng(ticker, 1).normal(0.0, idio_vol, len(calendar))
+            log_returns = beta * market + noise - 0.5 * daily_vol ** 2
+            closes = (level * np.exp(np.cumsum(log_returns)))[first:]
+
+            keep = np.ones(len(dates), dtype=bool)
+            if has_gaps:
+                keep = self._ticker_rng(ticker, 2).random(len(calendar))[first:] >= self.gap_fraction
+            prices[ticker] = (dates[keep], closes[keep])
+
+        return prices
+
+
+def synthetic_tickers(count: int) -> list:
+    """ Ticker names for a synthetic universe: SYN0000, SYN0001, ... """
+    return [f"SYN{i:04d}" for i in range(count)]
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import numpy as np
+from dotenv import load_dotenv
+
+# Load .env before anything reads its settings at import time
+load_dotenv()
+
+from tools.price_simulator import fetch_market_data, STRESS_TEST_YEARS
+from tools.returns import compute_returns, portfolio_weights, DEFAULT_NAN_POLICY
+from tools.stress_test import DEFAULT_STRESS_WINDOWS
+from tools.online_stats import init_stats, update_stats, stats_results, pack_stats, unpack_stats
+from tools.serialization import ArraySerializer
+
+logger = logging.getLogger(__name__)
+
+# Where each portfolio's statistics are kept between daily runs
+STATS_DIR = os.getenv("INCREMENTAL_DIR", ".incremental")
+# Extra calendar days fetched before the last applied day, so the first new
+# return always has the previous close to divide by (covers long weekends)
+OVERLAP_DAYS = 10
+
+_serializer = ArraySerializer()
+
+
+def _stats_path(name: str, stats_dir: str = None) -> str:
+    safe = re.sub(r"[^A-Za-z0-9_.-]", "_", str(name))
+    return os.path.join(stats_dir or STATS_DIR, f"{safe}.ndpack")
+
+
+def _fingerprint(portfolio: dict, time_horizon: int, stress_days: int,
+                 stress_windows: list, nan_policy: str) -> str:
+    """ Changes whenever the saved statistics no longer describe this portfolio. """
+    settings = json.dumps([sorted(portfolio.items()), time_horizon, stress_days,
+                           list(stress_windows), nan_policy])
+    return hashlib.sha256(settings.encode()).hexdigest()
+
+
+def load_stats(name: str, stats_dir: str = None):
+    """ The saved statistics of a portfolio, or None if there are none. """
+    path = _stats_path(name, stats_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return unpack_stats(_serializer.loads_typed(("ndpack", f.read())))
+
+
+def save_stats(name: str, stats: dict, stats_dir: str = None) -> None:
+    """ Writes the statistics atomically, so a crash never leaves half a file. """
+    path = _stats_path(name, stats_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _, payload = _serializer.dumps_typed(pack_stats(stats))
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(payload)
+    os.replace(f"{path}.tmp", path)
+
+
+def update_portfolio(name: str, portfolio: dict, time_horizon: int, stress_years: int = None,
+                     stress_windows: list = None, nan_policy: str = None, download=None,
+                     use_store: bool = None, stats_dir: str = None) -> dict:
+    """
+    Daily incremental run for one portfolio.
+
+    The first run (or any run after the portfolio or its settings changed)
+    builds the statistics from the full history. Later runs only fetch the
+    days since the last run and apply their returns — O(assets²) per new day
+    instead of recomputing every window from scratch.
+
+    Args:
+        name: portfolio name — the statistics are saved under it
+        portfolio: dict of ticker -> weight
+        time_horizon: calendar days for VaR / volatility / Sharpe / correlation
+        stress_years: stress-test look-back (default STRESS_TEST_YEARS)
+        stress_windows: stress-test windows in trading days (default DEFAULT_STRESS_WINDOWS)
+        nan_policy: "drop" or "ffill" — "mask" needs a full recompute
+        download: optional price provider, as in tools.price_simulator.fetch_market_data
+        use_store: read through the local price store (default: only for yfinance)
+        stats_dir: where statistics are saved (default STATS_DIR)
+    Returns:
+        dict with value_at_risk, volatility_scores, sharpe_ratio,
+        correlation_matrix and stress_test — the same fields nodes b and c
+        write — plus "as_of" (last applied date) and "mode" ("full" or "incremental")
+    """
+    stress_years = stress_years or STRESS_TEST_YEARS
+    stress_windows = stress_windows or DEFAULT_STRESS_WINDOWS
+    nan_policy = nan_policy or DEFAULT_NAN_POLICY
+    if nan_policy == "mask":
+        raise ValueError("Incremental mode needs complete returns — use nan_policy 'drop' or 'ffill'.")
+    use_store = download is None if use_store is None else use_store
+    stress_days = 365 * stress_years
+    fingerprint = _fingerprint(portfolio, time_horizon, stress_days, stress_windows, nan_policy)
+
+    stats = load_stats(name, stats_dir)
+    mode = "incremental"
+    if stats is not None and stats.get("fingerprint") == fingerprint:
+        # Only the days since the last applied one, plus a little overlap
+        last_date = stats["var_dates"][-1]
+        days = int((np.datetime64("today") - last_date).astype(int)) + OVERLAP_DAYS
+        market_data = fetch_market_data(list(portfolio), days, download=download, use_store=use_store)
+        returns = compute_returns(market_data, nan_policy)
+
+        if returns["tickers"] != stats["tickers"]:
+            # A ticker appeared or disappeared — the co-moments no longer line up
+            logger.info(f"[Daily] {name}: tickers changed, rebuilding from full history.")
+            stats = None
+        else:
+            new = returns["dates"] > last_date
+            update_stats(stats, returns["dates"][new], returns["returns"][new])
+            logger.info(f"[Daily] {name}: applied {int(new.sum())} new day(s).")
+
+    if stats is None or stats.get("fingerprint") != fingerprint:
+        mode = "full"
+        market_data = fetch_market_data(list(portfolio), max(time_horizon, stress_days),
+                                        download=download, use_store=use_store)
+        returns = compute_returns(market_data, nan_policy)
+        stats = init_stats(returns["dates"], returns["returns"], returns["tickers"],
+                           portfolio_weights(returns["tickers"], portfolio),
+                           time_horizon, stress_days, stress_windows)
+        stats["fingerprint"] = fingerprint
+        logger.info(f"[Daily] {name}: statistics built from {len(returns['dates'])} days.")
+
+    save_stats(name, stats, stats_dir)
+
+    results = stats_results(stats)
+    results["stress_test"]["years"] = stress_years
+    results["as_of"] = str(stats["var_dates"][-1]) if len(stats["var_dates"]) else None
+    results["mode"] = mode
+    return results
+
+
+def main():
+    """
+    Command line entry point for the daily job.
+    Reads a JSON file of {name: {ticker: weight}} and prints each portfolio's metrics.
+    """
+    parser = argparse.ArgumentParser(description="Incremental daily update of saved portfolios.")
+    parser.add_argument("portfolios", help='JSON file: {"name": {"TICKER": weight, ...}, ...}')
+    parser.add_argument("--horizon", type=int, default=90, help="time horizon in calendar days")
+    parser.add_argument("--nan-policy", default=DEFAULT_NAN_POLICY, help="drop or ffill")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), format="%(message)s")
+
+    with open(args.portfolios) as f:
+        portfolios = json.load(f)
+
+    for name, portfolio in portfolios.items():
+        results = update_portfolio(name, portfolio, args.horizon, nan_policy=args.nan_policy)
+        drawdown = results["stress_test"]["max_drawdown"]["depth"]
+        print(f"{name} ({results['mode']}, as of {results['as_of']}): "
+              f"VaR {results['value_at_risk'] * 100:.2f}%, Sharpe {results['sharpe_ratio']}, "
+              f"max drawdown {drawdown * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
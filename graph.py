@@ -1,12 +1,34 @@
 from langgraph.graph import StateGraph, START, END
 from state import State
-from nodes.data_preparation import data_preparation_node
-from nodes.market_risk import market_risk_node
-from nodes.volatility import volatility_node
-from nodes.report_synthesis import report_synthesis_node
+from nodes.data_preparation import data_preparation_node, adata_preparation_node, data_preparation_fingerprint
+from nodes.market_risk import market_risk_node, amarket_risk_node, market_risk_fingerprint
+from nodes.volatility import volatility_node, avolatility_node, volatility_fingerprint
+from nodes.report_synthesis import report_synthesis_node, areport_synthesis_node
+from nodes.quant_report import quant_report_node, aquant_report_node
+from tools.instrumentation import instrument
+from tools.node_cache import memoize
 
-def risk_analyzer_graph():
-    """  Builds and compiles the portfolio risk analyzer graph."""
+
+def route_report(state: State) -> str:
+    """ After nodes b and c: the LLM report, or the template one in quant-only mode. """
+    return "quant report" if state.get("quant_only") else "report synthesis"
+
+
+def risk_analyzer_graph(checkpointer=None):
+    """  Builds and compiles the portfolio risk analyzer graph.
+    Every node has a sync and an async implementation: app.invoke() runs the
+    sync ones, app.ainvoke() / app.astream() the async ones.
+    Every node is instrumented: the final state's "trace" holds one span per
+    node run with its timings (see tools/instrumentation.py).
+    Nodes a, b and c are memoized on a fingerprint of their inputs (see
+    tools/node_cache.py) — node d has its own report cache.
+    With quant_only=True in the initial state, the run skips the LLM: a
+    conditional edge routes to the template report (tools/report_template.py).
+
+    Args:
+        checkpointer: optional LangGraph checkpointer. State values hold NumPy
+            arrays, so give it serde=ArraySerializer() (tools/serialization.py),
+            or use SqliteSaver (tools/checkpoint.py) to resume failed runs."""
 
 
     # Initialize the graph with our shared state 
@@ -14,20 +36,28 @@ def risk_analyzer_graph():
     graph = StateGraph(State)
 
     # Add nodes to the graph
-    graph.add_node("data preparation", data_preparation_node)
-    graph.add_node("market risk", market_risk_node)
-    graph.add_node("volatility", volatility_node)
-    graph.add_node("report synthesis", report_synthesis_node)
+    # Memoized nodes: an unchanged input fingerprint reuses the stored result
+    graph.add_node("data preparation", instrument("data preparation", *memoize(
+        "data preparation", data_preparation_fingerprint, data_preparation_node, adata_preparation_node)))
+    graph.add_node("market risk", instrument("market risk", *memoize(
+        "market risk", market_risk_fingerprint, market_risk_node, amarket_risk_node)))
+    graph.add_node("volatility", instrument("volatility", *memoize(
+        "volatility", volatility_fingerprint, volatility_node, avolatility_node)))
+    graph.add_node("report synthesis", instrument("report synthesis", report_synthesis_node, areport_synthesis_node))
+    graph.add_node("quant report", instrument("quant report", quant_report_node, aquant_report_node))
 
     # Define the edges
     graph.add_edge(START, "data preparation")  # Start -> Node A
     graph.add_edge("data preparation", "market risk")  # Node A -> Node B
     graph.add_edge("data preparation", "volatility")  # Node A -> Node C
-    graph.add_edge("market risk", "report synthesis")  # Node B -> Node D
-    graph.add_edge("volatility", "report synthesis")  # Node C -> Node D
+    # Node B and C -> Node D, LLM or template — both branches pick the same
+    # node, which runs once both have finished
+    graph.add_conditional_edges("market risk", route_report, ["report synthesis", "quant report"])
+    graph.add_conditional_edges("volatility", route_report, ["report synthesis", "quant report"])
 
     graph.add_edge("report synthesis", END)  # Node D -> End
+    graph.add_edge("quant report", END)  # Node D (quant-only) -> End
 
     # Compile the graph 
-    app = graph.compile()
-    return app
\ No newline at end of file
+    app = graph.compile(checkpointer=checkpointer)
+    return app
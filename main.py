@@ -1,12 +1,96 @@
-from graph import risk_analyzer_graph
+import argparse
+import logging
+import os
+import time
 from dotenv import load_dotenv
 
-load_dotenv()  
+# Load .env before anything reads its settings at import time
+load_dotenv()
+
+from graph import risk_analyzer_graph
+from tools.checkpoint import SqliteSaver
+from tools.instrumentation import format_trace
+from tools.stress_test import format_stress_test
+
+
+def stream_analysis(app, initial_state: dict, config: dict = None) -> dict:
+    """
+    Runs the graph in streaming mode.
+    Node B and C results are printed the moment each node finishes, then the
+    report is printed token by token as the LLM writes it.
+
+    Args:
+        app: the compiled graph
+        initial_state: the inputs, or None to resume a checkpointed thread
+        config: optional run config (thread_id for checkpointed runs)
+    Returns:
+        the final state, assembled from the streamed updates
+    """
+    started = time.perf_counter()
+    first_output = None
+    rating_at = None
+    final_state = dict(initial_state or {})
+
+    # "updates" yields each node's output as soon as it finishes,
+    # "custom" yields the report tokens node D writes while the LLM streams
+    for mode, chunk in app.stream(initial_state, config, stream_mode=["updates", "custom"]):
+        if mode == "updates":
+            for node, update in chunk.items():
+                update = dict(update or {})
+                # trace is a reducer field: every node adds its own spans
+                final_state["trace"] = final_state.get("trace", []) + update.pop("trace", [])
+                final_state.update(update)
+                if node == "market risk":
+                    first_output = first_output or time.perf_counter() - started
+                    print(f"\n>>> Value at Risk (95%): {update['value_at_risk'] * 100:.2f}%")
+                    print(format_stress_test(update["stress_test"]))
+                elif node == "volatility":
+                    first_output = first_output or time.perf_counter() - started
+                    print(f"\n>>> Sharpe Ratio: {update['sharpe_ratio']}")
+                    print(f">>> Volatility: {update['volatility_scores']}")
+                elif node == "report synthesis":
+                    print()
+                elif node == "quant report":
+                    # Template report — nothing streams, it arrives in one piece
+                    print("\n" + update["final_report"])
+                    rating_at = time.perf_counter() - started
+        elif "report_token" in chunk:
+            if "report_started" not in final_state:
+                final_state["report_started"] = time.perf_counter() - started
+                print("\n" + "=" * 60)
+                print("   FINAL RISK REPORT (streaming)")
+                print("=" * 60)
+            print(chunk["report_token"], end="", flush=True)
+        elif "risk_rating" in chunk:
+            rating_at = time.perf_counter() - started
+
+    print("\n" + "-" * 60)
+    if first_output is not None:
+        print(f"First quant result after {first_output:.2f}s")
+    if "report_started" in final_state:
+        print(f"First report token after {final_state.pop('report_started'):.2f}s")
+    if rating_at is not None:
+        print(f"Risk rating ({final_state.get('risk_rating')}) known after {rating_at:.2f}s")
+    print(f"Total {time.perf_counter() - started:.2f}s")
+    return final_state
 
 def main():
     """
     Entry point — defines the portfolio input and runs the risk analyzer graph.
+    Pass --stream to see results as each node finishes and the report as it is written.
     """
+    parser = argparse.ArgumentParser(description="Portfolio risk analyzer")
+    parser.add_argument("--stream", action="store_true",
+                        help="print quant results as soon as they are ready and stream the report")
+    parser.add_argument("--quant-only", action="store_true",
+                        help="skip the LLM and build the report and rating from the metrics")
+    parser.add_argument("--thread-id",
+                        help="checkpoint the run under this id — rerunning with the same id "
+                             "resumes a run that failed instead of starting over")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "INFO"),
+                        help="DEBUG, INFO, WARNING or ERROR")
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
 
     # Define your portfolio 
     # Keys are ticker symbols (must be valid Yahoo Finance tickers)
@@ -28,24 +112,42 @@ def main():
     time_horizon = 90   # 3 months of data
 
     # Build the compiled graph
-    app = risk_analyzer_graph()
+    # With a thread id every completed node is checkpointed in CHECKPOINT_PATH
+    config = {"configurable": {"thread_id": args.thread_id}} if args.thread_id else None
+    app = risk_analyzer_graph(checkpointer=SqliteSaver() if args.thread_id else None)
 
     # Define the initial state
     # This is the "order ticket" we hand to the graph
     # Only the input fields are needed — everything else gets filled by the nodes
     initial_state = {
         "portfolio": portfolio,
-        "time_horizon": time_horizon
+        "time_horizon": time_horizon,
+        # Quant-only: a template report in milliseconds instead of the LLM call
+        "quant_only": args.quant_only
     }
 
+    # A checkpointed run that stopped part-way (e.g. the LLM call failed)
+    # continues from the last completed node — None means "resume"
+    pending = app.get_state(config).next if config is not None else ()
+    if pending:
+        print(f"Resuming thread '{args.thread_id}' at: {', '.join(pending)}")
+        initial_state = None
+
     print("=" * 60)
     print("   PORTFOLIO RISK ANALYZER — Starting...")
     print("=" * 60)
 
+    if args.stream:
+        # .stream() hands results over while the graph is still running
+        final_state = stream_analysis(app, initial_state, config)
+        print("\nWhere the time went:")
+        print(format_trace(final_state.get("trace")))
+        return
+
     # Run the graph 
     # .invoke() runs the graph synchronously and returns the final state
     # The final state contains everything — inputs + all computed fields
-    final_state = app.invoke(initial_state)
+    final_state = app.invoke(initial_state, config)
 
     # Display the results
     print("\n" + "=" * 60)
@@ -53,6 +155,11 @@ def main():
     print("=" * 60)
     print(final_state["final_report"])
 
+    # Per-node timings, input sizes and external calls (yfinance, LLM)
+    print("\n" + "-" * 60)
+    print("Where the time went:")
+    print(format_trace(final_state["trace"]))
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
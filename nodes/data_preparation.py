@@ -1,17 +1,134 @@
+import asyncio
+import logging
+import time
+import numpy as np
+from langchain_core.runnables import RunnableConfig
 from state import State
-from tools.price_simulator import fetch_historical_prices
+from tools.price_simulator import fetch_market_data, window_start, take_rows, STRESS_TEST_YEARS
+from tools.covariance import estimate_covariance
+from tools.returns import compute_returns, DEFAULT_NAN_POLICY
+from tools.node_cache import fingerprint
+from tools.instrumentation import record_external
 
-def data_preparation_node(state: State) -> dict:
+logger = logging.getLogger(__name__)
+
+def data_preparation_node(state: State, config: RunnableConfig = None) -> dict:
     """ Node A fetches historical price data for all assets in the portfolio. 
-    Runs first before the parallel nodes"""
+    Runs first before the parallel nodes.
+    Downloads the longest window any node needs once and builds one returns
+    matrix from it. The VaR and stress windows are handed out as row offsets
+    into that matrix, so the state holds every array exactly once.
+    Also estimates the covariance of the VaR window (tools/covariance.py).
+
+    A stand-in price provider can be passed as config["configurable"]["price_provider"]
+    (same signature as tools.price_simulator.download_closes).
+    A long-lived process can pass a WarmCache (tools/warm_cache.py) as
+    config["configurable"]["market_data_cache"]: the output only depends on
+    the tickers, not the weights, so runs over the same tickers and horizon
+    share one fetch and one returns matrix — concurrent ones included."""
 
     # Reads the users input from the shared state
     portfolio = state["portfolio"]
     time_horizon = state["time_horizon"]
-    print(f"[Node A] Fetching historical prices for: {list(portfolio.keys())})")
+    stress_years = state.get("stress_years") or STRESS_TEST_YEARS
+    nan_policy = state.get("nan_policy") or DEFAULT_NAN_POLICY
+
+    # Stand-in providers bypass the price store unless asked otherwise
+    configurable = (config or {}).get("configurable", {})
+    price_provider = configurable.get("price_provider")
+    use_store = configurable.get("use_price_store", price_provider is None)
+
+    def prepare():
+        return prepare_market_data(list(portfolio.keys()), time_horizon, stress_years, nan_policy,
+                                   price_provider, use_store)
+
+    cache = configurable.get("market_data_cache")
+    if cache is None:
+        return prepare()
+
+    # Same tickers (in the same column order), settings, provider and day
+    key = (tuple(portfolio), time_horizon, stress_years, nan_policy,
+           id(price_provider), use_store, str(np.datetime64("today")))
+    started = time.perf_counter()
+    update, how = cache.get_or_compute(key, lambda: _freeze(prepare()))
+    record_external("market_data_cache", time.perf_counter() - started,
+                    hit=how != "miss", coalesced=how == "coalesced")
+    if how != "miss":
+        logger.info(f"[Node A] Market data for {len(portfolio)} tickers served from memory ({how}).")
+    return update
+
+
+def prepare_market_data(tickers: list, time_horizon: int, stress_years: int, nan_policy: str,
+                        price_provider=None, use_store: bool = True) -> dict:
+    """ Node A's work: one fetch, one returns matrix, the window offsets and
+    the covariance of the VaR window.
+
+    Returns:
+        dict with "market_data", "returns", "windows" and "covariance"
+    """
+    logger.info(f"[Node A] Fetching historical prices for: {tickers})")
+
+    # Node B needs the stress window, Node B and C need the VaR window
+    # One fetch covering the longest of them serves everybody
+    stress_days = 365 * stress_years
+    market_data = fetch_market_data(tickers, max(time_horizon, stress_days),
+                                    download=price_provider, use_store=use_store)
+
+    logger.info(f"[Node A] Successfully fetched {len(market_data['dates'])} trading days "
+                f"for {len(market_data['tickers'])} assets.")
+
+    # Build the date-aligned daily returns matrix once for both downstream nodes
+    returns = compute_returns(market_data, nan_policy)
+
+    # Where each window starts in the returns matrix — nodes b and c take
+    # their rows as views with take_rows(), nothing is copied
+    windows = {
+        "var": window_start(returns["dates"], time_horizon),
+        "stress": window_start(returns["dates"], stress_days)
+    }
+    logger.info(f"[Node A] Returns matrix: {returns['returns'].shape[0]} days × "
+                f"{returns['returns'].shape[1]} assets (nan_policy='{nan_policy}'), "
+                f"{len(returns['dates']) - windows['var']} in the {time_horizon}-day window.")
+
+    # Shrunk covariance of the VaR window — estimated once here, so nodes b and c
+    # get parametric VaR and per-asset risk contributions in O(assets²) from it
+    covariance = estimate_covariance(take_rows(returns, windows["var"]))
+    logger.info(f"[Node A] Ledoit-Wolf covariance over {covariance['days']} days "
+                f"(shrinkage {covariance['shrinkage']:.2f}).")
+
+    return {
+        "market_data": market_data,
+        "returns": returns,
+        "windows": windows,
+        "covariance": covariance
+    }
+
+
+def _freeze(update: dict) -> dict:
+    """ Marks every array in node A's output read-only — a cached output is
+    shared by every run over the same tickers, so nobody may write to it. """
+    for value in update.values():
+        if isinstance(value, dict):
+            _freeze(value)
+        elif isinstance(value, np.ndarray):
+            value.flags.writeable = False
+    return update
+
+
+async def adata_preparation_node(state: State, config: RunnableConfig = None) -> dict:
+    """ Async variant of Node A — the blocking download runs in a worker thread
+    so the event loop keeps serving other portfolio runs meanwhile."""
+    return await asyncio.to_thread(data_preparation_node, state, config)
 
-    # Call our yfinance tool to fetch closing prices for each asset
-    price_history = fetch_historical_prices(portfolio, time_horizon)
-    print(f"[Node A] Successfully fetched {time_horizon} days of data for {len(price_history)} assets.")
 
-    return {"price_history": price_history}
+def data_preparation_fingerprint(state: State, config: RunnableConfig = None):
+    """ Node A's cache key: the tickers (in column order, not their weights —
+    reweighted portfolios share one entry) and settings it reads, plus today's
+    date — the data is as of the last close before it. Results from a
+    stand-in price provider are never cached (it can't be fingerprinted). """
+    if ((config or {}).get("configurable") or {}).get("price_provider") is not None:
+        return None
+    return fingerprint("data preparation", list(state["portfolio"]), state["time_horizon"],
+                       state.get("stress_years") or STRESS_TEST_YEARS,
+                       state.get("nan_policy") or DEFAULT_NAN_POLICY,
+                       str(np.datetime64("today")))
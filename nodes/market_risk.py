@@ -1,161 +1,154 @@
-import numpy as np
+import asyncio
+import logging
 from state import State
-from tools.price_simulator import fetch_historical_prices, fetch_stress_test_history
+from tools.returns import portfolio_weights, portfolio_returns
+from tools.risk_metrics import historical_var
+from tools.monte_carlo import simulate_var, DEFAULT_NUM_PATHS
+from tools.stress_test import run_stress_test, DEFAULT_STRESS_WINDOWS
+from tools.price_simulator import take_rows, STRESS_TEST_YEARS
+from tools.backtest import backtest_var, summarize_backtest, DEFAULT_CONFIDENCES
+from tools.covariance import risk_decomposition
+from tools.scenarios import run_scenarios, scenario_table
+from tools.node_cache import fingerprint
+
+logger = logging.getLogger(__name__)
 
 def market_risk_node(state: State) -> dict:
     """
     Node b — Calculates Value at Risk (VaR) and runs a
     historical simulation stress test over the last 3 years.
+    The VaR model is backtested over the same 3 years (tools/backtest.py).
+    User-defined scenarios in the state (shocks, factor moves, vol
+    multipliers, correlation breakdowns) get a P&L table (tools/scenarios.py).
+    VaR is historical by default; set var_method="monte_carlo" in the
+    state to simulate it instead (see tools/monte_carlo.py).
     Runs in parallel with node c (volatility).
     """
 
     portfolio = state["portfolio"]
-    price_history = state["price_history"]
+    returns = state["returns"]
+    returns_history = take_rows(returns, state["windows"]["var"])
 
-    print("[Node B] Starting market risk calculations...")
+    logger.info("[Node B] Starting market risk calculations...")
 
     # PART 1: Value at Risk (VaR)
-    # Uses the short-term price history from node a (e.g. 90 days)
-
-    # Calculate daily returns for each asset
-    daily_returns = {}
-    for asset, prices in price_history.items():
-        returns = [
-            (prices[i] - prices[i - 1]) / prices[i - 1]
-            for i in range(1, len(prices))
-        ]
-        daily_returns[asset] = returns
-
-    # Only use assets successfully fetched by yfinance
-    available_assets = {asset: weight for asset, weight in portfolio.items()
-                        if asset in daily_returns}
-
-    # Calculate weighted portfolio daily returns
-    num_days = min(len(returns) for returns in daily_returns.values())
-    portfolio_returns = []
-
-    for i in range(num_days):
-        daily_portfolio_return = sum(
-            daily_returns[asset][i] * available_assets[asset]
-            for asset in available_assets
-        )
-        portfolio_returns.append(daily_portfolio_return)
+    # Uses the short-term returns window from node a (e.g. 90 days)
 
-    # VaR at 95% confidence — worst loss on 95% of days
-    var_95 = np.percentile(portfolio_returns, 5)
-    value_at_risk = float(round(abs(var_95), 4))
+    # Weighted portfolio daily returns — one matrix-vector product over
+    # the date-aligned (days × assets) returns matrix
+    weights = portfolio_weights(returns_history["tickers"], portfolio)
+    daily_portfolio_returns = portfolio_returns(returns_history["returns"], weights)
 
-    print(f"[Node B] Value at Risk (95%): {value_at_risk * 100:.2f}%")
+    # VaR at 95% confidence — worst loss on 95% of days
+    value_at_risk = float(round(float(historical_var(daily_portfolio_returns, 0.95)), 4))
+
+    # Optional Monte Carlo mode — simulates correlated returns from the estimated
+    # covariance for VaR / CVaR at several confidence levels and horizons
+    monte_carlo_var = None
+    if (state.get("var_method") or "historical") == "monte_carlo":
+        options = state.get("monte_carlo_options") or {}
+        logger.info(f"[Node B] Running Monte Carlo VaR ({options.get('num_paths', DEFAULT_NUM_PATHS):,} paths)...")
+        monte_carlo_var = simulate_var(returns_history["returns"], weights, **options)
+        for r in monte_carlo_var["results"]:
+            logger.debug(f"[Node B] Monte Carlo {r['horizon']}-day {r['confidence'] * 100:.0f}%: "
+                         f"VaR {r['var'] * 100:.2f}%, CVaR {r['cvar'] * 100:.2f}%")
+            # The headline figure stays the 1-day 95% VaR, now from the simulation
+            if r["horizon"] == 1 and r["confidence"] == 0.95:
+                value_at_risk = float(round(r["var"], 4))
+
+    logger.info(f"[Node B] Value at Risk (95%): {value_at_risk * 100:.2f}%")
+
+    # Parametric VaR from the covariance node A estimated — O(assets²), no pass
+    # over the days — split into each position's marginal and component VaR
+    covariance = state["covariance"]
+    decomposition = risk_decomposition(covariance, portfolio_weights(covariance["tickers"], portfolio))
+    parametric_var = {
+        "confidence": decomposition["confidence"],
+        "var": float(round(float(decomposition["var"]), 4)),
+        "shrinkage": covariance["shrinkage"],
+        "tickers": covariance["tickers"],
+        "marginal_var": decomposition["marginal_var"],
+        "component_var": decomposition["component_var"],
+        "percent_of_var": decomposition["percent_of_var"]
+    }
+    logger.info(f"[Node B] Parametric VaR (95%): {parametric_var['var'] * 100:.2f}%")
 
     # PART 2: Historical Simulation Stress Test
-    # Fetches 3 years of real data and finds the
-    # worst 30, 60, and 90 day rolling windows
-
-    print("[Node B] Fetching 3 years of data for stress test...")
-
-    # Fetch 3 years of real historical prices
-    stress_data = fetch_stress_test_history(portfolio, years=3)
-
-    # Extract dates and remove from asset data
-    dates = stress_data.pop("_dates")
-
-    # Calculate daily returns for the full 3-year period
-    stress_returns = {}
-    for asset, prices in stress_data.items():
-        returns = [
-            (prices[i] - prices[i - 1]) / prices[i - 1]
-            for i in range(1, len(prices))
-        ]
-        stress_returns[asset] = returns
-
-    # Only use assets we have stress data for
-    available_stress_assets = {asset: weight for asset, weight in portfolio.items()
-                                if asset in stress_returns}
-
-    # Calculate weighted portfolio returns for the full 3-year period
-    num_stress_days = len(list(stress_returns.values())[0])
-    full_portfolio_returns = []
-
-    for i in range(num_stress_days):
-        daily_return = sum(
-            stress_returns[asset][i] * available_stress_assets[asset]
-            for asset in available_stress_assets
-        )
-        full_portfolio_returns.append(daily_return)
-
-    # Find worst rolling windows
-    # A rolling window cumulates returns over N consecutive days
-    # e.g. worst 30-day window = the worst month in 3 years
-
-    def worst_rolling_window(returns, window_days):
-        """
-        Finds the worst consecutive N-day period in the return series.
-        Returns the total loss and the start date of that period.
-        """
-        worst_loss = 0
-        worst_start_idx = 0
-
-        for i in range(len(returns) - window_days):
-            # Cumulate returns over the window
-            # (1 + r1) * (1 + r2) * ... - 1 gives the total return
-            window_returns = returns[i:i + window_days]
-            cumulative_return = 1.0
-            for r in window_returns:
-                cumulative_return *= (1 + r)
-            total_return = cumulative_return - 1
-
-            # Track the worst (most negative) window
-            if total_return < worst_loss:
-                worst_loss = total_return
-                worst_start_idx = i
-
-        return float(round(worst_loss, 4)), worst_start_idx
-
-    # Run the rolling window analysis for 3 timeframes
-    windows = [30, 60, 90]
-    stress_results = []
-
-    for window in windows:
-        loss, start_idx = worst_rolling_window(full_portfolio_returns, window)
-
-        # Get the actual calendar date of the worst period
-        # Offset by 1 since returns start from day 1 (no day 0 return)
-        start_date = dates[start_idx + 1] if start_idx + 1 < len(dates) else "N/A"
-        end_idx = min(start_idx + window, len(dates) - 1)
-        end_date = dates[end_idx]
-
-        stress_results.append({
-            "window": window,
-            "loss": loss,
-            "start_date": start_date,
-            "end_date": end_date
-        })
-
-        print(f"[Node B] Worst {window}-day period ({start_date} to {end_date}): "
-              f"{loss * 100:.1f}%")
-
-    # Format the stress test result as a structured string for node d
-    stress_lines = ["Historical Stress Test — Worst Periods (Last 3 Years):"]
-    for r in stress_results:
-        stress_lines.append(
-            f"  • Worst {r['window']}-day period "
-            f"({r['start_date']} → {r['end_date']}): "
-            f"{abs(r['loss']) * 100:.1f}% loss"
-        )
+    # Uses the 3 years of real data node A already prepared and finds the
+    # worst rolling windows (30, 60 and 90 days unless configured otherwise)
+    # plus the maximum drawdown and how long it took to recover
 
-    # Identify the single most vulnerable period
-    worst = max(stress_results, key=lambda x: abs(x["loss"]))
-    stress_lines.append(
-        f"\n  Most vulnerable period: "
-        f"{worst['start_date']} → {worst['end_date']} "
-        f"({worst['window']}-day window, {abs(worst['loss']) * 100:.1f}% loss)"
-    )
+    stress_returns = take_rows(returns, state["windows"]["stress"])
+    windows = state.get("stress_windows") or DEFAULT_STRESS_WINDOWS
 
-    stress_test_result = "\n".join(stress_lines)
+    # Weighted portfolio returns for the full 3-year period
+    stress_weights = portfolio_weights(stress_returns["tickers"], portfolio)
+    full_portfolio_returns = portfolio_returns(stress_returns["returns"], stress_weights)
 
-    print("[Node B] Stress test complete.")
+    # One prefix-sum pass per window — see tools/stress_test.py
+    # Dates stay a datetime64 array — only the few dates in the result become strings
+    stress_test = run_stress_test(full_portfolio_returns, stress_returns["dates"], windows)
+    stress_results = stress_test["windows"]
+    drawdown = stress_test["max_drawdown"]
+
+    for r in stress_results:
+        logger.debug(f"[Node B] Worst {r['window']}-day period ({r['start_date']} to {r['end_date']}): "
+                     f"{r['loss'] * 100:.1f}%")
+    logger.info(f"[Node B] Max drawdown ({drawdown['peak_date']} to {drawdown['trough_date']}): "
+                f"{drawdown['depth'] * 100:.1f}%")
+
+    # Kept structured — node d formats it as text for the prompt
+    stress_test["years"] = state.get("stress_years") or STRESS_TEST_YEARS
+
+    logger.info("[Node B] Stress test complete.")
+
+    # PART 3: VaR Backtest
+    # Rolls the same historical VaR (same number of days as the VaR window)
+    # over the whole stress history and checks each forecast against the
+    # next day — is the model calibrated, and do its misses cluster?
+    confidences = tuple(state.get("var_confidences") or DEFAULT_CONFIDENCES)
+    backtest = backtest_var(full_portfolio_returns, len(returns_history["dates"]), confidences)
+    var_backtest = summarize_backtest(backtest, stress_returns["dates"])
+    for r in var_backtest["results"]:
+        logger.info(f"[Node B] VaR backtest {r['confidence'] * 100:.0f}%: {r['exceedances']} exceedances "
+                    f"in {r['observations']} days (expected {r['expected']:.1f}), "
+                    f"Kupiec p={r['kupiec_pvalue']:.3f}, Christoffersen p={r['christoffersen_pvalue']:.3f}")
+
+    # PART 4: Hypothetical Scenarios
+    # Instantaneous P&L and stressed VaR per user-defined scenario, over the
+    # VaR window and node A's covariance
+    scenario_results = None
+    if state.get("scenarios"):
+        results = run_scenarios(returns_history["returns"], weights, state["scenarios"],
+                                returns_history["tickers"], covariance["matrix"], state.get("sectors"))
+        scenario_results = {"confidence": results["confidence"], "table": scenario_table(results)}
+        worst = scenario_results["table"][0]
+        logger.info(f"[Node B] {len(state['scenarios'])} scenarios, worst: {worst['scenario']} "
+                    f"({worst['pnl'] * 100:+.2f}%)")
 
     return {
         "value_at_risk": value_at_risk,
-        "stress_test_result": stress_test_result
-    }
\ No newline at end of file
+        "stress_test": stress_test,
+        "monte_carlo_var": monte_carlo_var,
+        "var_backtest": var_backtest,
+        "parametric_var": parametric_var,
+        "scenario_results": scenario_results
+    }
+
+
+async def amarket_risk_node(state: State) -> dict:
+    """ Async variant of Node B — the NumPy work runs in a worker thread
+    so the event loop is never blocked by it."""
+    return await asyncio.to_thread(market_risk_node, state)
+
+
+def market_risk_fingerprint(state: State, config=None) -> str:
+    """ Node B's cache key: the returns node A prepared (their dates carry the
+    data's as-of date), the window offsets and every setting node B reads. """
+    return fingerprint("market risk", state["portfolio"], state["returns"], state["windows"],
+                       state.get("stress_years") or STRESS_TEST_YEARS,
+                       state.get("stress_windows") or DEFAULT_STRESS_WINDOWS,
+                       state.get("var_method") or "historical",
+                       state.get("monte_carlo_options") or {},
+                       list(state.get("var_confidences") or DEFAULT_CONFIDENCES),
+                       state.get("scenarios") or [], state.get("sectors") or {})
@@ -0,0 +1,23 @@
+import logging
+from state import State
+from tools.report_template import template_report
+
+logger = logging.getLogger(__name__)
+
+def quant_report_node(state: State) -> dict:
+    """
+    Node d, quant-only variant — builds the report and rating from the
+    metrics with a fixed template instead of calling the LLM.
+    The graph routes here instead of report synthesis when the state has
+    quant_only=True. Takes milliseconds and never leaves the process.
+    """
+    logger.info("[Node D] Quant-only mode. Building the report from the metrics")
+    report = template_report(state)
+    logger.info(f"[Node D] Final Risk Rating: {report['risk_rating']}")
+    return report
+
+
+async def aquant_report_node(state: State) -> dict:
+    """ Async variant of the quant-only node d — the template is cheap enough
+    to build on the event loop. """
+    return quant_report_node(state)
@@ -1,39 +1,110 @@
-from langchain_openai import ChatOpenAI
+import asyncio
+import logging
+import threading
+import time
 from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.config import get_stream_writer
 from state import State
+from tools.monte_carlo import format_monte_carlo
+from tools.stress_test import format_stress_test
+from tools.backtest import format_var_backtest
+from tools.covariance import format_risk_decomposition
+from tools.scenarios import format_scenarios
+from tools import llm_cache
+from tools.prompt_compaction import (format_correlations, format_holdings, format_volatility, fit_to_budget,
+                                     TOKEN_BUDGET, MAX_CLUSTERS, TOP_PAIRS, TOP_HOLDINGS)
+from tools.instrumentation import record_external
 
+logger = logging.getLogger(__name__)
 
-def report_synthesis_node(state: State) -> dict:
-    """ 
-    Node d — Uses an LLM to synthesize all risk data into a final report.
-    Runs after nodes b and c have both completed.
+# One chat client for the whole process — created on first use and reused,
+# so connection pools and auth are set up once rather than per report
+_shared_llm = None
+_shared_llm_lock = threading.Lock()
+
+
+def get_chat_model(config: RunnableConfig = None):
+    """ Returns the chat model for node d.
+    A stand-in model (e.g. langchain_core's FakeListChatModel) can be passed as
+    config["configurable"]["chat_model"]; otherwise the process-wide GPT-4o client is used. """
+    global _shared_llm
+    configurable = (config or {}).get("configurable", {})
+    if configurable.get("chat_model") is not None:
+        return configurable["chat_model"]
+
+    with _shared_llm_lock:
+        if _shared_llm is None:
+            # Imported here, not at module level — langchain_openai takes about
+            # half a second to import and quant-only runs never call the LLM
+            from langchain_openai import ChatOpenAI
+            _shared_llm = ChatOpenAI(model="gpt-4o", temperature=0)
+    return _shared_llm
+
+
+def _model_name(llm) -> str:
+    """ Name the cache key is built from — changing model means a fresh report. """
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+def _cache_enabled(config: RunnableConfig = None) -> bool:
+    """ The cache is on unless LLM_CACHE=0 or config["configurable"]["llm_cache"] is False. """
+    configurable = (config or {}).get("configurable", {})
+    return llm_cache.CACHE_ENABLED and configurable.get("llm_cache", True)
+
+
+def build_report_prompt(state: State, detail: dict = None) -> str:
+    """ Builds the LLM prompt from everything nodes b and c wrote into the state.
+
+    Args:
+        state: graph state after nodes b and c
+        detail: how much to list — "clusters", "pairs", "holdings" (and the
+            precomputed "merges"), see tools/prompt_compaction.py. Defaults
+            to full detail.
     """
-    # Initialize the LLM
-    llm = ChatOpenAI(model="gpt-4o", temperature=0)
+    detail = detail or {}
+    clusters = detail.get("clusters", MAX_CLUSTERS)
+    pairs = detail.get("pairs", TOP_PAIRS)
+    holdings = detail.get("holdings", TOP_HOLDINGS)
 
     # Read everything that nodes b and c wrote into the state
     portfolio = state.get("portfolio", {})
     value_at_risk = state.get("value_at_risk", 0.0)
-    stress_test_result = state.get("stress_test_result", "")
+    stress_test = state.get("stress_test")
     volatility_scores = state.get("volatility_scores", {})
     sharpe_ratio = state.get("sharpe_ratio", 0.0)
     correlation_matrix = state.get("correlation_matrix", {})
+    monte_carlo_var = state.get("monte_carlo_var")
+    var_backtest = state.get("var_backtest")
+    parametric_var = state.get("parametric_var")
+    risk_contributions = state.get("risk_contributions")
+    scenario_results = state.get("scenario_results")
 
-    print("[Node D] All parallel nodes complete. Synthesizing final report")
+    # Format the correlation matrix for readability. Every pair for small
+    # portfolios; for larger ones clusters and the most extreme pairs, so the
+    # prompt does not grow with the square of the number of assets
+    weights = [portfolio.get(asset, 0.0) for asset in correlation_matrix.get("tickers", [])]
+    correlation_text = format_correlations(correlation_matrix, weights, clusters, pairs, detail.get("merges"))
 
-    # Format the correlation matrix for readability
-    # Convert the nested dict into a clean string for the LLM prompt
-    correlation_text = ""
-    for asset_a, correlations in correlation_matrix.items():
-        for asset_b, value in correlations.items():
-            if asset_a < asset_b:   # avoid duplicates e.g. AAPL-GOOGL and GOOGL-AAPL
-                correlation_text += f"  {asset_a} vs {asset_b}: {value}\n"
+    # Step 2: Format volatility scores for the prompt
+    volatility_text = format_volatility(volatility_scores, holdings)
 
-    # Step 2: Format volatility scores for the prompt 
-    volatility_text = "\n".join(
-        f"  {asset}: {score * 100:.1f}% annualized volatility"
-        for asset, score in volatility_scores.items()
-    )
+    # Nodes hand over structured results — this is the one place they become text
+    stress_test_results = format_stress_test(stress_test) if stress_test else ""
+
+    # Monte Carlo VaR / CVaR, only when node b ran in monte_carlo mode
+    monte_carlo_text = format_monte_carlo(monte_carlo_var) if monte_carlo_var else ""
+
+    # How well the VaR model held up historically — exceedances and coverage tests
+    backtest_text = format_var_backtest(var_backtest) if var_backtest else ""
+
+    # User-defined scenarios — only the worst ones, however many were run
+    scenario_text = format_scenarios(scenario_results, holdings) if scenario_results else ""
+
+    # Which positions drive the risk — the largest contributors are enough
+    # for the narrative, whatever the size of the book
+    decomposition_text = format_risk_decomposition(parametric_var, risk_contributions, holdings) \
+        if parametric_var else ""
 
     # Build the prompt 
     # We give the LLM all the calculated data and ask it to reason over it
@@ -42,11 +113,17 @@ def report_synthesis_node(state: State) -> dict:
     data, write a professional portfolio risk report and assign a final risk rating.
     
     PORTFOLIO ALLOCATIONS:
-    {portfolio}
+    {format_holdings(portfolio, holdings)}
 
     MARKET RISK:
     - Value at Risk (95% confidence): {value_at_risk * 100:.2f}% potential daily loss
-    - Stress Test: {stress_test_result}
+    - Stress Test: {stress_test_results}
+    {monte_carlo_text}
+    {backtest_text}
+    {scenario_text}
+
+    RISK DECOMPOSITION:
+    {decomposition_text}
 
     VOLATILITY:
     {volatility_text}
@@ -60,31 +137,237 @@ def report_synthesis_node(state: State) -> dict:
     Please provide:
     1. A brief executive summary (2-3 sentences)
     2. Key risk findings from the data above
-    3. Diversification assessment based on the correlation matrix
+    3. Diversification assessment based on the correlation matrix and which
+       positions drive the risk
     4. A final risk rating: Low, Medium, or High — with justification
 
     Write in a clear, professional tone suitable for an investment committee.
     End your response with a line that says exactly: RISK RATING: <Low/Medium/High>
     """
 
-    # Call the LLM
-    response = llm.invoke([HumanMessage(content=prompt)])
-    report_text = response.content
-    print("[Node D] Report generated successfully.")
+    return prompt
+
 
-    # Extract the risk rating from the report 
-    # The LLM was instructed to end with "RISK RATING: Low/Medium/High"
-    # We parse that line to get a clean rating field
-    risk_rating = "Unknown"
+def compact_report_prompt(state: State, config: RunnableConfig = None) -> tuple:
+    """ The report prompt, compacted to fit the token budget — at most
+    PROMPT_TOKEN_BUDGET tokens, or config["configurable"]["prompt_token_budget"].
+
+    Returns:
+        (prompt, stats) — stats has the prompt "tokens", the "budget" and
+        the detail that was needed to fit
+    """
+    budget = (config or {}).get("configurable", {}).get("prompt_token_budget") or TOKEN_BUDGET
+    prompt, stats = fit_to_budget(lambda detail: build_report_prompt(state, detail), budget,
+                                  state.get("correlation_matrix"))
+    logger.info(f"[Node D] Prompt: {stats['tokens']} tokens ({stats['tokenizer']}), budget {stats['budget']}"
+                + (" — compacted" if stats["compacted"] else ""))
+    return prompt, stats
+
+
+def parse_risk_rating(report_text: str) -> str:
+    """ Extracts the risk rating from the report.
+    The LLM was instructed to end with "RISK RATING: Low/Medium/High"
+    We parse that line to get a clean rating field """
     for line in report_text.splitlines():
         if line.startswith("RISK RATING:"):
-            risk_rating = line.replace("RISK RATING:", "").strip()
-            break
+            return line.replace("RISK RATING:", "").strip()
+    return "Unknown"
+
+
+class RiskRatingParser:
+    """ Finds the "RISK RATING:" line while the report is still streaming in.
+    Feed it tokens as they arrive; it keeps only the current unfinished line. """
 
-    print(f"[Node D] Final Risk Rating: {risk_rating}")
+    def __init__(self):
+        self.line = ""
+        self.rating = None
+
+    def feed(self, text: str):
+        """ Returns the rating the moment its line is complete, otherwise None. """
+        if self.rating is not None:
+            return None
+        self.line += text
+        *complete, self.line = self.line.split("\n")
+        for line in complete:
+            if line.startswith("RISK RATING:"):
+                self.rating = line.replace("RISK RATING:", "").strip()
+                return self.rating
+        return None
+
+    def close(self):
+        """ End of the stream — the rating line may not end with a newline. """
+        return self.feed("\n") if self.line else None
+
+
+def _stream_writer():
+    """ LangGraph's custom stream writer, or a no-op when node d is called
+    outside a graph run (e.g. from batch.py). """
+    try:
+        return get_stream_writer()
+    except RuntimeError:
+        return lambda event: None
+
+
+def _emit_tokens(writer, parser: RiskRatingParser, text: str) -> None:
+    """ Streams one piece of the report and the rating as soon as it is known. """
+    writer({"report_token": text})
+    rating = parser.feed(text)
+    if rating is not None:
+        writer({"risk_rating": rating})
+
+
+def _record_llm_call(model: str, prompt: str, latency: float, first_token: float,
+                     chunks: int, usage: dict, prompt_stats: dict) -> None:
+    """ Adds the LLM call to node d's trace. Token counts come from the provider's
+    usage data when it sends any, otherwise the prompt is counted locally and
+    each streamed chunk counts as one token. """
+    usage = usage or {}
+    record_external(
+        "llm", latency,
+        model=model,
+        first_token_seconds=round(first_token, 6) if first_token is not None else None,
+        prompt_chars=len(prompt),
+        prompt_tokens=usage.get("input_tokens") or prompt_stats["tokens"],
+        tokens=usage.get("output_tokens") or chunks
+    )
+
+
+def _cached_report(cache_key: str, prompt_stats: dict):
+    """ Returns node d's output from the report cache, or None on a miss. """
+    if cache_key is None:
+        return None
+    started = time.perf_counter()
+    cached = llm_cache.get_report(cache_key)
+    record_external("llm_cache", time.perf_counter() - started, hit=cached is not None)
+    if cached is None:
+        return None
+
+    # Streaming consumers still get the report — all in one piece
+    writer = _stream_writer()
+    writer({"report_token": cached["final_report"]})
+    writer({"risk_rating": cached["risk_rating"]})
+
+    stats = llm_cache.cache_stats()
+    logger.info(f"[Node D] Report served from cache (saved {cached['latency']:.1f}s, "
+                f"hit rate {stats['hit_rate'] * 100:.0f}%).")
+    logger.info(f"[Node D] Final Risk Rating: {cached['risk_rating']}")
+    return {
+        "final_report": cached["final_report"],
+        "risk_rating": cached["risk_rating"],
+        "report_cache": {"hit": True, "latency_saved": cached["latency"], **stats},
+        "prompt_stats": prompt_stats
+    }
+
+
+def _finish_report(report_text: str, cache_key: str, model: str, latency: float,
+                   prompt_stats: dict) -> dict:
+    """ Parses a fresh report, stores it in the cache and builds node d's output. """
+    logger.info(f"[Node D] Report generated successfully in {latency:.1f}s.")
+
+    risk_rating = parse_risk_rating(report_text)
+    logger.info(f"[Node D] Final Risk Rating: {risk_rating}")
+
+    if cache_key is not None:
+        llm_cache.put_report(cache_key, model, report_text, risk_rating, latency)
 
     # Return the final report and extracted risk rating
     return {
         "final_report": report_text,
-        "risk_rating": risk_rating
-    }
\ No newline at end of file
+        "risk_rating": risk_rating,
+        "report_cache": {"hit": False, "latency_saved": 0.0, **llm_cache.cache_stats()},
+        "prompt_stats": prompt_stats
+    }
+
+
+def _prepare(state: State, config: RunnableConfig = None) -> tuple:
+    """ Everything node d does before the LLM call: picks the model, builds
+    the compacted prompt and looks it up in the report cache.
+
+    Returns:
+        (report, cached) — node d's output when the report was cached,
+        otherwise the _ReportStream to feed the LLM's chunks into
+    """
+    llm = get_chat_model(config)
+
+    logger.info("[Node D] All parallel nodes complete. Synthesizing final report")
+    prompt, prompt_stats = compact_report_prompt(state, config)
+
+    model = _model_name(llm)
+    cache_key = llm_cache.cache_key(model, prompt) if _cache_enabled(config) else None
+    cached = _cached_report(cache_key, prompt_stats)
+    if cached is not None:
+        return None, cached
+    return _ReportStream(llm, model, prompt, prompt_stats, cache_key), None
+
+
+class _ReportStream:
+    """ One LLM call of node d: the request and the report as it streams in.
+    The sync and async nodes only differ in how they iterate the LLM's chunks
+    — each chunk goes to add(), and finish() builds node d's output. """
+
+    def __init__(self, llm, model: str, prompt: str, prompt_stats: dict, cache_key: str):
+        self.llm = llm
+        self.model = model
+        self.prompt = prompt
+        self.prompt_stats = prompt_stats
+        self.cache_key = cache_key
+        self.messages = [HumanMessage(content=prompt)]
+        self.writer = _stream_writer()
+        self.parser = RiskRatingParser()
+        self.tokens = []
+        self.first_token, self.usage = None, None
+        self.started = time.perf_counter()
+
+    def add(self, chunk) -> None:
+        """ Streams one chunk of the report (graph.stream(..., stream_mode="custom")
+        receives every token as it arrives). """
+        if chunk.content:
+            self.first_token = self.first_token or time.perf_counter() - self.started
+            self.tokens.append(chunk.content)
+            _emit_tokens(self.writer, self.parser, chunk.content)
+        self.usage = chunk.usage_metadata or self.usage
+
+    def finish(self) -> dict:
+        """ End of the stream — records the call and returns node d's output. """
+        if self.parser.close() is not None:
+            self.writer({"risk_rating": self.parser.rating})
+        latency = time.perf_counter() - self.started
+        _record_llm_call(self.model, self.prompt, latency, self.first_token, len(self.tokens),
+                         self.usage, self.prompt_stats)
+        return _finish_report("".join(self.tokens), self.cache_key, self.model, latency, self.prompt_stats)
+
+
+def report_synthesis_node(state: State, config: RunnableConfig = None) -> dict:
+    """ 
+    Node d — Uses an LLM to synthesize all risk data into a final report.
+    Runs after nodes b and c have both completed.
+    Reports are cached by model + prompt (the LLM runs at temperature 0),
+    so unchanged portfolios skip the LLM call entirely. The prompt is
+    compacted to the token budget, so report latency stays about flat as
+    portfolios grow.
+    """
+    report, cached = _prepare(state, config)
+    if cached is not None:
+        return cached
+
+    # Call the LLM, streaming the report token by token
+    for chunk in report.llm.stream(report.messages):
+        report.add(chunk)
+    return report.finish()
+
+
+async def areport_synthesis_node(state: State, config: RunnableConfig = None) -> dict:
+    """ 
+    Async variant of node d — awaits the LLM with astream, so many reports
+    can be in flight at once from a single process.
+    """
+    # Prompt compaction and the report cache's SQLite calls block — they run
+    # in a worker thread so other reports keep streaming meanwhile
+    report, cached = await asyncio.to_thread(_prepare, state, config)
+    if cached is not None:
+        return cached
+
+    # Await the LLM instead of blocking on it, streaming the report token by token
+    async for chunk in report.llm.astream(report.messages):
+        report.add(chunk)
+    return await asyncio.to_thread(report.finish)
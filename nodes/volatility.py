@@ -1,5 +1,15 @@
+import asyncio
+import logging
 import numpy as np
 from state import State
+from tools.returns import portfolio_weights, portfolio_returns
+from tools.risk_metrics import annualized_volatility, sharpe_ratio as compute_sharpe_ratio, TRADING_DAYS
+from tools.correlation import correlation_matrix, top_pairs
+from tools.covariance import risk_decomposition
+from tools.price_simulator import take_rows
+from tools.node_cache import fingerprint
+
+logger = logging.getLogger(__name__)
 
 def volatility_node(state: State) -> dict:
     """
@@ -9,22 +19,16 @@ def volatility_node(state: State) -> dict:
 
     # reads the data node A already prepared
     portfolio = state["portfolio"]
-    price_history = state["price_history"]
-
-    print("[Node C] Starting volatility and correlation calculations...")
+    returns_history = take_rows(state["returns"], state["windows"]["var"])
 
-    # Calculate daily returns for each asset 
-    # Same logic as node b — we need percentage changes, not raw prices
+    logger.info("[Node C] Starting volatility and correlation calculations...")
 
-    daily_returns = {}
-    for asset, prices in price_history.items():
-        returns = [
-            (prices[i] - prices[i-1]) / prices[i-1] 
-            for i in range(1, len(prices))
-        ]
-        daily_returns[asset] = returns
+    # The date-aligned (days × assets) daily returns matrix
+    # Same matrix node b uses — one column per asset
+    assets = returns_history["tickers"]
+    daily_returns = returns_history["returns"]
 
-    if not daily_returns:
+    if not assets or len(daily_returns) < 2:
         raise ValueError("No valid assets with sufficient price data.")
 
     
@@ -33,13 +37,13 @@ def volatility_node(state: State) -> dict:
     # 252 is the number of trading days in a year
     # Annualizing lets us compare volatility across different time horizons
 
-    volatility_scores = {}
-    for asset, returns in daily_returns.items():
-        daily_std = np.std(returns)  # how much returns vary day to day
-        annualized_volatility = daily_std * np.sqrt(252) # scale up to a full year
-        volatility_scores[asset] = float(round(annualized_volatility, 4))
+    annualized_volatility_scores = annualized_volatility(daily_returns)  # one per asset
+    volatility_scores = {
+        asset: float(round(score, 4))
+        for asset, score in zip(assets, annualized_volatility_scores)
+    }
 
-    print(f"[Node C] Volatility scores: {volatility_scores}")
+    logger.debug(f"[Node C] Volatility scores: {volatility_scores}")
     # filters out NaN scores from failed assets
     volatility_scores = {
         asset: score
@@ -50,62 +54,63 @@ def volatility_node(state: State) -> dict:
     # Calculate portfolio Sharpe Ratio
     # Sharpe Ratio measures return per unit of risk
     # Formula: (average portfolio return - risk free rate) / portfolio std deviation
-    # We use 0.04 (4%) as the annual risk-free rate (approximates US Treasury bonds)
-    risk_free_rate_daily = 0.04 / 252      # convert annual rate to daily
-
-    # only uses assets that actually exist in price_history
-    available_assets = {asset: weight for asset, weight in portfolio.items() 
-                    if asset in daily_returns}
-
-    num_days = min(len(returns) for returns in daily_returns.values())
-    portfolio_returns = []
-
-    for i in range(num_days):
-        daily_portfolio_return = sum(
-            daily_returns[asset][i] * available_assets[asset]
-            for asset in available_assets
-        )
-        portfolio_returns.append(daily_portfolio_return)
-
-
-    # Average daily return of the whole portfolio
-    avg_portfolio_return = np.mean(portfolio_returns)
-
-    # Standard deviation of portfolio returns (overall portfolio risk)
-    portfolio_std = np.std(portfolio_returns)
-
-    # Annualized Sharpe Ratio
-    # Multiply by √252 to scale from daily to annual
-    sharpe_ratio = (
-        (avg_portfolio_return - risk_free_rate_daily) / portfolio_std * np.sqrt(252)
-        if portfolio_std != 0 else 0.0       # avoid division by zero
-    )
-    sharpe_ratio = float(round(sharpe_ratio, 4))
-
-    print(f"[Node C] Sharpe Ratio: {sharpe_ratio}")
+    # annualized with √252 — see tools/risk_metrics.py
+
+    # Weighted portfolio daily returns as one matrix-vector product
+    weights = portfolio_weights(assets, portfolio)
+    daily_portfolio_returns = portfolio_returns(daily_returns, weights)
+
+    sharpe_ratio = float(round(float(compute_sharpe_ratio(daily_portfolio_returns)), 4))
+
+    logger.info(f"[Node C] Sharpe Ratio: {sharpe_ratio}")
+
+    # Portfolio volatility √(wᵀΣw) from the covariance node A estimated, and
+    # how much of it each position contributes (the contributions add up to it)
+    covariance = state["covariance"]
+    decomposition = risk_decomposition(covariance, portfolio_weights(covariance["tickers"], portfolio))
+    volatility = decomposition["annualized_volatility"]
+    risk_contributions = {
+        "volatility": float(round(float(volatility), 4)),
+        "tickers": covariance["tickers"],
+        "marginal": decomposition["marginal_volatility"] * np.sqrt(TRADING_DAYS),
+        "component": decomposition["component_volatility"] * np.sqrt(TRADING_DAYS),
+        "percent": np.divide(decomposition["component_volatility"], decomposition["volatility"],
+                             out=np.zeros(len(covariance["tickers"])),
+                             where=decomposition["volatility"] > 0)
+    }
+    logger.info(f"[Node C] Portfolio volatility: {risk_contributions['volatility'] * 100:.1f}% annualized")
 
 
     # Calculate the Correlation Matrix 
     # Correlation tells us how assets move relative to each other
     # Range: -1 (opposite directions) to +1 (identical movements)
     # A diversified portfolio should have LOW correlation between assets
-    assets = list(daily_returns.keys())
 
-    # Build a 2D dict to store correlation between every pair of assets
-    correlation_matrix = {}
-    for asset_a in assets:
-        correlation_matrix[asset_a] = {}
-        for asset_b in assets:
-            # np.corrcoef returns a 2x2 matrix, we take the [0][1] value
-            # which is the correlation between the two assets
-            corr = np.corrcoef(daily_returns[asset_a], daily_returns[asset_b])[0][1]
-            correlation_matrix[asset_a][asset_b] = float(round(corr, 4))
+    # Every pair in one vectorized pass — large universes switch to a
+    # blockwise float32 build automatically (see tools/correlation.py)
+    correlation = correlation_matrix(daily_returns)
 
-    print(f"[Node C] Correlation matrix calculated for {len(assets)} assets.")
+    logger.info(f"[Node C] Correlation matrix calculated for {len(assets)} assets.")
+    if logger.isEnabledFor(logging.DEBUG):
+        # Only worth the extra pass over the matrix when someone reads it
+        most_correlated = [f"{a} vs {b}: {corr}" for a, b, corr in top_pairs(correlation, assets, k=3)]
+        logger.debug(f"[Node C] Most correlated pairs: {most_correlated}")
 
     # Return only the fields this node is responsible for
     return {
         "volatility_scores": volatility_scores,
         "sharpe_ratio": sharpe_ratio,
-        "correlation_matrix": correlation_matrix
-    }
\ No newline at end of file
+        "correlation_matrix": {"tickers": assets, "matrix": correlation},
+        "risk_contributions": risk_contributions
+    }
+
+
+async def avolatility_node(state: State) -> dict:
+    """ Async variant of Node C — the NumPy work runs in a worker thread
+    so the event loop is never blocked by it."""
+    return await asyncio.to_thread(volatility_node, state)
+
+
+def volatility_fingerprint(state: State, config=None) -> str:
+    """ Node C's cache key: the portfolio and the VaR window of the returns. """
+    return fingerprint("volatility", state["portfolio"], take_rows(state["returns"], state["windows"]["var"]))
@@ -0,0 +1,35 @@
+import asyncio
+from graph import risk_analyzer_graph
+
+
+async def arun_many(portfolios: list, max_concurrency: int = 16, app=None,
+                    config: dict = None, return_exceptions: bool = True) -> list:
+    """
+    Runs the risk analyzer graph for many portfolios concurrently in one process.
+
+    Each run awaits its LLM call instead of blocking, and the NumPy work of
+    nodes a-c runs in worker threads, so up to `max_concurrency` runs are in
+    flight at any time.
+
+    Args:
+        portfolios: list of initial states, e.g. [{"portfolio": {...}, "time_horizon": 90}, ...]
+        max_concurrency: maximum number of graph runs in flight at once
+        app: compiled graph to run (defaults to a fresh risk_analyzer_graph())
+        config: LangGraph config shared by every run — e.g.
+            {"configurable": {"chat_model": fake_llm, "price_provider": fake_prices}}
+        return_exceptions: if True a failed run returns its exception in place
+            of a final state, instead of cancelling the whole batch
+    Returns:
+        list of final states (or exceptions), in the same order as `portfolios`
+    """
+    app = app or risk_analyzer_graph()
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(initial_state):
+        async with semaphore:
+            return await app.ainvoke(initial_state, config)
+
+    return await asyncio.gather(
+        *(run_one(initial_state) for initial_state in portfolios),
+        return_exceptions=return_exceptions
+    )
@@ -0,0 +1,329 @@
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from dotenv import load_dotenv
+
+# Load .env before anything reads its settings at import time
+load_dotenv()
+
+from graph import risk_analyzer_graph
+from nodes.data_preparation import data_preparation_node
+from tools.node_cache import fingerprint
+from tools.warm_cache import WarmCache
+from tools.what_if import WhatIf
+
+logger = logging.getLogger(__name__)
+
+# Service settings — all can be set in .env
+HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+PORT = int(os.getenv("SERVICE_PORT", "8000"))
+LATENCY_WINDOW = int(os.getenv("SERVICE_LATENCY_WINDOW", "1000"))   # requests the percentiles cover
+
+# Inputs a request may set — the same fields as the graph's initial state
+REQUEST_FIELDS = ("portfolio", "time_horizon", "stress_years", "nan_policy", "stress_windows",
+                  "var_method", "monte_carlo_options", "var_confidences", "quant_only",
+                  "scenarios", "sectors")
+# Final-state fields sent back — the arrays nodes a-c hand each other stay in the process
+RESPONSE_FIELDS = ("portfolio", "value_at_risk", "stress_test", "monte_carlo_var", "var_backtest",
+                   "parametric_var", "scenario_results", "volatility_scores", "sharpe_ratio", "risk_contributions",
+                   "final_report", "risk_rating", "report_cache", "prompt_stats", "trace")
+# Inputs of a what-if request: the base run's data settings and the candidate weightings
+WHAT_IF_FIELDS = ("portfolio", "time_horizon", "stress_years", "nan_policy", "stress_windows",
+                  "candidates", "sensitivities")
+
+
+def to_json(value):
+    """ Final-state values as JSON types: arrays become lists, datetime64 and
+    other NumPy scalars plain strings / numbers, NaN becomes null. """
+    if isinstance(value, dict):
+        return {str(key): to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return to_json(value.tolist()) if value.dtype.kind != "M" else [str(d) for d in value]
+    if isinstance(value, np.datetime64):
+        return str(value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+class LatencyStats:
+    """ Request count, errors and latency percentiles over the last `window` requests, per route. """
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._latencies = {}
+        self._counts = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, route: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            self._latencies.setdefault(route, deque(maxlen=self.window)).append(seconds)
+            self._counts[route] = self._counts.get(route, 0) + 1
+            self._errors[route] = self._errors.get(route, 0) + int(error)
+
+    def summary(self) -> dict:
+        """ route -> {"requests", "errors", "p50_ms", "p95_ms", "p99_ms", "max_ms"} """
+        with self._lock:
+            routes = {route: np.asarray(latencies) for route, latencies in self._latencies.items()}
+            counts, errors = dict(self._counts), dict(self._errors)
+        summary = {}
+        for route, latencies in routes.items():
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+            summary[route] = {
+                "requests": counts[route],
+                "errors": errors[route],
+                "p50_ms": round(float(p50), 2),
+                "p95_ms": round(float(p95), 2),
+                "p99_ms": round(float(p99), 2),
+                "max_ms": round(float(latencies.max()) * 1000, 2)
+            }
+        return summary
+
+
+class RiskService:
+    """
+    The risk analyzer as a long-lived process: the graph is compiled once,
+    the LLM client is created once and node A's output (prices, returns
+    matrix, covariance) stays in memory, least recently used evicted.
+
+    Two layers of request coalescing:
+    - identical requests in flight at the same time share one graph run
+    - runs over the same tickers and horizon share one fetch and one returns
+      matrix, whatever their weights (market_data_cache in node A)
+
+    What-if requests reweight those cached returns directly (tools/what_if.py)
+    — no graph run, no fetch, no LLM.
+    """
+
+    def __init__(self, price_provider=None, chat_model=None, max_entries: int = None):
+        """
+        Args:
+            price_provider: stand-in price provider (default: yfinance through the price store)
+            chat_model: stand-in chat model (default: the shared GPT-4o client)
+            max_entries: market data entries kept warm (default WARM_CACHE_MAX_ENTRIES)
+        """
+        self.app = risk_analyzer_graph()
+        self.market_data = WarmCache(max_entries)
+        # Nothing is kept — only concurrent identical requests are merged
+        self.requests = WarmCache(max_entries=0)
+        # Base-run artifacts for what-if requests, built from node A's cached output
+        self.what_ifs = WarmCache(max_entries)
+        self.latency = LatencyStats()
+        self.started = time.time()
+        self.config = {"configurable": {"market_data_cache": self.market_data}}
+        if price_provider is not None:
+            self.config["configurable"]["price_provider"] = price_provider
+        if chat_model is not None:
+            self.config["configurable"]["chat_model"] = chat_model
+
+    def warm_up(self) -> None:
+        """ Pays the one-time costs before the first request: the LLM client
+        (and its langchain_openai import). """
+        from nodes.report_synthesis import get_chat_model
+        try:
+            get_chat_model(self.config)
+        except Exception as e:
+            # e.g. no OPENAI_API_KEY — quant-only requests still work
+            logger.warning(f"[Service] LLM client not available: {e!r}")
+
+    def analyze(self, request: dict) -> dict:
+        """
+        Runs the graph for one request.
+
+        Args:
+            request: {"portfolio": {...}, "time_horizon": 90, ...} — see REQUEST_FIELDS
+        Returns:
+            the RESPONSE_FIELDS of the final state as JSON types, plus
+            "latency_ms" and "coalesced" (shared another request's run)
+        """
+        unknown = set(request) - set(REQUEST_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown request fields: {sorted(unknown)}")
+        if not isinstance(request.get("portfolio"), dict) or not request["portfolio"]:
+            raise ValueError("'portfolio' must be a non-empty object of ticker -> weight.")
+        initial_state = {"time_horizon": 90, **request}
+
+        started = time.perf_counter()
+        response, how = self.requests.get_or_compute(
+            fingerprint("request", initial_state),
+            lambda: to_json({field: value for field, value in self.app.invoke(initial_state, self.config).items()
+                             if field in RESPONSE_FIELDS})
+        )
+        return {**response, "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                "coalesced": how == "coalesced"}
+
+    def what_if(self, request: dict) -> dict:
+        """
+        Risk numbers of candidate weightings over a base run's tickers.
+
+        Args:
+            request: {"portfolio": {...}, "time_horizon": 90, "candidates": [{...}, ...],
+                "sensitivities": false} — "portfolio" picks the base run's tickers
+                (its weights don't matter), see WHAT_IF_FIELDS
+        Returns:
+            "results" — WhatIf.evaluate() per candidate, plus its gradients per
+            ticker when "sensitivities" is set — "latency_ms" and "base_cache"
+            (hit / coalesced / miss)
+        """
+        unknown = set(request) - set(WHAT_IF_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown what-if fields: {sorted(unknown)}")
+        if not isinstance(request.get("portfolio"), dict) or not request["portfolio"]:
+            raise ValueError("'portfolio' must be a non-empty object of ticker -> weight.")
+        candidates = request.get("candidates")
+        if not isinstance(candidates, list) or not all(isinstance(c, dict) for c in candidates):
+            raise ValueError("'candidates' must be a list of objects of ticker -> weight.")
+        base = {"time_horizon": 90, **{field: value for field, value in request.items()
+                                       if field not in ("candidates", "sensitivities")}}
+
+        started = time.perf_counter()
+        # Same tickers, settings and day as node A's market data cache
+        key = fingerprint("what-if", list(base["portfolio"]), base["time_horizon"], base.get("stress_years"),
+                          base.get("nan_policy"), base.get("stress_windows"), str(np.datetime64("today")))
+        engine, how = self.what_ifs.get_or_compute(
+            key, lambda: WhatIf.from_state({**base, **data_preparation_node(base, self.config)})
+        )
+
+        results = []
+        for candidate in candidates:
+            result = engine.evaluate(candidate)
+            if request.get("sensitivities"):
+                gradients = engine.sensitivities(candidate)
+                result["sensitivities"] = {metric: dict(zip(engine.tickers, gradients[metric]))
+                                           for metric in gradients if metric != "tickers"}
+            results.append(result)
+        return to_json({"results": results, "latency_ms": round((time.perf_counter() - started) * 1000, 3),
+                        "base_cache": how})
+
+    def stats(self) -> dict:
+        """ Latency per route and the cache counters. """
+        from tools import llm_cache
+        return {
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "latency": self.latency.summary(),
+            "market_data_cache": self.market_data.stats(),
+            "request_coalescing": self.requests.stats(),
+            "what_if_cache": self.what_ifs.stats(),
+            "report_cache": llm_cache.cache_stats()
+        }
+
+
+def make_handler(service: RiskService):
+    """ Request handler class bound to one RiskService. """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, body: dict) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _handle(self, route: str, respond) -> None:
+            started = time.perf_counter()
+            status = 200
+            try:
+                body = respond()
+            except ValueError as e:
+                status, body = 400, {"error": str(e)}
+            except Exception as e:
+                logger.exception(f"[Service] {route} failed")
+                status, body = 500, {"error": repr(e)}
+            self._send(status, body)
+            service.latency.record(route, time.perf_counter() - started, error=status >= 500)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._handle("/health", lambda: {"status": "ok"})
+            elif self.path == "/stats":
+                self._handle("/stats", service.stats)
+            else:
+                self._send(404, {"error": f"No route {self.path}"})
+
+        def do_POST(self):
+            routes = {"/analyze": service.analyze, "/what-if": service.what_if}
+            if self.path not in routes:
+                self._send(404, {"error": f"No route {self.path}"})
+                return
+            route = self.path
+
+            def respond():
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Request body is not JSON: {e}")
+                return routes[route](request)
+
+            self._handle(route, respond)
+
+        def log_message(self, format, *args):
+            # Through logging, like everything else, instead of stderr
+            logger.debug(f"[Service] {self.address_string()} {format % args}")
+
+    return Handler
+
+
+def serve(service: RiskService, host: str = HOST, port: int = PORT) -> ThreadingHTTPServer:
+    """ Starts the HTTP server — one thread per request. Returns the server;
+    call serve_forever() on it (or run it in a thread, e.g. for tests). """
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    server.daemon_threads = True
+    logger.info(f"[Service] Listening on http://{host}:{server.server_address[1]}")
+    return server
+
+
+def main():
+    """
+    Command line entry point.
+    POST /analyze with {"portfolio": {...}, "time_horizon": 90, ...},
+    POST /what-if with the same plus {"candidates": [{...}, ...]},
+    GET /stats for latency percentiles and cache counters, GET /health.
+    """
+    parser = argparse.ArgumentParser(description="Run the risk analyzer as a local HTTP/JSON service.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--synthetic", type=int, metavar="SEED", default=None,
+                        help="serve synthetic prices (benchmarks/synthetic.py) instead of Yahoo Finance")
+    parser.add_argument("--fake-llm", type=float, metavar="SECONDS", default=None,
+                        help="answer with a stand-in chat model that waits this long (benchmarks/fake_llm.py)")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "INFO"))
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level.upper(), format="%(message)s")
+
+    price_provider, chat_model = None, None
+    if args.synthetic is not None:
+        from benchmarks.synthetic import SyntheticPriceProvider
+        price_provider = SyntheticPriceProvider(seed=args.synthetic)
+    if args.fake_llm is not None:
+        from benchmarks.fake_llm import LatencyFakeChatModel
+        chat_model = LatencyFakeChatModel(latency=args.fake_llm)
+
+    service = RiskService(price_provider=price_provider, chat_model=chat_model)
+    service.warm_up()
+    server = serve(service, args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
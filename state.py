@@ -7,19 +7,54 @@ class State(MessagesState):
     # --- Input ---
     portfolio: Dict
     time_horizon: int
+    stress_years: Optional[int] = None      # defaults to STRESS_TEST_YEARS
+    nan_policy: Optional[str] = None        # "drop", "ffill" or "mask" — see tools/returns.py
+    stress_windows: Optional[List[int]] = None  # defaults to DEFAULT_STRESS_WINDOWS
+    var_method: Optional[str] = None        # "historical" (default) or "monte_carlo"
+    monte_carlo_options: Optional[Dict] = None  # keyword arguments for simulate_var
+    var_confidences: Optional[List[float]] = None  # VaR backtest levels, defaults to DEFAULT_CONFIDENCES
+    quant_only: Optional[bool] = None       # True: template report instead of the LLM (see tools/report_template.py)
+    scenarios: Optional[List[Dict]] = None  # hypothetical stress scenarios, see tools/scenarios.py
+    sectors: Optional[Dict] = None          # ticker -> sector, for sector shocks
 
     # --- Node a output ---
-    price_history: Optional[Dict] = None
+    # Typed arrays only, each held once: a datetime64 dates index, a tickers
+    # index and a float64 matrix (see tools/serialization.py for checkpointing)
+    market_data: Optional[Dict] = None      # {"dates", "tickers", "prices"}
+    returns: Optional[Dict] = None          # {"dates", "tickers", "returns"}
+    # First row of the VaR and stress windows in returns: {"var", "stress"}
+    windows: Optional[Dict] = None
+    # Ledoit-Wolf covariance of the VaR window: {"tickers", "matrix", "mean", "days", "shrinkage"}
+    covariance: Optional[Dict] = None
 
     # --- Node b output ---
     value_at_risk: Optional[float] = None
-    stress_test_results: Optional[str] = None
+    # {"years", "windows": [...], "max_drawdown": {...}} — node d turns it into text
+    stress_test: Optional[Dict] = None
+    monte_carlo_var: Optional[Dict] = None  # only in monte_carlo mode
+    # Rolling VaR over the stress history and its backtest: {"window", "confidences",
+    # "dates", "var" ((days × levels) ndarray), "results": one dict per level}
+    var_backtest: Optional[Dict] = None
+    # Parametric VaR from the covariance and each asset's marginal / component VaR
+    parametric_var: Optional[Dict] = None
+    # P&L table of the hypothetical scenarios: {"confidence", "table": one row per scenario, worst first}
+    scenario_results: Optional[Dict] = None
 
     # --- Node c output ---
     volatility_scores: Optional[dict] = None
     sharpe_ratio: Optional[float] = None
-    correlation_matrix: Optional[dict] = None
+    correlation_matrix: Optional[dict] = None     # {"tickers": [...], "matrix": (assets × assets) ndarray}
+    # Portfolio volatility √(wᵀΣw) and each asset's share of it
+    risk_contributions: Optional[Dict] = None
 
     # --- Node d output ---
     final_report: Optional[str] = None
-    risk_rating: Optional[str] = None
\ No newline at end of file
+    risk_rating: Optional[str] = None
+    report_cache: Optional[Dict] = None     # this run: hit, latency_saved — process: hit_rate, saved_seconds
+    # Report prompt size: {"tokens", "budget", "tokenizer", "compacted", "clusters", "pairs", "holdings"}
+    prompt_stats: Optional[Dict] = None
+
+    # --- Every node ---
+    # One span per node run (see tools/instrumentation.py). Nodes b and c append
+    # in the same step, so the lists are concatenated rather than overwritten
+    trace: Annotated[List[Dict], operator.add]
\ No newline at end of file
@@ -0,0 +1,223 @@
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Confidence levels the rolling VaR is computed and backtested at
+DEFAULT_CONFIDENCES = (0.95, 0.99)
+# Test results below this p-value mark the VaR model as rejected
+SIGNIFICANCE = 0.05
+# Upper bound on the temporary copy np.percentile makes of each block of windows
+CHUNK_BYTES = 64 * 2**20
+
+# Like the rest of tools/, every function works down axis 0: one portfolio
+# (days,) or many side by side (days × portfolios) in the same call.
+
+
+def rolling_var(portfolio_returns: np.ndarray, window: int,
+                confidences: tuple = DEFAULT_CONFIDENCES) -> np.ndarray:
+    """
+    Historical VaR forecast for every day after the first `window` days,
+    each from the `window` days before it — the same estimate as
+    historical_var(), rolled forward one day at a time.
+
+    The windows are a sliding_window_view (no copy), and the quantiles of a
+    whole block of windows come from one np.percentile call. Blocks are
+    sized so the copy np.percentile sorts stays under CHUNK_BYTES.
+
+    Args:
+        portfolio_returns: (days,) or (days × portfolios) daily returns
+        window: number of past days in each VaR estimate
+        confidences: confidence levels, e.g. (0.95, 0.99)
+    Returns:
+        (days - window, [portfolios,] levels) VaR as positive fractions —
+        row t is the forecast for day window + t
+    """
+    returns = np.asarray(portfolio_returns, dtype=np.float64)
+    days = len(returns)
+    levels = len(confidences)
+    forecasts = np.empty((max(days - window, 0),) + returns.shape[1:] + (levels,))
+    if days <= window:
+        return forecasts
+
+    # views[t] holds days t .. t + window - 1 along its last axis;
+    # the last view has no day after it to forecast
+    views = sliding_window_view(returns, window, axis=0)[:-1]
+    percentiles = [(1 - c) * 100 for c in confidences]
+    per_window = window * int(np.prod(returns.shape[1:], dtype=np.int64)) * 8
+    step = max(CHUNK_BYTES // max(per_window, 1), 1)
+    for start in range(0, len(views), step):
+        # (levels, block, [portfolios]) -> levels moved last
+        block = np.percentile(views[start:start + step], percentiles, axis=-1)
+        forecasts[start:start + step] = np.abs(np.moveaxis(block, 0, -1))
+    return forecasts
+
+
+def _xlogy(x, y):
+    """ x · log(y), with 0 · log(0) = 0 — the convention the likelihoods need. """
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))
+    out = np.zeros_like(x)
+    positive = x > 0
+    out[positive] = x[positive] * np.log(y[positive])
+    return out
+
+
+def chi2_pvalue(statistic, df: int) -> np.ndarray:
+    """
+    Upper-tail p-value of a chi-squared statistic with 1 or 2 degrees of
+    freedom — closed forms, so no SciPy: erfc(√(x/2)) and exp(-x/2).
+    """
+    statistic = np.maximum(np.asarray(statistic, dtype=np.float64), 0.0)
+    if df == 1:
+        return np.vectorize(lambda x: math.erfc(math.sqrt(x / 2)), otypes=[np.float64])(statistic)
+    if df == 2:
+        return np.exp(-statistic / 2)
+    raise ValueError("Only 1 or 2 degrees of freedom are supported.")
+
+
+def kupiec_pof(exceedances, observations, confidence: float):
+    """
+    Kupiec proportion-of-failures test: is the exceedance rate the 1 - confidence
+    the VaR promises? Likelihood ratio, chi-squared with 1 degree of freedom.
+
+    Returns:
+        (statistic, p-value), each shaped like `exceedances`
+    """
+    x = np.asarray(exceedances, dtype=np.float64)
+    n = np.asarray(observations, dtype=np.float64)
+    p = 1 - confidence
+    rate = np.divide(x, n, out=np.zeros_like(x), where=n > 0)
+    statistic = -2 * (_xlogy(n - x, 1 - p) + _xlogy(x, p)
+                      - _xlogy(n - x, 1 - rate) - _xlogy(x, rate))
+    return statistic, chi2_pvalue(statistic, 1)
+
+
+def christoffersen_independence(hits: np.ndarray):
+    """
+    Christoffersen independence test: does an exceedance today make one
+    tomorrow more likely? Compares the exceedance rate after a quiet day with
+    the rate after an exceedance. Chi-squared with 1 degree of freedom.
+
+    Args:
+        hits: (days, ...) boolean exceedances
+    Returns:
+        (statistic, p-value), shaped like hits[0]
+    """
+    previous, current = hits[:-1], hits[1:]
+    n00 = np.sum(~previous & ~current, axis=0).astype(np.float64)
+    n01 = np.sum(~previous & current, axis=0).astype(np.float64)
+    n10 = np.sum(previous & ~current, axis=0).astype(np.float64)
+    n11 = np.sum(previous & current, axis=0).astype(np.float64)
+
+    def ratio(a, b):
+        return np.divide(a, a + b, out=np.zeros_like(a), where=(a + b) > 0)
+
+    pi0 = ratio(n01, n00)                 # P(exceedance | quiet day before)
+    pi1 = ratio(n11, n10)                 # P(exceedance | exceedance before)
+    pi = ratio(n01 + n11, n00 + n10)      # P(exceedance)
+    restricted = _xlogy(n00 + n10, 1 - pi) + _xlogy(n01 + n11, pi)
+    unrestricted = (_xlogy(n00, 1 - pi0) + _xlogy(n01, pi0)
+                    + _xlogy(n10, 1 - pi1) + _xlogy(n11, pi1))
+    statistic = -2 * (restricted - unrestricted)
+    return statistic, chi2_pvalue(statistic, 1)
+
+
+def backtest_var(portfolio_returns: np.ndarray, window: int,
+                 confidences: tuple = DEFAULT_CONFIDENCES) -> dict:
+    """
+    Rolls the historical VaR over the whole history and checks it against
+    what happened next: exceedance counts, Kupiec POF (right number of
+    exceedances?), Christoffersen independence (do they cluster?) and the
+    conditional coverage test combining both (2 degrees of freedom).
+
+    Args:
+        portfolio_returns: (days,) or (days × portfolios) daily returns
+        window: number of past days in each VaR estimate
+        confidences: confidence levels to test
+    Returns:
+        dict with "window", "confidences", "var" and "hits" ((days - window,
+        [portfolios,] levels) forecasts and exceedances), and per level and
+        portfolio: "observations", "exceedances", "expected", "kupiec_lr",
+        "kupiec_pvalue", "christoffersen_lr", "christoffersen_pvalue",
+        "conditional_coverage_lr", "conditional_coverage_pvalue"
+        ([portfolios,] levels arrays)
+    """
+    returns = np.asarray(portfolio_returns, dtype=np.float64)
+    var = rolling_var(returns, window, confidences)
+    realized = returns[window:]
+
+    # An exceedance: the day's loss was larger than the VaR forecast for it
+    hits = (-realized)[..., None] > var
+    observations = np.full(var.shape[1:], len(var), dtype=np.int64)
+    exceedances = hits.sum(axis=0)
+    levels = np.asarray(confidences, dtype=np.float64)
+
+    kupiec = [kupiec_pof(exceedances[..., k], observations[..., k], c) for k, c in enumerate(confidences)]
+    kupiec_lr = np.stack([lr for lr, _ in kupiec], axis=-1)
+    independence_lr, independence_pvalue = christoffersen_independence(hits)
+    coverage_lr = kupiec_lr + independence_lr
+
+    return {
+        "window": window,
+        "confidences": list(confidences),
+        "var": var,
+        "hits": hits,
+        "observations": observations,
+        "exceedances": exceedances,
+        "expected": observations * (1 - levels),
+        "kupiec_lr": kupiec_lr,
+        "kupiec_pvalue": np.stack([p for _, p in kupiec], axis=-1),
+        "christoffersen_lr": independence_lr,
+        "christoffersen_pvalue": independence_pvalue,
+        "conditional_coverage_lr": coverage_lr,
+        "conditional_coverage_pvalue": chi2_pvalue(coverage_lr, 2)
+    }
+
+
+def summarize_backtest(backtest: dict, dates: np.ndarray = None) -> dict:
+    """
+    One portfolio's backtest as plain numbers for the state and the report:
+    the rolling VaR series stays an array, the test results become one dict
+    per confidence level.
+
+    Args:
+        backtest: backtest_var() result for a single (days,) portfolio
+        dates: optional datetime64 date of every row of the returns
+    """
+    window = backtest["window"]
+    results = []
+    for k, confidence in enumerate(backtest["confidences"]):
+        results.append({
+            "confidence": confidence,
+            "observations": int(backtest["observations"][k]),
+            "exceedances": int(backtest["exceedances"][k]),
+            "expected": round(float(backtest["expected"][k]), 2),
+            "kupiec_lr": round(float(backtest["kupiec_lr"][k]), 4),
+            "kupiec_pvalue": round(float(backtest["kupiec_pvalue"][k]), 4),
+            "christoffersen_lr": round(float(backtest["christoffersen_lr"][k]), 4),
+            "christoffersen_pvalue": round(float(backtest["christoffersen_pvalue"][k]), 4),
+            "conditional_coverage_pvalue": round(float(backtest["conditional_coverage_pvalue"][k]), 4),
+            "rejected": bool(backtest["conditional_coverage_pvalue"][k] < SIGNIFICANCE)
+        })
+    return {
+        "window": window,
+        "confidences": backtest["confidences"],
+        "dates": dates[window:] if dates is not None else None,
+        "var": backtest["var"],
+        "results": results
+    }
+
+
+def format_var_backtest(var_backtest: dict) -> str:
+    """ Formats summarize_backtest() results as the text block the report prompt uses. """
+    lines = [f"VaR Backtest (rolling {var_backtest['window']}-day historical VaR):"]
+    for r in var_backtest["results"]:
+        verdict = "REJECTED" if r["rejected"] else "not rejected"
+        lines.append(
+            f"  • {r['confidence'] * 100:.0f}%: {r['exceedances']} exceedances in "
+            f"{r['observations']} days (expected {r['expected']:.1f}) — "
+            f"Kupiec p={r['kupiec_pvalue']:.3f}, Christoffersen p={r['christoffersen_pvalue']:.3f}, "
+            f"conditional coverage p={r['conditional_coverage_pvalue']:.3f} — "
+            f"model {verdict} at {SIGNIFICANCE * 100:.0f}%"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,34 @@
+import os
+import sqlite3
+
+from langgraph.checkpoint.sqlite import SqliteSaver as _SqliteSaver
+
+from tools.serialization import ArraySerializer
+
+# Where checkpoints are kept between runs. Can be set in .env
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", ".checkpoints.sqlite")
+
+
+class SqliteSaver(_SqliteSaver):
+    """
+    LangGraph checkpointer that keeps its checkpoints in a local SQLite file,
+    so a run that failed (e.g. the LLM call timed out) can be resumed from the
+    last completed node — even from another process.
+
+    It is langgraph-checkpoint-sqlite's SqliteSaver opened on CHECKPOINT_PATH
+    with the ArraySerializer, so NumPy arrays in the state keep their raw
+    bytes instead of going through JSON.
+
+    Usage:
+        app = risk_analyzer_graph(checkpointer=SqliteSaver())
+        config = {"configurable": {"thread_id": "client_a"}}
+        app.invoke(initial_state, config)   # fails in node d
+        app.invoke(None, config)            # resumes at node d
+    """
+
+    def __init__(self, path: str = None, *, serde=None):
+        self.path = path or CHECKPOINT_PATH
+        # The graph may run nodes on worker threads — the saver serializes
+        # access to the connection with its own lock
+        connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        super().__init__(connection, serde=serde or ArraySerializer())
@@ -0,0 +1,172 @@
+import numpy as np
+
+# Above this many assets the correlation matrix is built block by block in float32,
+# which halves its memory and keeps the intermediate products cache sized
+BLOCKWISE_THRESHOLD = 2000
+DEFAULT_BLOCK_SIZE = 512
+
+
+def _standardized_blocks(returns: np.ndarray, dtype):
+    """
+    Complete returns: every column standardized once (and scaled by 1/√days),
+    so the correlation block of columns i and j is one product z_iᵀ z_j.
+
+    Returns:
+        (block function, per-asset "has a correlation with itself" mask)
+    """
+    z = (returns - returns.mean(axis=0)).astype(dtype)
+    std = z.std(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z /= std
+    z /= dtype(np.sqrt(len(returns)))
+    return (lambda i, j: z[:, i].T @ z[:, j]), std > 0
+
+
+def _pairwise_complete_blocks(returns: np.ndarray, dtype):
+    """
+    Masked returns: correlation over the days both assets have a return
+    (NaN = missing). Still a handful of matrix products rather than one
+    corrcoef per pair — the per-pair counts, sums and sums of squares of a
+    block all come out of GEMMs over that block's columns only.
+
+    Returns:
+        (block function, per-asset "has a correlation with itself" mask)
+    """
+    valid = ~np.isnan(returns)
+    counts = valid.sum(axis=0)
+    # Correlation is shift invariant — centring first keeps the float32
+    # differences below from cancelling
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nansum(returns, axis=0) / counts
+    x = np.nan_to_num(returns - mean, nan=0.0).astype(dtype)
+    xx = x * x
+    v = valid.astype(dtype)
+
+    def block(i, j):
+        n = v[:, i].T @ v[:, j]               # days both assets have a return
+        sum_i = x[:, i].T @ v[:, j]           # Σx of the row asset over those days
+        sum_j = v[:, i].T @ x[:, j]           # Σx of the column asset over those days
+        var_i = n * (xx[:, i].T @ v[:, j]) - sum_i * sum_i
+        var_j = n * (v[:, i].T @ xx[:, j]) - sum_j * sum_j
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = (n * (x[:, i].T @ x[:, j]) - sum_i * sum_j) / np.sqrt(var_i * var_j)
+        corr[n < 2] = np.nan
+        return corr
+
+    return block, (counts >= 2) & (xx.sum(axis=0) > 0)
+
+
+def correlation_matrix(returns: np.ndarray, blockwise: bool = None,
+                       block_size: int = DEFAULT_BLOCK_SIZE, out_path: str = None) -> np.ndarray:
+    """
+    Correlation matrix of every pair of assets in one vectorized pass.
+
+    Args:
+        returns: (days × assets) returns matrix — NaN entries are treated as
+            missing, and each pair uses the days both assets have a return
+        blockwise: build the matrix in float32 blocks (default: only when the
+            universe has more than BLOCKWISE_THRESHOLD assets)
+        block_size: number of assets per block in blockwise mode
+        out_path: optional .npy path — in blockwise mode the result is written
+            straight into a memory-mapped file there instead of RAM
+    Returns:
+        (assets × assets) correlation matrix (float64, or float32 in blockwise mode)
+    """
+    num_assets = returns.shape[1]
+    if blockwise is None:
+        blockwise = num_assets > BLOCKWISE_THRESHOLD
+    dtype = np.float32 if blockwise else np.float64
+
+    # Masked returns need per-pair day counts — the GEMM formulation handles
+    # them, block by block like complete returns
+    if np.isnan(returns).any():
+        block, defined = _pairwise_complete_blocks(returns, dtype)
+    else:
+        block, defined = _standardized_blocks(returns, dtype)
+
+    if not blockwise:
+        # One block covering every pair
+        corr = block(slice(None), slice(None))
+        np.fill_diagonal(corr, np.where(defined, 1.0, np.nan))
+        return corr
+
+    # Blockwise float32 mode — fill the upper triangle block by block and
+    # mirror it, so only one block's products are live at a time
+    if out_path:
+        corr = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.float32,
+                                         shape=(num_assets, num_assets))
+    else:
+        corr = np.empty((num_assets, num_assets), dtype=np.float32)
+
+    for i in range(0, num_assets, block_size):
+        rows = slice(i, i + block_size)
+        for j in range(i, num_assets, block_size):
+            columns = slice(j, j + block_size)
+            values = block(rows, columns)
+            corr[rows, columns] = values
+            if j != i:
+                corr[columns, rows] = values.T
+
+    np.fill_diagonal(corr, np.where(defined, 1.0, np.nan))
+    return corr
+
+
+def top_pairs(corr: np.ndarray, tickers: list, k: int = 10, lowest: bool = False,
+              block_size: int = DEFAULT_BLOCK_SIZE) -> list:
+    """
+    The k most (or least) correlated distinct pairs.
+
+    Rows are scanned block by block and only k candidates are kept per block,
+    so the n²/2 pair indices are never materialized.
+
+    Args:
+        corr: correlation matrix from correlation_matrix()
+        tickers: ticker for each row/column
+        k: number of pairs to return
+        lowest: return the most negatively correlated pairs instead
+    Returns:
+        list of (asset_a, asset_b, correlation), strongest first
+    """
+    n = len(tickers)
+    sign = -1.0 if lowest else 1.0
+    candidates = []
+
+    for start in range(0, n, block_size):
+        block = sign * np.asarray(corr[start:start + block_size], dtype=np.float64)
+        rows, cols = np.indices(block.shape)
+        rows += start
+        # Upper triangle only (a < b), and never NaN
+        valid = (cols > rows) & ~np.isnan(block)
+        values, rows, cols = block[valid], rows[valid], cols[valid]
+        if len(values) > k:
+            keep = np.argpartition(-values, k)[:k]
+            values, rows, cols = values[keep], rows[keep], cols[keep]
+        candidates.extend(zip(values, rows, cols))
+
+    candidates.sort(key=lambda c: -c[0])
+    return [(tickers[a], tickers[b], float(round(sign * v, 4))) for v, a, b in candidates[:k]]
+
+
+def nearest_neighbours(corr: np.ndarray, tickers: list, asset: str, k: int = 5) -> list:
+    """
+    The k assets most correlated with `asset`.
+
+    Args:
+        corr: correlation matrix from correlation_matrix()
+        tickers: ticker for each row/column
+        asset: ticker to look up
+        k: number of neighbours to return
+    Returns:
+        list of (ticker, correlation), most correlated first
+    """
+    i = tickers.index(asset)
+    row = np.asarray(corr[i], dtype=np.float64).copy()
+    row[i] = np.nan                           # never return the asset itself
+    row = np.where(np.isnan(row), -np.inf, row)
+
+    k = min(k, len(tickers) - 1)
+    if k <= 0:
+        return []
+    nearest = np.argpartition(-row, k - 1)[:k]
+    nearest = nearest[np.argsort(-row[nearest])]
+    return [(tickers[j], float(round(row[j], 4))) for j in nearest if np.isfinite(row[j])]
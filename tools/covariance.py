@@ -0,0 +1,150 @@
+from statistics import NormalDist
+
+import numpy as np
+
+from tools.risk_metrics import TRADING_DAYS
+
+# Confidence of the parametric VaR and its per-asset decomposition — the same
+# level as the headline historical VaR
+DEFAULT_CONFIDENCE = 0.95
+
+
+def ledoit_wolf(returns: np.ndarray) -> tuple:
+    """
+    Sample covariance shrunk towards a scaled identity (Ledoit & Wolf, 2004).
+
+    With few days per asset the sample covariance is noisy and close to
+    singular; shrinking it towards μI (μ = average variance) with the
+    intensity that minimizes the expected error keeps it well conditioned,
+    which the VaR decomposition needs for large books. Costs three GEMMs —
+    one pass over the days.
+
+    Args:
+        returns: (days × assets) returns without NaN
+    Returns:
+        (covariance, shrinkage) — (assets × assets) matrix and the intensity in [0, 1]
+    """
+    days, num_assets = returns.shape
+    x = returns - returns.mean(axis=0)
+    sample = x.T @ x / days
+    if days < 2 or num_assets == 0:
+        return sample, 0.0
+
+    mu = np.trace(sample) / num_assets
+    x2 = x * x
+    # How far the sample covariance is from the target, and how noisy it is
+    delta = (np.sum(sample ** 2) - 2 * mu * np.trace(sample) + num_assets * mu ** 2) / num_assets
+    beta = (np.sum(x2.T @ x2) / days - np.sum(sample ** 2)) / (num_assets * days)
+    shrinkage = float(min(beta, delta) / delta) if delta > 0 else 0.0
+
+    covariance = (1 - shrinkage) * sample
+    covariance[np.diag_indices(num_assets)] += shrinkage * mu
+    return covariance, shrinkage
+
+
+def estimate_covariance(returns: dict) -> dict:
+    """
+    Shrunk covariance of a returns window, computed once for every
+    covariance-based metric downstream.
+
+    Args:
+        returns: {"dates", "tickers", "returns"} window, e.g. from take_rows()
+    Returns:
+        {"tickers", "matrix" (assets × assets), "mean" (daily mean per asset),
+         "days", "shrinkage"}
+    """
+    matrix = returns["returns"]
+    # Masked (NaN) returns: only days every asset traded, as in tools/monte_carlo.py
+    complete = matrix[~np.isnan(matrix).any(axis=1)]
+    if len(complete) < 2:
+        complete = np.nan_to_num(matrix, nan=0.0)
+    covariance, shrinkage = ledoit_wolf(complete)
+    return {
+        "tickers": list(returns["tickers"]),
+        "matrix": covariance,
+        "mean": complete.mean(axis=0) if len(complete) else np.zeros(matrix.shape[1]),
+        "days": len(complete),
+        "shrinkage": round(shrinkage, 4)
+    }
+
+
+def risk_decomposition(covariance: dict, weights: np.ndarray,
+                       confidence: float = DEFAULT_CONFIDENCE) -> dict:
+    """
+    Portfolio volatility, parametric VaR and how much each position adds to
+    them — everything from w and Σ, O(assets²), no pass over the days.
+
+    σ = √(wᵀΣw); marginal volatility ∂σ/∂w = Σw / σ; component volatility
+    w · Σw / σ sums to σ. Parametric (normal) 1-day VaR = z·σ − wᵀμ, with
+    marginal VaR z·Σw/σ − μ and component VaR w · marginal VaR, which sum
+    to the VaR — so "which position drives the risk" is read straight off.
+
+    Args:
+        covariance: from estimate_covariance()
+        weights: (assets,) weights of one portfolio, or (assets × portfolios)
+            for many at once — one column each, like the rest of tools/
+        confidence: VaR confidence level
+    Returns:
+        dict with "confidence", "volatility" (daily σ), "annualized_volatility"
+        and "var" (one per portfolio), and the per asset (assets[, portfolios])
+        arrays "marginal_volatility", "component_volatility", "marginal_var",
+        "component_var" and "percent_of_var"
+    """
+    sigma = covariance["matrix"]
+    weights = np.asarray(weights, dtype=np.float64)
+    # Mean as a column, so it lines up with a weight matrix too
+    mean = covariance["mean"].reshape((-1,) + (1,) * (weights.ndim - 1))
+    z = NormalDist().inv_cdf(confidence)
+
+    sigma_w = sigma @ weights
+    volatility = np.sqrt(np.clip(np.sum(weights * sigma_w, axis=0), 0.0, None))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        marginal_volatility = np.where(volatility > 0, sigma_w / volatility, 0.0)
+    marginal_var = z * marginal_volatility - mean
+    component_var = weights * marginal_var
+    value_at_risk = z * volatility - np.sum(weights * mean, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        percent_of_var = np.where(value_at_risk != 0, component_var / value_at_risk, 0.0)
+
+    return {
+        "confidence": confidence,
+        "volatility": volatility,
+        "annualized_volatility": volatility * np.sqrt(TRADING_DAYS),
+        "var": value_at_risk,
+        "marginal_volatility": marginal_volatility,
+        "component_volatility": weights * marginal_volatility,
+        "marginal_var": marginal_var,
+        "component_var": component_var,
+        "percent_of_var": percent_of_var
+    }
+
+
+def top_contributors(tickers: list, contribution: np.ndarray, k: int = 10) -> list:
+    """ The k positions with the largest contribution, largest first: (ticker, index). """
+    k = min(k, len(tickers))
+    if k <= 0:
+        return []
+    top = np.argpartition(-contribution, k - 1)[:k]
+    top = top[np.argsort(-contribution[top])]
+    return [(tickers[i], int(i)) for i in top]
+
+
+def format_risk_decomposition(parametric_var: dict, risk_contributions: dict = None, k: int = 10) -> str:
+    """ Formats the parametric VaR and the biggest risk contributors as text for the report. """
+    tickers = parametric_var["tickers"]
+    lines = [f"Parametric VaR ({parametric_var['confidence'] * 100:.0f}%, Ledoit-Wolf covariance, "
+             f"shrinkage {parametric_var['shrinkage']:.2f}): {parametric_var['var'] * 100:.2f}%"]
+    if risk_contributions:
+        lines.append(f"Portfolio volatility: {risk_contributions['volatility'] * 100:.1f}% annualized")
+
+    lines.append(f"Largest contributors to VaR (top {min(k, len(tickers))} of {len(tickers)}):")
+    percent_of_volatility = dict(zip(risk_contributions["tickers"], risk_contributions["percent"])) \
+        if risk_contributions else {}
+    for asset, i in top_contributors(tickers, np.asarray(parametric_var["component_var"]), k):
+        line = (f"  • {asset}: component VaR {parametric_var['component_var'][i] * 100:.2f}% "
+                f"({parametric_var['percent_of_var'][i] * 100:.1f}% of VaR), "
+                f"marginal VaR {parametric_var['marginal_var'][i] * 100:.2f}%")
+        if asset in percent_of_volatility:
+            line += f", {percent_of_volatility[asset] * 100:.1f}% of volatility"
+        lines.append(line)
+    return "\n".join(lines)
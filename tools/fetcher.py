@@ -0,0 +1,192 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from tools.instrumentation import record_external
+
+logger = logging.getLogger(__name__)
+
+# Fetch settings — all can be set in .env
+CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", "100"))        # tickers per request
+MAX_WORKERS = int(os.getenv("FETCH_WORKERS", "4"))            # requests in flight at once
+RATE = float(os.getenv("FETCH_RATE", "2"))                    # requests per second, sustained
+BURST = int(os.getenv("FETCH_BURST", "4"))                    # requests allowed back to back
+RETRIES = int(os.getenv("FETCH_RETRIES", "3"))                # extra attempts per chunk
+BACKOFF = float(os.getenv("FETCH_BACKOFF", "0.5"))            # first retry waits up to this many seconds
+MAX_BACKOFF = 8.0
+
+
+class EmptyChunk(Exception):
+    """ A request for several tickers came back with nothing at all — almost
+    always throttling or a network problem rather than bad symbols. """
+
+
+class FetchResult(dict):
+    """
+    Prices from one fetch — ticker -> (dates, closes), like any provider's —
+    plus `failures`, ticker -> reason for every ticker that could not be
+    fetched. Failures travel with the result of the call they belong to, so
+    concurrent fetches through one fetcher never see each other's.
+    """
+
+    def __init__(self, prices: dict = None, failures: dict = None):
+        super().__init__(prices or {})
+        self.failures = dict(failures or {})
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second refill a bucket holding
+    at most `capacity`. Every request takes one token and waits only as long
+    as it takes for one to be available — bursts go out at once, sustained
+    load is held at `rate`.
+    """
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """ Takes one token, sleeping until there is one. Returns the seconds waited. """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+
+def has_sessions(start, end) -> bool:
+    """ Whether [start, end) holds at least one weekday — a window of only
+    weekend days has no trading sessions, so an empty answer is the right one. """
+    return np.busday_count(np.datetime64(start, "D"), np.datetime64(end, "D")) > 0
+
+
+def _backoff(attempt: int, base: float) -> float:
+    """ "Full jitter" exponential backoff: uniform in [0, base · 2^attempt],
+    so clients that failed together don't retry together. """
+    return random.uniform(0, min(MAX_BACKOFF, base * 2 ** attempt))
+
+
+class ChunkedFetcher:
+    """
+    Price provider for large ticker lists.
+
+    Splits the tickers into chunks, downloads the chunks on a bounded thread
+    pool, holds the request rate to a token bucket and retries a failed chunk
+    with jittered exponential backoff. A chunk that still fails is split in
+    half and retried, so one bad ticker never loses the other 99. Whatever
+    could not be fetched is reported in the result's `failures` — the result
+    is partial rather than an exception.
+
+    Has the price provider signature (tickers, start, end) -> dict of
+    ticker -> (dates, closes) — the dict is a FetchResult — so it wraps any
+    provider, e.g.
+        ChunkedFetcher(SyntheticPriceProvider(latency=0.2, error_rate=0.1))
+    """
+
+    def __init__(self, download=None, chunk_size: int = None, max_workers: int = None,
+                 rate: float = None, burst: int = None, retries: int = None,
+                 backoff: float = None):
+        """
+        Args:
+            download: provider for one chunk (defaults to yfinance, download_closes)
+            chunk_size: tickers per request (default FETCH_CHUNK_SIZE)
+            max_workers: requests in flight at once (default FETCH_WORKERS)
+            rate: sustained requests per second (default FETCH_RATE)
+            burst: requests allowed back to back (default FETCH_BURST)
+            retries: extra attempts per chunk before it is split (default FETCH_RETRIES)
+            backoff: base of the jittered backoff in seconds (default FETCH_BACKOFF)
+        """
+        if download is None:
+            from tools.price_simulator import download_closes
+            download = download_closes
+        self.download = download
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self.max_workers = max_workers or MAX_WORKERS
+        self.bucket = TokenBucket(rate or RATE, burst or BURST)
+        self.retries = RETRIES if retries is None else retries
+        self.backoff = BACKOFF if backoff is None else backoff
+
+    def _attempt(self, chunk: list, start, end) -> dict:
+        """ One chunk with retries. Raises the last error when every attempt failed. """
+        for attempt in range(self.retries + 1):
+            waited = self.bucket.acquire()
+            started = time.perf_counter()
+            try:
+                prices = self.download(chunk, start, end)
+                # Nothing at all is only suspicious when sessions were expected
+                if not prices and len(chunk) > 1 and has_sessions(start, end):
+                    raise EmptyChunk(f"no data for any of {len(chunk)} tickers")
+                record_external("price_chunk", time.perf_counter() - started,
+                                tickers=len(chunk), returned=len(prices), attempt=attempt,
+                                throttled_seconds=round(waited, 6))
+                return prices
+            except Exception as e:
+                record_external("price_chunk", time.perf_counter() - started,
+                                tickers=len(chunk), attempt=attempt, error=repr(e))
+                if attempt == self.retries:
+                    raise
+                delay = _backoff(attempt, self.backoff)
+                logger.info(f"[Fetch] {len(chunk)} tickers failed ({e!r}), retry {attempt + 1} "
+                            f"of {self.retries} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _fetch_chunk(self, chunk: list, start, end, failures: dict) -> dict:
+        """ A chunk, bisected on final failure down to single tickers.
+        Tickers given up on are added to `failures` (this call's own dict). """
+        try:
+            return self._attempt(chunk, start, end)
+        except Exception as e:
+            if len(chunk) == 1:
+                logger.warning(f"[Fetch] Giving up on {chunk[0]}: {e!r}")
+                failures[chunk[0]] = repr(e)
+                return {}
+            half = len(chunk) // 2
+            logger.info(f"[Fetch] Splitting a failed chunk of {len(chunk)} tickers")
+            return {**self._fetch_chunk(chunk[:half], start, end, failures),
+                    **self._fetch_chunk(chunk[half:], start, end, failures)}
+
+    def __call__(self, tickers: list, start, end) -> FetchResult:
+        chunks = [list(tickers[i:i + self.chunk_size]) for i in range(0, len(tickers), self.chunk_size)]
+        result = FetchResult()
+        if not chunks:
+            return result
+
+        # Every chunk of this call adds to the same dict — single-key
+        # assignments from the pool threads are atomic under the GIL
+        failures = result.failures
+        if len(chunks) == 1:
+            result.update(self._fetch_chunk(chunks[0], start, end, failures))
+        else:
+            # Worker threads start with an empty context — hand each one ours,
+            # so its price_chunk calls land in the calling node's trace
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(chunks)),
+                                    thread_name_prefix="fetch") as pool:
+                futures = [pool.submit(contextvars.copy_context().run, self._fetch_chunk,
+                                       chunk, start, end, failures)
+                           for chunk in chunks]
+                for future in futures:
+                    result.update(future.result())
+
+        # Tickers the provider answered for without prices are not failures
+        # (unknown symbol, not listed yet) — they are simply left out
+        if failures:
+            logger.warning(f"[Fetch] {len(failures)} of {len(tickers)} tickers failed: "
+                           f"{sorted(failures)[:10]}{' ...' if len(failures) > 10 else ''}")
+        return result
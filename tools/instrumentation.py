@@ -0,0 +1,245 @@
+import contextvars
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+from langchain_core.runnables import RunnableLambda
+
+logger = logging.getLogger(__name__)
+
+# Exporters and memory tracing can be set in .env
+TRACE_JSONL_PATH = os.getenv("TRACE_JSONL_PATH")            # one JSON line per node run
+TRACE_PROMETHEUS_PATH = os.getenv("TRACE_PROMETHEUS_PATH")  # node_exporter textfile (*.prom)
+# tracemalloc sees every NumPy allocation but slows pure-Python code down, so it is opt-in
+TRACE_MEMORY = os.getenv("TRACE_MEMORY", "0").lower() not in ("0", "false", "no")
+
+# External calls (price fetch, LLM) made while a node runs are collected here
+_external_calls = contextvars.ContextVar("external_calls", default=None)
+
+
+def record_external(call: str, seconds: float, **details) -> None:
+    """
+    Records one call to an outside service in the trace of the node making it.
+    Does nothing outside an instrumented node.
+
+    Args:
+        call: name of the service, e.g. "price_fetch" or "llm"
+        seconds: how long the call took
+        details: anything else worth keeping, e.g. tickers=10 or tokens=350
+    """
+    calls = _external_calls.get()
+    if calls is not None:
+        calls.append({"call": call, "seconds": round(seconds, 6), **details})
+
+
+def _input_size(state: dict, update: dict) -> dict:
+    """ Assets × days the node worked on — from the returns matrix in the
+    state, or in the node's own output for node a. """
+    for source in (state, update or {}):
+        returns = (source.get("returns") or {}).get("returns")
+        if returns is not None:
+            return {"assets": int(returns.shape[1]), "days": int(returns.shape[0])}
+    return {"assets": len(state.get("portfolio") or {}), "days": None}
+
+
+class _Span:
+    """ Measures one node run: wall and CPU time, traced peak memory and external calls. """
+
+    def __init__(self, node: str, config: dict):
+        self.node = node
+        self.thread_id = ((config or {}).get("configurable") or {}).get("thread_id")
+
+    def start(self):
+        if TRACE_MEMORY:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            # The peak is process-wide: nodes running in parallel share it
+            tracemalloc.reset_peak()
+        self.calls = []
+        self.token = _external_calls.set(self.calls)
+        self.started_at = time.time()
+        self.wall = time.perf_counter()
+        # Process CPU time includes BLAS threads, and nodes running in parallel
+        self.cpu = time.process_time()
+        return self
+
+    def finish(self, state: dict, update: dict, error: BaseException = None) -> dict:
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        _external_calls.reset(self.token)
+
+        span = {
+            "node": self.node,
+            "started_at": round(self.started_at, 6),
+            "wall_seconds": round(wall, 6),
+            "cpu_seconds": round(cpu, 6),
+            "peak_memory_mb": round(tracemalloc.get_traced_memory()[1] / 2**20, 3) if TRACE_MEMORY else None,
+            **_input_size(state, update),
+            "external": self.calls,
+            "error": repr(error) if error is not None else None
+        }
+        if self.thread_id is not None:
+            span["thread_id"] = self.thread_id
+
+        logger.debug(f"[Trace] {self.node}: {wall:.3f}s wall, {cpu:.3f}s CPU"
+                     + "".join(f", {c['call']} {c['seconds']:.3f}s" for c in self.calls))
+        for exporter in list(_exporters):
+            try:
+                exporter.export(span)
+            except OSError as e:
+                logger.warning(f"[Trace] {type(exporter).__name__} failed: {e}")
+        return span
+
+
+def instrument(name: str, func, afunc=None) -> RunnableLambda:
+    """
+    Wraps a node (and its async variant) so every run adds a span to the
+    state's "trace" list and goes to the configured exporters.
+
+    Args:
+        name: node name, as registered in the graph
+        func: sync node function, taking (state) or (state, config)
+        afunc: optional async node function with the same signature
+    Returns:
+        RunnableLambda to pass to graph.add_node
+    """
+    takes_config = "config" in inspect.signature(func).parameters
+
+    def run(state, config=None):
+        span = _Span(name, config).start()
+        try:
+            update = func(state, config) if takes_config else func(state)
+        except Exception as e:
+            span.finish(state, None, e)
+            raise
+        return {**update, "trace": [span.finish(state, update)]}
+
+    if afunc is None:
+        return RunnableLambda(run, name=name)
+
+    async def arun(state, config=None):
+        span = _Span(name, config).start()
+        try:
+            update = await (afunc(state, config) if takes_config else afunc(state))
+        except Exception as e:
+            span.finish(state, None, e)
+            raise
+        return {**update, "trace": [span.finish(state, update)]}
+
+    return RunnableLambda(run, afunc=arun, name=name)
+
+
+def format_trace(trace: list) -> str:
+    """ One line per node: wall and CPU time, input size, memory and external calls. """
+    lines = []
+    for span in trace or []:
+        external = ", ".join(f"{c['call']}{' hit' if c.get('hit') else ''} {c['seconds']:.2f}s"
+                             for c in span["external"])
+        size = f"{span['assets']} assets × {span['days']} days" if span.get("days") else f"{span['assets']} assets"
+        memory = f", peak {span['peak_memory_mb']:.1f} MB" if span.get("peak_memory_mb") is not None else ""
+        lines.append(f"  {span['node']:<18} {span['wall_seconds']:7.3f}s wall  "
+                     f"{span['cpu_seconds']:7.3f}s CPU  ({size}{memory})"
+                     + (f"  [{external}]" if external else ""))
+    return "\n".join(lines)
+
+
+class JsonLinesExporter:
+    """ Appends every span as one JSON line — easy to load with pandas.read_json(lines=True). """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: dict) -> None:
+        line = json.dumps(span, default=str)
+        with self._lock, open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class PrometheusTextfileExporter:
+    """
+    Keeps running totals per node and external call and rewrites a Prometheus
+    text file (for node_exporter's textfile collector) after every span.
+    The file is replaced atomically, so the collector never reads half of it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.nodes = {}
+        self.calls = {}
+
+    def export(self, span: dict) -> None:
+        with self._lock:
+            node = self.nodes.setdefault(span["node"], {
+                "runs": 0, "errors": 0, "wall": 0.0, "cpu": 0.0, "last_wall": 0.0, "peak_bytes": None
+            })
+            node["runs"] += 1
+            node["errors"] += span["error"] is not None
+            node["wall"] += span["wall_seconds"]
+            node["cpu"] += span["cpu_seconds"]
+            node["last_wall"] = span["wall_seconds"]
+            if span["peak_memory_mb"] is not None:
+                node["peak_bytes"] = int(span["peak_memory_mb"] * 2**20)
+
+            for c in span["external"]:
+                call = self.calls.setdefault(c["call"], {"count": 0, "seconds": 0.0, "tokens": 0})
+                call["count"] += 1
+                call["seconds"] += c["seconds"]
+                call["tokens"] += c.get("tokens", 0)
+
+            self._write()
+
+    def _write(self) -> None:
+        prefix = "risk_analyzer"
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for label, value in samples:
+                lines.append(f"{prefix}_{name}{{{label}}} {value}")
+
+        def nodes(key):
+            return [(f'node="{n}"', v[key]) for n, v in sorted(self.nodes.items()) if v[key] is not None]
+
+        def calls(key):
+            return [(f'call="{c}"', v[key]) for c, v in sorted(self.calls.items())]
+
+        metric("node_runs_total", "counter", "Node runs.", nodes("runs"))
+        metric("node_errors_total", "counter", "Node runs that raised.", nodes("errors"))
+        metric("node_wall_seconds_total", "counter", "Wall time spent in each node.", nodes("wall"))
+        metric("node_cpu_seconds_total", "counter", "Process CPU time while each node ran.", nodes("cpu"))
+        metric("node_last_wall_seconds", "gauge", "Wall time of the latest run.", nodes("last_wall"))
+        metric("node_peak_memory_bytes", "gauge", "Traced peak memory of the latest run.", nodes("peak_bytes"))
+        metric("external_calls_total", "counter", "Calls to external services.", calls("count"))
+        metric("external_call_seconds_total", "counter", "Time spent waiting on external services.", calls("seconds"))
+        metric("external_call_tokens_total", "counter", "LLM tokens received.", calls("tokens"))
+
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.path)
+
+
+# Exporters every span is sent to — set up from .env, more can be added with add_exporter
+_exporters = []
+if TRACE_JSONL_PATH:
+    _exporters.append(JsonLinesExporter(TRACE_JSONL_PATH))
+if TRACE_PROMETHEUS_PATH:
+    _exporters.append(PrometheusTextfileExporter(TRACE_PROMETHEUS_PATH))
+
+
+def add_exporter(exporter) -> None:
+    """ Sends every span from now on to `exporter` (anything with an export(span) method). """
+    _exporters.append(exporter)
+
+
+def remove_exporter(exporter) -> None:
+    """ Stops sending spans to `exporter`. """
+    if exporter in _exporters:
+        _exporters.remove(exporter)
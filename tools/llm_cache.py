@@ -0,0 +1,117 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# Where cached reports live and when they are evicted. All can be set in .env
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite")
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1").lower() not in ("0", "false", "no")
+CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_DAYS", "7")) * 24 * 3600
+
+# One lock for the whole process — sqlite handles other processes itself
+_lock = threading.Lock()
+
+# Hit / miss counters for this process
+_stats = {"hits": 0, "misses": 0, "saved_seconds": 0.0}
+
+
+def normalize_prompt(prompt: str) -> str:
+    """ Strips indentation and runs of whitespace, so prompts that only differ
+    in formatting share a cache entry. """
+    lines = (re.sub(r"\s+", " ", line).strip() for line in prompt.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def cache_key(model: str, prompt: str) -> str:
+    """ Content address of a report: hash of the model name plus the normalized prompt.
+    Only valid for temperature-0 calls, where the same prompt gives the same report. """
+    digest = hashlib.sha256()
+    digest.update(model.encode())
+    digest.update(b"\0")
+    digest.update(normalize_prompt(prompt).encode())
+    return digest.hexdigest()
+
+
+@contextmanager
+def _connect(path: str):
+    """ Opens the cache database, commits on success and always closes it. """
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS reports (
+                   key TEXT PRIMARY KEY,
+                   model TEXT,
+                   final_report TEXT,
+                   risk_rating TEXT,
+                   latency REAL,
+                   created REAL,
+                   last_used REAL,
+                   hits INTEGER DEFAULT 0
+               )"""
+        )
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def get_report(key: str, path: str = None):
+    """
+    Looks up a cached report.
+
+    Returns:
+        dict with "final_report", "risk_rating" and "latency" (how long the
+        original LLM call took), or None on a miss or an expired entry
+    """
+    now = time.time()
+    with _lock, _connect(path or CACHE_PATH) as connection:
+        row = connection.execute(
+            "SELECT final_report, risk_rating, latency, created FROM reports WHERE key = ?",
+            (key,)
+        ).fetchone()
+
+        if row is None or now - row[3] > CACHE_TTL_SECONDS:
+            _stats["misses"] += 1
+            return None
+
+        connection.execute(
+            "UPDATE reports SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key)
+        )
+        _stats["hits"] += 1
+        _stats["saved_seconds"] += row[2]
+        return {"final_report": row[0], "risk_rating": row[1], "latency": row[2]}
+
+
+def put_report(key: str, model: str, final_report: str, risk_rating: str,
+               latency: float, path: str = None) -> None:
+    """ Stores a report, then evicts expired entries and the least recently
+    used ones above CACHE_MAX_ENTRIES. """
+    now = time.time()
+    with _lock, _connect(path or CACHE_PATH) as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO reports "
+            "(key, model, final_report, risk_rating, latency, created, last_used, hits) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            (key, model, final_report, risk_rating, latency, now, now)
+        )
+        connection.execute("DELETE FROM reports WHERE created < ?", (now - CACHE_TTL_SECONDS,))
+        connection.execute(
+            "DELETE FROM reports WHERE key NOT IN "
+            "(SELECT key FROM reports ORDER BY last_used DESC LIMIT ?)",
+            (CACHE_MAX_ENTRIES,)
+        )
+
+
+def cache_stats() -> dict:
+    """ Hit rate and LLM time saved by the cache in this process. """
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        "hits": _stats["hits"],
+        "misses": _stats["misses"],
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0,
+        "saved_seconds": round(_stats["saved_seconds"], 3)
+    }
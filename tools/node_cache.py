@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+from tools.instrumentation import record_external
+from tools.serialization import ArraySerializer
+
+# Where node results are cached and when they are evicted. All can be set in .env
+CACHE_PATH = os.getenv("NODE_CACHE_PATH", ".node_cache.sqlite")
+CACHE_ENABLED = os.getenv("NODE_CACHE", "1").lower() not in ("0", "false", "no")
+CACHE_MAX_ENTRIES = int(os.getenv("NODE_CACHE_MAX_ENTRIES", "200"))
+CACHE_TTL_SECONDS = float(os.getenv("NODE_CACHE_TTL_DAYS", "7")) * 24 * 3600
+# Eviction runs on the first store of the process and then once every this many stores
+EVICT_EVERY = int(os.getenv("NODE_CACHE_EVICT_EVERY", "50"))
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _code_version() -> str:
+    """ Hash of every module a node result depends on — editing any of them
+    invalidates all cached results. """
+    digest = hashlib.sha256()
+    for path in sorted([_ROOT / "state.py", *(_ROOT / "nodes").glob("*.py"), *(_ROOT / "tools").glob("*.py")]):
+        digest.update(path.name.encode())
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+CODE_VERSION = _code_version()
+
+# One lock for the whole process — sqlite handles other processes itself
+_lock = threading.Lock()
+_serializer = ArraySerializer()
+
+# Hit / miss counters for this process
+_stats = {"hits": 0, "misses": 0}
+# Stores since the last eviction, per cache file
+_stores = {}
+
+
+def fingerprint(node: str, *inputs) -> str:
+    """
+    Content address of a node result: the node name, the code version and
+    every input the node reads. Dicts are hashed with sorted keys, arrays by
+    their bytes, so equal inputs always give the same fingerprint.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{node}\0{CODE_VERSION}".encode())
+
+    def add(value):
+        if isinstance(value, np.ndarray):
+            digest.update(f"\0{value.dtype.str}{value.shape}".encode())
+            digest.update(np.ascontiguousarray(value).view(np.uint8).data)
+        elif isinstance(value, dict):
+            for key in sorted(value, key=str):
+                digest.update(f"\0{key}=".encode())
+                add(value[key])
+        elif isinstance(value, (list, tuple)):
+            digest.update(b"\0[")
+            for item in value:
+                add(item)
+            digest.update(b"]")
+        else:
+            digest.update(b"\0" + json.dumps(value, default=str).encode())
+
+    for value in inputs:
+        add(value)
+    return digest.hexdigest()
+
+
+@contextmanager
+def _connect(path: str):
+    """ Opens the cache database, commits on success and always closes it. """
+    connection = sqlite3.connect(path, timeout=30)
+    try:
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                   key TEXT PRIMARY KEY,
+                   node TEXT,
+                   type TEXT,
+                   value BLOB,
+                   seconds REAL,
+                   created REAL,
+                   last_used REAL,
+                   hits INTEGER DEFAULT 0
+               )"""
+        )
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def get_result(key: str, path: str = None):
+    """
+    Looks up a cached node result.
+
+    Returns:
+        the node's state update, or None on a miss or an expired entry.
+        Arrays in it are read-only.
+    """
+    now = time.time()
+    with _lock, _connect(path or CACHE_PATH) as connection:
+        row = connection.execute(
+            "SELECT type, value, created FROM results WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is None or now - row[2] > CACHE_TTL_SECONDS:
+            _stats["misses"] += 1
+            return None
+
+        connection.execute(
+            "UPDATE results SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key)
+        )
+        _stats["hits"] += 1
+    return _serializer.loads_typed((row[0], row[1]))
+
+
+def put_result(key: str, node: str, update: dict, seconds: float, path: str = None) -> None:
+    """ Stores a node result. Expired entries and the least recently used ones
+    above CACHE_MAX_ENTRIES are evicted on the process's first store and then
+    every EVICT_EVERY stores, not on each one — the table may briefly hold up
+    to EVICT_EVERY entries more than the cap. """
+    path = path or CACHE_PATH
+    type_, value = _serializer.dumps_typed(update)
+    now = time.time()
+    with _lock, _connect(path) as connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO results "
+            "(key, node, type, value, seconds, created, last_used, hits) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, 0)",
+            (key, node, type_, value, seconds, now, now)
+        )
+        stores = _stores.get(path, 0)
+        _stores[path] = (stores + 1) % max(EVICT_EVERY, 1)
+        if stores == 0:
+            _evict(connection, now)
+
+
+def _evict(connection, now: float) -> None:
+    """ Drops expired entries and the least recently used ones above CACHE_MAX_ENTRIES. """
+    connection.execute("DELETE FROM results WHERE created < ?", (now - CACHE_TTL_SECONDS,))
+    connection.execute(
+        "DELETE FROM results WHERE key NOT IN "
+        "(SELECT key FROM results ORDER BY last_used DESC LIMIT ?)",
+        (CACHE_MAX_ENTRIES,)
+    )
+
+
+def cache_stats() -> dict:
+    """ Hit rate of the node cache in this process. """
+    lookups = _stats["hits"] + _stats["misses"]
+    return {
+        "hits": _stats["hits"],
+        "misses": _stats["misses"],
+        "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0
+    }
+
+
+def _enabled(config: dict) -> bool:
+    """ The cache is on unless NODE_CACHE=0 or config["configurable"]["node_cache"] is False. """
+    configurable = (config or {}).get("configurable") or {}
+    return CACHE_ENABLED and configurable.get("node_cache", True)
+
+
+def memoize(name: str, key_func, func, afunc=None):
+    """
+    Wraps a node (and its async variant) so its result is reused whenever
+    key_func gives a fingerprint that was seen before. Wrap before
+    instrument(), so cache lookups show up in the node's trace span.
+
+    Args:
+        name: node name, as registered in the graph
+        key_func: (state, config) -> fingerprint, or None when the result
+            must not be cached (e.g. prices from a stand-in provider)
+        func: sync node function, taking (state) or (state, config)
+        afunc: optional async node function with the same signature
+    Returns:
+        (sync, async) node functions taking (state, config)
+    """
+    takes_config = "config" in inspect.signature(func).parameters
+
+    def lookup(state, config):
+        if not _enabled(config):
+            return None, None
+        key = key_func(state, config)
+        if key is None:
+            return None, None
+        started = time.perf_counter()
+        update = get_result(key)
+        record_external("node_cache", time.perf_counter() - started, hit=update is not None)
+        return key, update
+
+    def store(key, update, seconds):
+        if key is not None:
+            put_result(key, name, update, seconds)
+
+    def run(state, config=None):
+        key, update = lookup(state, config)
+        if update is not None:
+            return update
+        started = time.perf_counter()
+        update = func(state, config) if takes_config else func(state)
+        store(key, update, time.perf_counter() - started)
+        return update
+
+    if afunc is None:
+        return run, None
+
+    async def arun(state, config=None):
+        key, update = await asyncio.to_thread(lookup, state, config)
+        if update is not None:
+            return update
+        started = time.perf_counter()
+        update = await (afunc(state, config) if takes_config else afunc(state))
+        await asyncio.to_thread(store, key, update, time.perf_counter() - started)
+        return update
+
+    return run, arun
@@ -0,0 +1,263 @@
+from collections import deque
+
+import numpy as np
+
+from tools.risk_metrics import historical_var, TRADING_DAYS, RISK_FREE_RATE
+from tools.stress_test import max_drawdown
+
+# The co-moment matrix is rebuilt exactly from the VaR window buffer every this
+# many updates, so rounding from repeated add / remove steps never accumulates
+REBASE_EVERY = 21
+
+
+def _cutoff(last_date: np.datetime64, days: int) -> np.datetime64:
+    """ First date inside a `days` calendar-day window ending at last_date
+    (same window tools.price_simulator.slice_window uses). """
+    return last_date + np.timedelta64(1, "D") - np.timedelta64(days, "D")
+
+
+def _rebase(stats: dict) -> None:
+    """ Mean and co-moment matrix recomputed from the rows in the VaR window. """
+    rows = stats["var_rows"]
+    stats["count"] = len(rows)
+    stats["mean"] = rows.mean(axis=0) if len(rows) else np.zeros(rows.shape[1])
+    centered = rows - stats["mean"]
+    stats["comoment"] = centered.T @ centered
+    stats["since_rebase"] = 0
+
+
+def _add_row(stats: dict, x: np.ndarray) -> None:
+    """ Welford step: adds one day of asset returns to the mean and co-moments. """
+    stats["count"] += 1
+    delta = x - stats["mean"]
+    stats["mean"] = stats["mean"] + delta / stats["count"]
+    stats["comoment"] += np.outer(delta, x - stats["mean"])
+
+
+def _remove_row(stats: dict, x: np.ndarray) -> None:
+    """ Inverse Welford step: takes the oldest day back out of the window. """
+    if stats["count"] <= 1:
+        stats["count"] = 0
+        stats["mean"] = np.zeros_like(stats["mean"])
+        stats["comoment"] = np.zeros_like(stats["comoment"])
+        return
+    old_mean = stats["mean"]
+    stats["count"] -= 1
+    stats["mean"] = (old_mean * (stats["count"] + 1) - x) / stats["count"]
+    stats["comoment"] -= np.outer(x - old_mean, x - stats["mean"])
+
+
+def _push_window_sum(queue: deque, start: int, window_sum: float) -> None:
+    """ Monotonic deque: sums increase from front to back, so the front is the
+    worst window. Equal sums stay behind older ones, which keeps the earliest
+    worst window in front — the same one np.argmin picks in a full scan. """
+    while queue and queue[-1][1] > window_sum:
+        queue.pop()
+    queue.append((start, window_sum))
+
+
+def init_stats(dates: np.ndarray, returns: np.ndarray, tickers: list, weights: np.ndarray,
+               var_days: int, stress_days: int, windows: list) -> dict:
+    """
+    Builds the sufficient statistics for one portfolio from its full history.
+
+    Args:
+        dates: datetime64[D] date of each row of `returns`
+        returns: (days × assets) returns without NaN (nan_policy "drop" or "ffill")
+        tickers: ticker of each column
+        weights: portfolio weight of each column
+        var_days: calendar days in the VaR / volatility / Sharpe / correlation window
+        stress_days: calendar days in the stress-test look-back
+        windows: stress-test windows in trading days
+    Returns:
+        stats dict for update_stats() / stats_results()
+    """
+    if np.isnan(returns).any():
+        raise ValueError("Incremental mode needs complete returns — use nan_policy 'drop' or 'ffill'.")
+
+    num_assets = returns.shape[1]
+    stats = {
+        "tickers": list(tickers),
+        "weights": np.asarray(weights, dtype=np.float64),
+        "var_days": var_days,
+        "stress_days": stress_days,
+        "windows": list(windows),
+        # VaR window: the rows themselves (needed to evict them again) and their dates
+        "var_dates": np.array([], dtype="datetime64[D]"),
+        "var_rows": np.empty((0, num_assets)),
+        "count": 0,
+        "mean": np.zeros(num_assets),
+        "comoment": np.zeros((num_assets, num_assets)),
+        "since_rebase": 0,
+        # Stress look-back: portfolio log wealth (one more entry than dates),
+        # `base` is the running index of its first entry
+        "stress_dates": np.array([], dtype="datetime64[D]"),
+        "prefix": np.zeros(1),
+        "base": 0,
+        # Per window: monotonic deque of (start index, log return of the window)
+        "worst": {window: deque() for window in windows}
+    }
+    if len(dates) == 0:
+        return stats
+
+    # VaR window taken as one block — no need to add and evict the older days one by one
+    start = int(np.searchsorted(dates, _cutoff(dates[-1], var_days)))
+    stats["var_dates"] = dates[start:].copy()
+    stats["var_rows"] = returns[start:].copy()
+    _rebase(stats)
+
+    _update_stress(stats, dates, returns @ stats["weights"])
+    return stats
+
+
+def update_stats(stats: dict, dates: np.ndarray, returns: np.ndarray) -> dict:
+    """
+    Applies new days of returns and evicts the days that fell out of each window.
+    Costs O(assets²) per new or evicted day, whatever the look-back length.
+
+    Args:
+        stats: from init_stats(), updated in place
+        dates: datetime64[D] dates of the new rows, all after the last applied date
+        returns: (new days × assets) returns in the same column order as stats["tickers"]
+    Returns:
+        stats
+    """
+    if len(dates) == 0:
+        return stats
+    if np.isnan(returns).any():
+        raise ValueError("Incremental mode needs complete returns — use nan_policy 'drop' or 'ffill'.")
+
+    # VaR window — add the new rows, then drop rows older than the window
+    for x in returns:
+        _add_row(stats, x)
+    stats["var_dates"] = np.concatenate([stats["var_dates"], dates])
+    stats["var_rows"] = np.concatenate([stats["var_rows"], returns])
+    evict = int(np.searchsorted(stats["var_dates"], _cutoff(dates[-1], stats["var_days"])))
+    for x in stats["var_rows"][:evict]:
+        _remove_row(stats, x)
+    stats["var_dates"] = stats["var_dates"][evict:]
+    stats["var_rows"] = stats["var_rows"][evict:]
+
+    stats["since_rebase"] += len(dates)
+    if stats["since_rebase"] >= REBASE_EVERY:
+        _rebase(stats)
+
+    _update_stress(stats, dates, returns @ stats["weights"])
+    return stats
+
+
+def _update_stress(stats: dict, dates: np.ndarray, portfolio: np.ndarray) -> None:
+    """ Extends the stress look-back by new portfolio returns and evicts old days. """
+    # Extend the log-wealth curve and push each new window sum
+    logs = np.log1p(np.maximum(portfolio, -0.999999))
+    prefix = stats["prefix"]
+    end = stats["base"] + len(prefix) - 1          # running index of the last entry
+    prefix = np.concatenate([prefix, prefix[-1] + np.cumsum(logs)])
+    for k in range(1, len(logs) + 1):
+        position = end + k
+        for window, queue in stats["worst"].items():
+            start = position - window
+            if start >= stats["base"]:
+                _push_window_sum(queue, start, prefix[position - stats["base"]] - prefix[start - stats["base"]])
+
+    # Evict days before the stress look-back, and every window starting before it
+    stress_dates = np.concatenate([stats["stress_dates"], dates])
+    evict = int(np.searchsorted(stress_dates, _cutoff(dates[-1], stats["stress_days"])))
+    stats["stress_dates"] = stress_dates[evict:]
+    stats["prefix"] = prefix[evict:]
+    stats["base"] += evict
+    for queue in stats["worst"].values():
+        while queue and queue[0][0] < stats["base"]:
+            queue.popleft()
+
+
+def stats_results(stats: dict, risk_free_rate: float = RISK_FREE_RATE) -> dict:
+    """
+    Turns the statistics into the fields nodes b and c produce.
+
+    Returns:
+        dict with value_at_risk, volatility_scores, sharpe_ratio,
+        correlation_matrix ({"tickers", "matrix"}) and stress_test
+        ({"windows", "max_drawdown"}, as from tools.stress_test.run_stress_test)
+    """
+    tickers, weights, n = stats["tickers"], stats["weights"], stats["count"]
+
+    # Volatility and correlation straight from the co-moment matrix
+    variance = np.diag(stats["comoment"]) / n
+    std = np.sqrt(np.clip(variance, 0.0, None))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        correlation = stats["comoment"] / n / np.outer(std, std)
+    correlation[~np.isfinite(correlation)] = np.nan
+    np.fill_diagonal(correlation, np.where(std > 0, 1.0, np.nan))
+    volatility = std * np.sqrt(TRADING_DAYS)
+
+    # Portfolio mean and variance: w·μ and wᵀCw / n — no pass over the days
+    portfolio_mean = float(stats["mean"] @ weights)
+    portfolio_std = float(np.sqrt(max(weights @ stats["comoment"] @ weights / n, 0.0)))
+    excess = portfolio_mean - risk_free_rate / TRADING_DAYS
+    sharpe = excess / portfolio_std * np.sqrt(TRADING_DAYS) if portfolio_std > 0 else 0.0
+
+    # VaR needs the actual order statistics — the window buffer is only ~60 days
+    value_at_risk = float(historical_var(stats["var_rows"] @ weights, 0.95))
+
+    # Stress windows from the front of each deque
+    dates = stats["stress_dates"]
+    window_results = []
+    for window in stats["windows"]:
+        queue = stats["worst"][window]
+        if not queue:
+            window_results.append({"window": window, "loss": 0.0, "start_date": "N/A",
+                                   "end_date": "N/A", "start_idx": None, "end_idx": None})
+            continue
+        start, window_sum = queue[0]
+        start_idx = start - stats["base"]
+        end_idx = start_idx + window - 1
+        window_results.append({
+            "window": window,
+            "loss": float(round(min(float(np.expm1(window_sum)), 0.0), 4)),
+            "start_date": str(dates[start_idx]),
+            "end_date": str(dates[end_idx]),
+            "start_idx": start_idx,
+            "end_idx": end_idx
+        })
+
+    # Drawdown over the look-back: one vectorized pass over a scalar series
+    prefix = stats["prefix"] - stats["prefix"][0]
+    depth, peak_idx, trough_idx, recovery_idx = max_drawdown(prefix)
+
+    def wealth_date(k):
+        return str(dates[max(k - 1, 0)]) if len(dates) else "N/A"
+
+    drawdown = {
+        "depth": float(round(depth, 4)),
+        "peak_date": wealth_date(peak_idx),
+        "trough_date": wealth_date(trough_idx),
+        "recovery_date": wealth_date(recovery_idx) if recovery_idx is not None else None,
+        "recovery_days": recovery_idx - trough_idx if recovery_idx is not None else None,
+        "duration_days": recovery_idx - peak_idx if recovery_idx is not None else None
+    }
+
+    return {
+        "value_at_risk": float(round(value_at_risk, 4)),
+        "volatility_scores": {asset: float(round(v, 4)) for asset, v in zip(tickers, volatility)},
+        "sharpe_ratio": float(round(float(sharpe), 4)),
+        "correlation_matrix": {"tickers": tickers, "matrix": correlation},
+        "stress_test": {"windows": window_results, "max_drawdown": drawdown}
+    }
+
+
+def pack_stats(stats: dict) -> dict:
+    """ Plain dict of arrays for saving (deques become (n × 2) arrays). """
+    packed = dict(stats)
+    packed["worst"] = {str(window): np.array(list(queue), dtype=np.float64).reshape(-1, 2)
+                       for window, queue in stats["worst"].items()}
+    return packed
+
+
+def unpack_stats(packed: dict) -> dict:
+    """ Inverse of pack_stats(). Arrays are copied, so they can be updated in place. """
+    stats = {key: np.array(value) if isinstance(value, np.ndarray) else value
+             for key, value in packed.items()}
+    stats["worst"] = {int(window): deque((int(start), float(s)) for start, s in rows)
+                      for window, rows in packed["worst"].items()}
+    return stats
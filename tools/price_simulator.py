@@ -1,9 +1,179 @@
-import yfinance as yf
+import logging
 import time
+import numpy as np
 from datetime import datetime, timedelta
+from tools.price_store import read_through
+from tools.fetcher import ChunkedFetcher
+from tools.instrumentation import record_external
+
+logger = logging.getLogger(__name__)
+
+# How many years of history the historical stress test looks back over
+STRESS_TEST_YEARS = 3
+
+
+def download_closes(tickers: list, start: datetime, end: datetime) -> dict:
+    """
+    Downloads daily closing prices from yfinance in a single request.
+
+    Args:
+        tickers: list of ticker symbols
+        start: first day to download
+        end: day (exclusive) to download up to
+    Returns:
+        dict of ticker -> (dates, closes) as numpy arrays. Tickers yfinance
+        returned nothing for are left out.
+    """
+    # Imported on first download — yfinance pulls in pandas, which quant-only
+    # runs from the price store or a stand-in provider never need
+    import yfinance as yf
+
+    # .strftime("%Y-%m-%d") converts the date to the format yfinance expects " 2024-01-15"
+    df = yf.download(
+        tickers,
+        start=start.strftime("%Y-%m-%d"),
+        end=end.strftime("%Y-%m-%d"),
+        auto_adjust=True,
+        progress=False
+    )
+    if df.empty:
+        return {}
+
+    # Extract only the "Close" column (closing price of each day)
+    closes = df["Close"]
+    if closes.ndim == 1:
+        # Older yfinance versions return a Series when only one ticker is requested
+        closes = closes.to_frame(tickers[0])
+
+    downloaded = {}
+    for asset in tickers:
+        if asset not in closes.columns:
+            continue
+        series = closes[asset].dropna()
+        if series.empty:
+            continue
+        dates = series.index.values.astype("datetime64[D]")
+        downloaded[asset] = (dates, series.to_numpy(dtype=np.float64))
+    return downloaded
+
+
+# Default provider: yfinance in chunks of FETCH_CHUNK_SIZE tickers, a few
+# requests in flight, rate-limited and retried (see tools/fetcher.py). One
+# instance, so every fetch in the process shares the same rate limit.
+yahoo_fetcher = ChunkedFetcher(download_closes)
+
+
+def fetch_market_data(tickers: list, days: int, download=None, use_store: bool = True) -> dict:
+    """
+    Fetches one date-aligned price matrix covering the last `days` calendar days.
+    This is the single market-data load every node slices its own window from.
+
+    Args:
+        tickers: list of ticker symbols
+        days: number of calendar days to look back — the longest window any node needs
+        download: price provider, callable(tickers, start, end) -> dict of
+            ticker -> (dates, closes). Defaults to yfinance through the
+            chunked, rate-limited yahoo_fetcher.
+        use_store: read through the local price store. Turn it off for stand-in
+            providers so their prices never end up in the store.
+    Returns:
+        dict with
+            "dates":   datetime64[D] array of every trading day seen for any ticker
+            "tickers": list of tickers that came back with at least 2 prices
+            "prices":  (dates × tickers) float64 matrix, NaN where a ticker has no bar
+    """
+    end_date = datetime.today()
+    start_date = end_date - timedelta(days=days)
+
+    # One read through the store — the store downloads whatever is missing
+    download = download or yahoo_fetcher
+    started = time.perf_counter()
+    if use_store:
+        prices = read_through(tickers, start_date, end_date, download)
+    else:
+        prices = download(tickers, start_date, end_date)
+    record_external("price_fetch", time.perf_counter() - started,
+                    tickers=len(tickers), returned=len(prices), store=use_store)
+
+    # Skip tickers that returned nothing or too little — a chunked fetcher
+    # reports the ones that failed outright, the result is partial either way
+    failures = getattr(prices, "failures", None) or {}
+    available = []
+    for asset in tickers:
+        if asset in failures:
+            logger.warning(f"[Node A] Skipping {asset} — download failed after retries.")
+        elif asset not in prices:
+            logger.warning(f"[Node A] Skipping {asset} — not found in downloaded data.")
+        elif len(prices[asset][0]) < 2:
+            logger.warning(f"[Node A] Skipping {asset} — insufficient data.")
+        else:
+            available.append(asset)
+
+    #If nothing is left, the ticker symbols are likely invalid
+    # We raise an error early so the user knows exactly what went wrong
+    if not available:
+        raise ValueError(f"No data found for assets: {tickers}. Check the ticker symbols.")
+
+    # Align every ticker on the union of trading days
+    # Days a ticker did not trade (or was not listed yet) stay NaN
+    dates = np.unique(np.concatenate([prices[asset][0] for asset in available]))
+    matrix = np.full((len(dates), len(available)), np.nan)
+    for j, asset in enumerate(available):
+        asset_dates, asset_closes = prices[asset]
+        matrix[np.searchsorted(dates, asset_dates), j] = asset_closes
+
+    return {"dates": dates, "tickers": available, "prices": matrix}
+
+
+def slice_window(market_data: dict, days: int) -> dict:
+    """
+    Returns the last `days` calendar days of a date-indexed matrix
+    (prices from fetch_market_data, or returns from tools.returns).
+    The window ends at the latest stored trading day, and the slice is a
+    view — nothing is copied.
+
+    Args:
+        market_data: dict with a "dates" array and matrices indexed by it
+        days: number of calendar days to keep
+    Returns:
+        dict with the same keys as market_data, restricted to the window
+    """
+    return take_rows(market_data, window_start(market_data["dates"], days))
+
+
+def window_start(dates: np.ndarray, days: int) -> int:
+    """ Index of the first date within the last `days` calendar days,
+    counting back from the latest date (0 when there are no dates). """
+    if len(dates) == 0:
+        return 0
+    start = dates[-1] + np.timedelta64(1, "D") - np.timedelta64(days, "D")
+    return int(np.searchsorted(dates, start, side="left"))
+
+
+def take_rows(market_data: dict, start: int) -> dict:
+    """
+    Rows `start:` of a date-indexed matrix, as views — nothing is copied.
+
+    Args:
+        market_data: dict with a "dates" array and matrices indexed by it
+        start: first row to keep, e.g. from window_start()
+    Returns:
+        dict with the same keys; arrays with one row per date are sliced,
+        everything else is passed through
+    """
+    dates = market_data["dates"]
+    window = {}
+    for key, value in market_data.items():
+        # Slice every array that has one row per date, pass the rest through
+        if isinstance(value, np.ndarray) and len(value) == len(dates):
+            window[key] = value[start:]
+        else:
+            window[key] = value
+    return window
+
 
 def fetch_historical_prices(portfolio: dict, time_horizon: int) -> dict:
-    """ 
+    """
     Fetches real daily closing prices for each asset using yfinance.
 
     Args:
@@ -11,53 +181,21 @@ def fetch_historical_prices(portfolio: dict, time_horizon: int) -> dict:
         time_horizon: number of days to look back
         Returns:
             Dict of asset -> list of daily closing prices"""
-    
-    end_date = datetime.today()
-    start_date = end_date - timedelta(days=time_horizon)
 
-    # This dict will hold the results
+    market_data = fetch_market_data(list(portfolio.keys()), time_horizon)
+    prices = market_data["prices"]
+
     price_history = {}
+    for j, asset in enumerate(market_data["tickers"]):
+        asset_prices = prices[:, j][~np.isnan(prices[:, j])]
+        price_history[asset] = [round(float(p), 2) for p in asset_prices]
+
+    return price_history
 
-    for asset in portfolio.keys():
-        ticker = yf.Ticker(asset)    # Create a yf Ticker object for this asset
-
-        # Download all tickers at once
-        # Fetch the historical price data as a DataFrame
-        # .strftime("%Y-%m-%d") converts the date to the format yfinance expects " 2024-01-15"
-        tickers = list(portfolio.keys())
-        df = yf.download(
-            tickers,
-            start=start_date.strftime("%Y-%m-%d"),
-            end=end_date.strftime("%Y-%m-%d"),
-            auto_adjust=True
-        )
-
-        #If the DataFrame is empty, the ticker symbol is likely invalid
-        # We raise an error early so the user knows exactly what went wrong
-        if df.empty:
-            raise ValueError(f"No data found for asset: {asset}. Check the ticker symbol.")
-        # Extract only the "Close" column (closing price of each day)
-        price_history = {}
-        for asset in tickers:
-            try:
-                asset_prices = df["Close"][asset].dropna().tolist()
-                if len(asset_prices) < 2:
-                    print(f"[Node A] Skipping {asset} — insufficient data.")
-                    continue
-                price_history[asset] = [round(p, 2) for p in asset_prices]
-            except KeyError:
-                print(f"[Node A] Skipping {asset} — not found in downloaded data.")
-                continue
-
-        # Small delay between requests to avoid yfinance rate limiting
-        time.sleep(1)
-
-        return price_history
-
-
-def fetch_stress_test_history(portfolio: dict, years: int = 3) -> dict:
+
+def fetch_stress_test_history(portfolio: dict, years: int = STRESS_TEST_YEARS) -> dict:
     """ Fetches a longer price history specifically for the historical stress test.
-    
+
     Args:
         portfolio: dict of asset -> allocation
         years: number of years to look back (default 3)
@@ -66,29 +204,16 @@ def fetch_stress_test_history(portfolio: dict, years: int = 3) -> dict:
         dict of asset -> list of daily closing prices
     """
 
-    end_date = datetime.today()
     # Convert years to days (365 * years)
-    start_date = end_date - timedelta(days=365 * years)
-
-    tickers = list(portfolio.keys())
-
-    df = yf.download(
-        tickers,
-        start=start_date.strftime("%Y-%m-%d"),
-        end=end_date.strftime("%Y-%m-%d"),
-        auto_adjust=True
-    )
-
-    if df.empty:
-        raise ValueError("No stress test data returned. Check your ticker symbols.")
+    market_data = fetch_market_data(list(portfolio.keys()), 365 * years)
+    prices = market_data["prices"]
 
     stress_history = {}
-    for asset in tickers:
-        asset_prices = df["Close"][asset].dropna().tolist()
-        stress_history[asset] = [round(p, 2) for p in asset_prices]
+    for j, asset in enumerate(market_data["tickers"]):
+        asset_prices = prices[:, j][~np.isnan(prices[:, j])]
+        stress_history[asset] = [round(float(p), 2) for p in asset_prices]
 
     # Also store the actual trading dates for reporting
-    stress_history["_dates"] = df.index.strftime("%Y-%m-%d").tolist()
+    stress_history["_dates"] = [str(d) for d in market_data["dates"]]
 
     return stress_history
-
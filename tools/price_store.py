@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+
+from tools.fetcher import FetchResult, has_sessions
+from tools.instrumentation import record_external
+
+logger = logging.getLogger(__name__)
+
+# Where the local price store lives and whether we are allowed to hit the network.
+# Both can be overridden from .env so nightly batch jobs can run fully offline.
+STORE_DIR = os.getenv("PRICE_STORE_DIR", ".price_store")
+OFFLINE = os.getenv("PRICE_STORE_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+
+def _ticker_paths(ticker: str, store_dir: str) -> dict:
+    """ Returns the file paths used to store one ticker.
+
+    Each ticker is stored column-wise: one .npy file for the dates,
+    one for the closing prices and a small JSON file with the covered range.
+    """
+    # Tickers like "^GSPC" or "BRK/B" are not safe file names
+    safe_name = ticker.replace("/", "_").replace("^", "_")
+    base = os.path.join(store_dir, safe_name)
+    return {
+        "dates": base + ".dates.npy",
+        "close": base + ".close.npy",
+        "meta": base + ".json",
+    }
+
+
+def load_ticker(ticker: str, store_dir: str = None):
+    """ Loads a ticker from the store as memory-mapped arrays.
+
+    Args:
+        ticker: ticker symbol, e.g. "AAPL"
+        store_dir: store location (defaults to STORE_DIR)
+
+    Returns:
+        (dates, closes, meta) where dates is a datetime64[D] array and closes a
+        float64 array, both memory-mapped read-only — or None if the ticker
+        has never been stored.
+    """
+    paths = _ticker_paths(ticker, store_dir or STORE_DIR)
+    if not all(os.path.exists(p) for p in paths.values()):
+        return None
+
+    with open(paths["meta"]) as f:
+        meta = json.load(f)
+
+    # mmap_mode="r" means nothing is read from disk until it is sliced
+    dates = np.load(paths["dates"], mmap_mode="r")
+    closes = np.load(paths["close"], mmap_mode="r")
+    return dates, closes, meta
+
+
+def save_ticker(ticker: str, dates, closes, covered_from: str, covered_to: str,
+                store_dir: str = None) -> None:
+    """ Writes a ticker to the store, replacing whatever was there.
+
+    Args:
+        ticker: ticker symbol
+        dates: sorted datetime64[D] array of trading days
+        closes: float64 array of closing prices, same length as dates
+        covered_from: first calendar day ("YYYY-MM-DD") the data was requested for
+        covered_to: day ("YYYY-MM-DD", exclusive) up to which the data was requested
+        store_dir: store location (defaults to STORE_DIR)
+    """
+    store_dir = store_dir or STORE_DIR
+    os.makedirs(store_dir, exist_ok=True)
+    paths = _ticker_paths(ticker, store_dir)
+
+    # Write to temporary files first and swap them in, so a crash mid-write
+    # never leaves a half written ticker behind for the next run to mmap
+    tmp_dates = paths["dates"] + ".tmp"
+    tmp_close = paths["close"] + ".tmp"
+    tmp_meta = paths["meta"] + ".tmp"
+    with open(tmp_dates, "wb") as f:
+        np.save(f, np.asarray(dates, dtype="datetime64[D]"))
+    with open(tmp_close, "wb") as f:
+        np.save(f, np.asarray(closes, dtype=np.float64))
+    with open(tmp_meta, "w") as f:
+        json.dump({"covered_from": covered_from, "covered_to": covered_to}, f)
+
+    os.replace(tmp_dates, paths["dates"])
+    os.replace(tmp_close, paths["close"])
+    os.replace(tmp_meta, paths["meta"])
+
+
+def _merge(old_dates, old_closes, new_dates, new_closes):
+    """ Merges freshly downloaded bars into stored ones.
+    Newer values win when both sides have the same date (e.g. a revised close).
+    """
+    keep = ~np.isin(old_dates, new_dates)
+    dates = np.concatenate([np.asarray(old_dates)[keep], new_dates])
+    closes = np.concatenate([np.asarray(old_closes)[keep], new_closes])
+    order = np.argsort(dates, kind="stable")
+    return dates[order], closes[order]
+
+
+def read_through(tickers: list, start: datetime, end: datetime, download,
+                 offline: bool = None, store_dir: str = None) -> dict:
+    """ Returns closing prices for [start, end) going through the local store.
+
+    Tickers already covered by the store are served from disk. Tickers whose
+    stored range stops before `end` only have the missing trailing days
+    downloaded; tickers that were never stored (or need an earlier start)
+    get the full window. Everything downloaded is written back to the store.
+
+    Args:
+        tickers: list of ticker symbols
+        start: first calendar day wanted
+        end: day (exclusive) up to which prices are wanted
+        download: callable(tickers, start, end) -> dict of
+            ticker -> (dates, closes), used for anything not in the store.
+            A FetchResult's failures are collected across every download
+        offline: if True never call `download`, serve only what is stored
+            (defaults to PRICE_STORE_OFFLINE)
+        store_dir: store location (defaults to STORE_DIR)
+
+    Returns:
+        FetchResult of ticker -> (dates, closes) for the requested window,
+        with the failures of every download made. Tickers with no data at
+        all are left out.
+    """
+    offline = OFFLINE if offline is None else offline
+    store_dir = store_dir or STORE_DIR
+    start_day = start.strftime("%Y-%m-%d")
+    end_day = end.strftime("%Y-%m-%d")
+
+    # Work out which date range each ticker is missing.
+    # Tickers missing the same range are downloaded together in one call.
+    stored = {}
+    fetch_groups = {}
+    failures = {}
+    for ticker in tickers:
+        entry = load_ticker(ticker, store_dir)
+        stored[ticker] = entry
+
+        if entry is None or start_day < entry[2]["covered_from"]:
+            fetch_range = (start_day, end_day)                   # cold miss / backfill
+        elif end_day > entry[2]["covered_to"]:
+            fetch_range = (entry[2]["covered_to"], end_day)      # only the trailing days
+        else:
+            continue                                             # full cache hit
+        fetch_groups.setdefault(fetch_range, []).append(ticker)
+
+    if offline and fetch_groups:
+        missing = sorted(t for group in fetch_groups.values() for t in group)
+        logger.warning(f"[Price store] Offline mode — serving stored data only, stale or missing: {missing}")
+    elif fetch_groups:
+        for (fetch_start, fetch_end), group in fetch_groups.items():
+            if not has_sessions(fetch_start, fetch_end):
+                # Only weekend days are missing (e.g. a Sunday run after a
+                # Saturday one) — there is nothing to download
+                continue
+            logger.info(f"[Price store] Fetching {fetch_start} → {fetch_end} for {group}")
+            started = time.perf_counter()
+            downloaded = download(
+                group,
+                datetime.strptime(fetch_start, "%Y-%m-%d"),
+                datetime.strptime(fetch_end, "%Y-%m-%d"),
+            )
+            record_external("price_download", time.perf_counter() - started,
+                            tickers=len(group), returned=len(downloaded))
+            # Tickers a chunked fetcher gave up on must not be marked as covered
+            failed = getattr(downloaded, "failures", None) or {}
+            failures.update(failed)
+
+            for ticker in group:
+                if ticker in failed:
+                    continue
+                new_dates, new_closes = downloaded.get(
+                    ticker, (np.array([], dtype="datetime64[D]"), np.array([]))
+                )
+                entry = stored[ticker]
+
+                if entry is None or fetch_start == start_day:
+                    # Full window was downloaded — it may extend what was stored
+                    if entry is not None:
+                        new_dates, new_closes = _merge(entry[0], entry[1], new_dates, new_closes)
+                        covered_to = max(end_day, entry[2]["covered_to"])
+                    else:
+                        covered_to = end_day
+                    covered_from = start_day
+                else:
+                    # Delta fetch — append the trailing days to what we have
+                    new_dates, new_closes = _merge(entry[0], entry[1], new_dates, new_closes)
+                    covered_from = entry[2]["covered_from"]
+                    covered_to = end_day
+
+                if len(new_dates) == 0:
+                    # Nothing came back (e.g. invalid ticker) — don't poison the store
+                    continue
+                # Drop our memory maps of the old files before they are replaced
+                stored[ticker] = entry = None
+                save_ticker(ticker, new_dates, new_closes, covered_from, covered_to, store_dir)
+                stored[ticker] = load_ticker(ticker, store_dir)
+
+    # Slice every ticker down to the requested window
+    lo = np.datetime64(start_day, "D")
+    hi = np.datetime64(end_day, "D")
+    prices = FetchResult(failures=failures)
+    for ticker in tickers:
+        entry = stored[ticker]
+        if entry is None:
+            continue
+        dates, closes, _ = entry
+        i = np.searchsorted(dates, lo, side="left")
+        j = np.searchsorted(dates, hi, side="left")
+        if j > i:
+            prices[ticker] = (dates[i:j], closes[i:j])
+
+    return prices
+
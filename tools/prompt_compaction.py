@@ -0,0 +1,310 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Prompt size settings — all can be set in .env
+TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2500"))    # tokens the report prompt may use
+MAX_CLUSTERS = int(os.getenv("PROMPT_MAX_CLUSTERS", "8"))       # correlation clusters summarized
+TOP_PAIRS = int(os.getenv("PROMPT_TOP_PAIRS", "10"))            # most and least correlated pairs listed
+TOP_HOLDINGS = int(os.getenv("PROMPT_TOP_HOLDINGS", "15"))      # holdings / volatilities / contributors listed
+# Encoding used to count tokens when tiktoken is installed (GPT-4o's)
+TOKENIZER = os.getenv("PROMPT_TOKENIZER", "o200k_base")
+
+# The smallest detail the budget loop shrinks to: (clusters, pairs, holdings)
+MIN_DETAIL = (2, 2, 3)
+
+# tiktoken encoding, loaded on first use; False once loading failed
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """ The tiktoken encoding, or None when tiktoken (or its BPE file) is unavailable. """
+    global _encoding
+    with _encoding_lock:
+        if _encoding is None:
+            try:
+                import tiktoken
+                _encoding = tiktoken.get_encoding(TOKENIZER)
+            except Exception as e:
+                # Not installed, or offline and the BPE file was never downloaded
+                logger.debug(f"[Prompt] tiktoken unavailable ({e!r}), estimating tokens as characters / 4")
+                _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """ Prompt tokens: exact with tiktoken, otherwise about four characters per token. """
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def tokenizer_name() -> str:
+    """ How count_tokens() counts — reported next to the counts. """
+    return TOKENIZER if _get_encoding() is not None else "chars/4"
+
+
+def average_linkage(distance: np.ndarray) -> list:
+    """
+    Average-linkage hierarchical clustering (UPGMA) — no SciPy.
+
+    Nearest-neighbour chain: follow nearest neighbours until two clusters
+    are each other's nearest, merge them (Lance-Williams update of one row)
+    and carry on from the rest of the chain. O(assets²) time, one
+    (assets × assets) working copy.
+
+    Args:
+        distance: symmetric (assets × assets) distance matrix
+    Returns:
+        merges as (height, a, b) sorted by height — the dendrogram, where
+        a and b are any member of each of the two merged clusters
+    """
+    n = len(distance)
+    d = np.array(distance, dtype=np.float32)
+    np.fill_diagonal(d, np.inf)
+    size = np.ones(n)
+    merges = []
+    chain = []
+    remaining = n
+    next_start = 0
+    while remaining > 1:
+        if not chain:
+            # Any cluster still active starts a new chain
+            while not np.isfinite(d[next_start]).any():
+                next_start += 1
+            chain.append(next_start)
+        a = chain[-1]
+        b = int(np.argmin(d[a]))
+        # Prefer the previous link on ties, so the chain always terminates
+        if len(chain) > 1 and d[a, chain[-2]] <= d[a, b]:
+            b = chain[-2]
+        if len(chain) > 1 and b == chain[-2]:
+            chain.pop()
+            chain.pop()
+            merges.append((float(d[a, b]), a, b))
+            # The merged cluster keeps row a — its distances are the
+            # size-weighted mean of both; row b is retired
+            merged = (size[a] * d[a] + size[b] * d[b]) / (size[a] + size[b])
+            d[a, :] = merged
+            d[:, a] = merged
+            d[b, :] = np.inf
+            d[:, b] = np.inf
+            d[a, a] = np.inf
+            size[a] += size[b]
+            remaining -= 1
+        else:
+            chain.append(b)
+    merges.sort(key=lambda merge: merge[0])
+    return merges
+
+
+def cut_tree(merges: list, n: int, k: int) -> np.ndarray:
+    """ Cluster label (0 .. k-1) of every asset when the dendrogram is cut into k clusters. """
+    parent = np.arange(n)
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for _, a, b in merges[:max(n - k, 0)]:
+        parent[find(b)] = find(a)
+    roots = np.array([find(x) for x in range(n)])
+    _, labels = np.unique(roots, return_inverse=True)
+    return labels
+
+
+def correlation_distance(matrix: np.ndarray) -> np.ndarray:
+    """ √(½(1 − ρ)): 0 for perfectly correlated assets, 1 for opposite ones.
+    NaN correlations (no overlapping history) count as uncorrelated. """
+    return np.sqrt(0.5 * (1.0 - np.clip(np.nan_to_num(matrix, nan=0.0), -1.0, 1.0)))
+
+
+def cluster_correlations(matrix: np.ndarray, labels: np.ndarray) -> tuple:
+    """
+    Average correlation within and between clusters, from one pair of
+    (assets × clusters) products — NaN pairs and the diagonal are left out.
+
+    Returns:
+        (k × k) average correlations (diagonal = within a cluster) and
+        (k × k) number of pairs behind each
+    """
+    valid = np.isfinite(matrix)
+    np.fill_diagonal(valid, False)
+    values = np.where(valid, matrix, 0.0)
+    members = np.eye(labels.max() + 1)[labels]
+    sums = members.T @ values @ members
+    counts = members.T @ valid.astype(np.float64) @ members
+    with np.errstate(invalid="ignore", divide="ignore"):
+        averages = np.where(counts > 0, sums / counts, np.nan)
+    return averages, counts
+
+
+def extreme_pairs(matrix: np.ndarray, k: int) -> tuple:
+    """
+    The k most and the k least correlated pairs, without listing all
+    N(N-1)/2 of them: one argpartition over the upper triangle each.
+
+    Returns:
+        (highest, lowest) — lists of (i, j, correlation), most extreme first
+    """
+    n = len(matrix)
+    upper = np.where(np.triu(np.ones((n, n), dtype=bool), k=1) & np.isfinite(matrix), matrix, np.nan)
+    flat = upper.ravel()
+    available = int(np.count_nonzero(~np.isnan(flat)))
+    k = min(k, available)
+    if k <= 0:
+        return [], []
+
+    def pick(keys):
+        # NaN sorts last in argpartition / argsort, so it never gets picked
+        top = np.argpartition(keys, k - 1)[:k]
+        top = top[np.argsort(keys[top])]
+        return [(int(x // n), int(x % n), float(flat[x])) for x in top]
+
+    return pick(-flat), pick(flat)
+
+
+def _names(assets: list, indices, weights: np.ndarray, k: int) -> str:
+    """ Up to k member names, heaviest first, and how many were left out. """
+    indices = sorted(indices, key=lambda i: -weights[i])
+    text = ", ".join(assets[i] for i in indices[:k])
+    return text + (f" and {len(indices) - k} more" if len(indices) > k else "")
+
+
+def format_correlations(correlation_matrix: dict, weights: np.ndarray = None,
+                        clusters: int = MAX_CLUSTERS, pairs: int = TOP_PAIRS,
+                        merges: list = None) -> str:
+    """
+    The correlation section of the report prompt, at a size that does not
+    grow with the square of the portfolio.
+
+    Small portfolios (no more than 2 × `pairs` pairs) get every pair, as
+    before. Larger ones get the assets clustered by correlation distance, the
+    average correlation within and between clusters, and the `pairs` most
+    and least correlated pairs.
+
+    Args:
+        correlation_matrix: {"tickers", "matrix"} from node c
+        weights: portfolio weight per ticker, to order cluster members
+        clusters: number of clusters to cut the dendrogram into
+        pairs: number of pairs listed at each extreme
+        merges: average_linkage() result, when it was already computed
+    """
+    assets = correlation_matrix.get("tickers", [])
+    matrix = correlation_matrix.get("matrix")
+    n = len(assets)
+    if n < 2 or matrix is None:
+        return ""
+
+    # Few enough pairs to list them all — the upper triangle, no duplicates
+    if n * (n - 1) // 2 <= 2 * pairs:
+        return "\n".join(f"  {assets[i]} vs {assets[j]}: {round(float(matrix[i, j]), 4)}"
+                         for i in range(n) for j in range(i + 1, n))
+
+    weights = np.ones(n) if weights is None else np.asarray(weights, dtype=np.float64)
+    merges = merges if merges is not None else average_linkage(correlation_distance(matrix))
+    labels = cut_tree(merges, n, min(clusters, n))
+    averages, counts = cluster_correlations(matrix, labels)
+
+    # Heaviest cluster first
+    order = np.argsort(-np.bincount(labels, weights=weights))
+    number = {int(c): i + 1 for i, c in enumerate(order)}
+    overall = np.where(counts > 0, averages * counts, 0.0).sum() / max(counts.sum(), 1)
+
+    lines = [f"  {n} assets in {len(order)} correlation clusters (average linkage on √(½(1 − ρ))), "
+             f"average pairwise correlation {overall:.2f}"]
+    for c in order:
+        members = np.nonzero(labels == c)[0]
+        within = f"average correlation within {averages[c, c]:.2f}" if counts[c, c] else "single asset"
+        lines.append(f"  Cluster {number[int(c)]} ({len(members)} assets, {weights[members].sum() * 100:.1f}% "
+                     f"of weight, {within}): {_names(assets, members, weights, 5)}")
+    lines.append("  Average correlation between clusters:")
+    for x in range(len(order)):
+        for y in range(x + 1, len(order)):
+            a, b = order[x], order[y]
+            if counts[a, b]:
+                lines.append(f"    Cluster {x + 1} vs {y + 1}: {averages[a, b]:.2f}")
+
+    highest, lowest = extreme_pairs(matrix, pairs)
+    lines.append(f"  Most correlated pairs (top {len(highest)} of {n * (n - 1) // 2}):")
+    lines += [f"    {assets[i]} vs {assets[j]}: {rho:.4f}" for i, j, rho in highest]
+    lines.append("  Least correlated pairs:")
+    lines += [f"    {assets[i]} vs {assets[j]}: {rho:.4f}" for i, j, rho in lowest]
+    return "\n".join(lines)
+
+
+def format_holdings(portfolio: dict, k: int = TOP_HOLDINGS) -> str:
+    """ The k largest allocations — the whole portfolio when it is no bigger. """
+    if len(portfolio) <= k:
+        return str(portfolio)
+    largest = sorted(portfolio.items(), key=lambda item: -abs(item[1]))
+    rest = sum(weight for _, weight in largest[k:])
+    return (str(dict(largest[:k]))
+            + f"\n    ... and {len(portfolio) - k} smaller positions ({rest * 100:.1f}% of the portfolio)")
+
+
+def format_volatility(volatility_scores: dict, k: int = TOP_HOLDINGS) -> str:
+    """ Annualized volatility per asset — only the k most volatile for large portfolios. """
+    items = list(volatility_scores.items())
+    header = ""
+    if len(items) > k:
+        scores = np.asarray([score for _, score in items], dtype=np.float64)
+        header = (f"  {len(items)} assets, median {np.median(scores) * 100:.1f}%, "
+                  f"range {scores.min() * 100:.1f}% – {scores.max() * 100:.1f}%; the {k} most volatile:\n")
+        items = sorted(items, key=lambda item: -item[1])[:k]
+    return header + "\n".join(f"  {asset}: {score * 100:.1f}% annualized volatility" for asset, score in items)
+
+
+def fit_to_budget(build, budget: int = None, correlation_matrix: dict = None) -> tuple:
+    """
+    Builds the prompt at full detail and halves the number of clusters,
+    pairs and holdings listed until it fits the token budget (or nothing is
+    left to shrink). The clustering is computed once and re-cut each time.
+
+    Args:
+        build: callable(detail) -> prompt, where detail is a dict with
+            "clusters", "pairs", "holdings" and "merges"
+        budget: tokens the prompt may use (default PROMPT_TOKEN_BUDGET)
+        correlation_matrix: {"tickers", "matrix"}, to cluster once up front
+    Returns:
+        (prompt, stats) — stats has "tokens", "budget", "tokenizer",
+        "compacted" (less than full detail was needed) and the detail used
+    """
+    budget = budget or TOKEN_BUDGET
+    detail = {"clusters": MAX_CLUSTERS, "pairs": TOP_PAIRS, "holdings": TOP_HOLDINGS, "merges": None}
+
+    # Cluster up front only when the correlation section is going to be summarized
+    matrix = (correlation_matrix or {}).get("matrix")
+    n = len(matrix) if matrix is not None else 0
+    if n * (n - 1) // 2 > 2 * TOP_PAIRS:
+        detail["merges"] = average_linkage(correlation_distance(matrix))
+
+    while True:
+        prompt = build(detail)
+        tokens = count_tokens(prompt)
+        smaller = {key: max(minimum, detail[key] // 2)
+                   for key, minimum in zip(("clusters", "pairs", "holdings"), MIN_DETAIL)}
+        if tokens <= budget or all(smaller[key] == detail[key] for key in smaller):
+            break
+        detail.update(smaller)
+
+    if tokens > budget:
+        logger.warning(f"[Prompt] {tokens} tokens even at minimum detail — over the {budget} token budget.")
+    stats = {
+        "tokens": tokens,
+        "budget": budget,
+        "tokenizer": tokenizer_name(),
+        "compacted": (detail["clusters"], detail["pairs"], detail["holdings"]) != (MAX_CLUSTERS, TOP_PAIRS, TOP_HOLDINGS),
+        "clusters": detail["clusters"],
+        "pairs": detail["pairs"],
+        "holdings": detail["holdings"]
+    }
+    return prompt, stats
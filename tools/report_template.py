@@ -0,0 +1,114 @@
+import numpy as np
+
+from tools.stress_test import format_stress_test
+from tools.backtest import format_var_backtest
+from tools.covariance import format_risk_decomposition
+from tools.scenarios import format_scenarios
+
+# Upper bounds of the Low and Medium bands for each metric — above the second
+# bound the metric counts as High. Same scale the LLM is asked to rate on.
+VAR_BANDS = (0.015, 0.03)            # 1-day 95% VaR
+VOLATILITY_BANDS = (0.20, 0.35)      # annualized portfolio volatility
+DRAWDOWN_BANDS = (0.20, 0.35)        # maximum drawdown over the stress look-back
+CORRELATION_BANDS = (0.50, 0.75)     # average pairwise correlation
+RATINGS = ("Low", "Medium", "High")
+
+
+def _band(value: float, bands: tuple) -> int:
+    """ 0, 1 or 2 — which band the value falls into. """
+    return int(np.searchsorted(bands, value, side="right"))
+
+
+def _average_correlation(correlation_matrix: dict) -> float:
+    """ Mean of the off-diagonal correlations, NaN pairs skipped. """
+    matrix = (correlation_matrix or {}).get("matrix")
+    if matrix is None or len(matrix) < 2:
+        return 0.0
+    pairs = matrix[np.triu_indices(len(matrix), k=1)]
+    pairs = pairs[np.isfinite(pairs)]
+    return float(pairs.mean()) if len(pairs) else 0.0
+
+
+def rate_risk(state: dict) -> dict:
+    """
+    Deterministic risk rating from the metrics nodes b and c computed.
+
+    Every metric is put in a Low / Medium / High band (VAR_BANDS, ...), the
+    rating is the average band, rounded to the nearest one. A negative Sharpe
+    ratio moves it one band up.
+
+    Returns:
+        dict with "rating" and "bands" (metric -> (value, band name))
+    """
+    portfolio = state.get("portfolio") or {}
+    volatility_scores = state.get("volatility_scores") or {}
+    if state.get("risk_contributions"):
+        # √(wᵀΣw) — counts the diversification the weighted average ignores
+        volatility = state["risk_contributions"]["volatility"]
+    else:
+        total = sum(portfolio.get(asset, 0.0) for asset in volatility_scores) or 1.0
+        volatility = sum(portfolio.get(asset, 0.0) * score
+                         for asset, score in volatility_scores.items()) / total
+
+    metrics = {
+        "value_at_risk": (state.get("value_at_risk") or 0.0, VAR_BANDS),
+        "volatility": (volatility, VOLATILITY_BANDS),
+        "average_correlation": (_average_correlation(state.get("correlation_matrix")), CORRELATION_BANDS)
+    }
+    stress_test = state.get("stress_test")
+    if stress_test:
+        metrics["max_drawdown"] = (abs(stress_test["max_drawdown"]["depth"]), DRAWDOWN_BANDS)
+
+    bands = {name: _band(value, limits) for name, (value, limits) in metrics.items()}
+    score = int(np.floor(np.mean(list(bands.values())) + 0.5))
+    if (state.get("sharpe_ratio") or 0.0) < 0:
+        score += 1
+
+    return {
+        "rating": RATINGS[min(score, len(RATINGS) - 1)],
+        "bands": {name: (metrics[name][0], RATINGS[band]) for name, band in bands.items()}
+    }
+
+
+def template_report(state: dict) -> dict:
+    """
+    Builds a plain-text report from the metrics — no LLM call, the same
+    state always gives the same text. Ends with "RISK RATING: <rating>",
+    like the LLM report, so parse_risk_rating() works on both.
+
+    Returns:
+        dict with "final_report" and "risk_rating"
+    """
+    rated = rate_risk(state)
+    bands = rated["bands"]
+    sharpe = state.get("sharpe_ratio") or 0.0
+    volatility_scores = state.get("volatility_scores") or {}
+
+    lines = [
+        "PORTFOLIO RISK SUMMARY (quant-only, generated from the metrics)",
+        "",
+        f"Value at Risk (95%, 1 day): {bands['value_at_risk'][0] * 100:.2f}% — {bands['value_at_risk'][1]}",
+        f"Portfolio volatility: {bands['volatility'][0] * 100:.1f}% annualized — {bands['volatility'][1]}",
+        f"Average pairwise correlation: {bands['average_correlation'][0]:.2f} — {bands['average_correlation'][1]}",
+    ]
+    if "max_drawdown" in bands:
+        lines.append(f"Maximum drawdown: {bands['max_drawdown'][0] * 100:.1f}% — {bands['max_drawdown'][1]}")
+    lines.append(f"Sharpe ratio: {sharpe}" + (" — below the risk-free rate" if sharpe < 0 else ""))
+
+    # The most volatile holdings are the first place to look
+    if volatility_scores:
+        riskiest = sorted(volatility_scores.items(), key=lambda item: item[1], reverse=True)[:3]
+        lines.append("Most volatile holdings: " + ", ".join(
+            f"{asset} ({score * 100:.1f}%)" for asset, score in riskiest))
+
+    if state.get("stress_test"):
+        lines += ["", format_stress_test(state["stress_test"])]
+    if state.get("var_backtest"):
+        lines += ["", format_var_backtest(state["var_backtest"])]
+    if state.get("scenario_results"):
+        lines += ["", format_scenarios(state["scenario_results"])]
+    if state.get("parametric_var"):
+        lines += ["", format_risk_decomposition(state["parametric_var"], state.get("risk_contributions"))]
+
+    lines += ["", f"RISK RATING: {rated['rating']}"]
+    return {"final_report": "\n".join(lines), "risk_rating": rated["rating"]}
@@ -0,0 +1,93 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# How missing prices (NaN in the market-data matrix) are handled when building returns
+#   "drop"  — keep only days on which every asset has a price (strict date alignment)
+#   "ffill" — carry the last known price forward, so a missing day is a 0% return
+#             and the next real bar carries the whole move
+#   "mask"  — keep NaN in the returns matrix wherever a return cannot be computed;
+#             statistics skip NaN and portfolio returns count a masked asset as flat
+NAN_POLICIES = ("drop", "ffill", "mask")
+DEFAULT_NAN_POLICY = "drop"
+
+# Tickers with prices on fewer than this fraction of days are dropped,
+# so one recently listed ticker cannot wipe out most of the history under "drop"
+MIN_COVERAGE = 0.5
+
+
+def compute_returns(market_data: dict, nan_policy: str = DEFAULT_NAN_POLICY,
+                    min_coverage: float = MIN_COVERAGE) -> dict:
+    """
+    Turns a date-aligned price matrix into a date-aligned daily returns matrix.
+
+    Args:
+        market_data: dict with "dates", "tickers" and a (dates × tickers) "prices" matrix
+        nan_policy: one of NAN_POLICIES
+        min_coverage: minimum fraction of days a ticker must have a price on
+    Returns:
+        dict with
+            "dates":   datetime64[D] array — the day each return was realised on
+            "tickers": tickers kept after the coverage filter
+            "returns": (days × tickers) float64 matrix of simple daily returns
+    """
+    if nan_policy not in NAN_POLICIES:
+        raise ValueError(f"Unknown nan_policy '{nan_policy}'. Use one of {NAN_POLICIES}.")
+
+    dates = market_data["dates"]
+    prices = market_data["prices"]
+    tickers = market_data["tickers"]
+
+    # Drop tickers that are missing on too many days
+    coverage = np.mean(~np.isnan(prices), axis=0) if len(dates) else np.zeros(len(tickers))
+    keep = coverage >= min_coverage
+    for asset, kept in zip(tickers, keep):
+        if not kept:
+            logger.warning(f"[Returns] Skipping {asset} — prices on only "
+                           f"{coverage[tickers.index(asset)] * 100:.0f}% of days.")
+    tickers = [asset for asset, kept in zip(tickers, keep) if kept]
+    prices = prices[:, keep]
+
+    if nan_policy == "drop":
+        # Only days on which every asset traded — returns between those days
+        # span any gap, so no move is lost, only the day it is attributed to
+        rows = ~np.isnan(prices).any(axis=1)
+        dates, prices = dates[rows], prices[rows]
+    elif nan_policy == "ffill":
+        # Index of the last row with a price, per column — then gather
+        idx = np.where(~np.isnan(prices), np.arange(len(prices))[:, None], 0)
+        np.maximum.accumulate(idx, axis=0, out=idx)
+        prices = prices[idx, np.arange(prices.shape[1])]
+        # Days before some asset's first price still can't be used
+        rows = ~np.isnan(prices).any(axis=1)
+        dates, prices = dates[rows], prices[rows]
+
+    # Simple returns for every asset in one shot: p[t] / p[t-1] - 1
+    # Under "mask" any NaN on either side leaves a NaN return
+    returns = prices[1:] / prices[:-1] - 1.0
+
+    return {"dates": dates[1:], "tickers": tickers, "returns": returns}
+
+
+def portfolio_weights(tickers: list, portfolio: dict) -> np.ndarray:
+    """
+    Returns the weight vector lined up with the columns of a returns matrix.
+    Assets that were dropped (no data) simply don't appear.
+    """
+    return np.array([portfolio[asset] for asset in tickers], dtype=np.float64)
+
+
+def portfolio_returns(returns: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Weighted portfolio daily returns as one matrix-vector product.
+
+    Args:
+        returns: (days × assets) returns matrix
+        weights: weight vector with one entry per column
+    Returns:
+        (days,) array of portfolio returns. Masked (NaN) asset returns count as 0.
+    """
+    if np.isnan(returns).any():
+        returns = np.nan_to_num(returns, nan=0.0)
+    return returns @ weights
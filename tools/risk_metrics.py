@@ -0,0 +1,40 @@
+import numpy as np
+
+# 252 is the number of trading days in a year
+TRADING_DAYS = 252
+# We use 0.04 (4%) as the annual risk-free rate (approximates US Treasury bonds)
+RISK_FREE_RATE = 0.04
+
+# Every function works down axis 0, so the same call handles one portfolio
+# (days,) or many portfolios side by side (days × portfolios).
+
+
+def historical_var(portfolio_returns: np.ndarray, confidence: float = 0.95):
+    """
+    Historical Value at Risk — the loss not exceeded on `confidence` of days.
+
+    Returns:
+        VaR as a positive fraction (e.g. 0.0245 = 2.45%), one per column
+    """
+    return np.abs(np.percentile(portfolio_returns, (1 - confidence) * 100, axis=0))
+
+
+def annualized_volatility(returns: np.ndarray):
+    """
+    Volatility = standard deviation of daily returns × √252.
+    NaN (masked) returns are skipped.
+    """
+    return np.nanstd(returns, axis=0) * np.sqrt(TRADING_DAYS)
+
+
+def sharpe_ratio(portfolio_returns: np.ndarray, risk_free_rate: float = RISK_FREE_RATE):
+    """
+    Annualized Sharpe Ratio: (average return - risk free rate) / std deviation × √252.
+    Columns with zero volatility get 0.0 instead of dividing by zero.
+    """
+    risk_free_rate_daily = risk_free_rate / TRADING_DAYS      # convert annual rate to daily
+    excess = np.mean(portfolio_returns, axis=0) - risk_free_rate_daily
+    std = np.std(portfolio_returns, axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = np.where(std != 0, excess / std * np.sqrt(TRADING_DAYS), 0.0)
+    return sharpe
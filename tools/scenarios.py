@@ -0,0 +1,330 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from statistics import NormalDist
+
+import numpy as np
+
+from tools.risk_metrics import historical_var
+
+# Confidence of the stressed VaR figures — the same level as the headline VaR
+DEFAULT_CONFIDENCE = 0.95
+# Scenarios evaluated per block — one GEMM and one percentile call per block
+DEFAULT_BLOCK_SIZE = 32
+# Below this many scenario × portfolio × day cells a process pool costs more than it saves
+PARALLEL_THRESHOLD = 50_000_000
+# Name of the built-in factor: the equal-weighted average return of the universe
+MARKET_FACTOR = "market"
+
+# Every field a scenario may set — see compile_scenarios()
+SCENARIO_FIELDS = ("name", "shocks", "sector_shocks", "factor_moves", "vol_multiplier",
+                   "correlation", "correlation_blend")
+
+
+def factor_betas(returns: np.ndarray, factors: dict = None) -> tuple:
+    """
+    Exposure of every asset to every factor — one least-squares solve for all
+    of them (with an intercept), over the days every asset traded.
+
+    Args:
+        returns: (days × assets) daily returns, NaN where masked
+        factors: name -> (days,) factor returns. The "market" factor (the
+            equal-weighted average return) is always added.
+    Returns:
+        (names, betas) — factor names and their (factors × assets) betas
+    """
+    factors = dict(factors or {})
+    factors.setdefault(MARKET_FACTOR, np.nanmean(returns, axis=1))
+    names = list(factors)
+    design = np.column_stack([np.ones(len(returns))] + [np.asarray(factors[name], dtype=np.float64)
+                                                          for name in names])
+    complete = ~(np.isnan(returns).any(axis=1) | np.isnan(design).any(axis=1))
+    if complete.sum() <= len(names):
+        return names, np.zeros((len(names), returns.shape[1]))
+    coefficients, *_ = np.linalg.lstsq(design[complete], returns[complete], rcond=None)
+    return names, coefficients[1:]
+
+
+def compile_scenarios(scenarios: list, tickers: list, sectors: dict = None,
+                      factor_names: list = None, betas: np.ndarray = None) -> dict:
+    """
+    Turns scenario specs into arrays over the assets, one row per scenario.
+
+    A scenario is a dict with a "name" and any of:
+        "shocks":            {ticker: return}, e.g. {"TSLA": -0.30}
+        "sector_shocks":     {sector: return}, applied to every ticker in the sector
+        "factor_moves":      {factor: return}, applied through each asset's beta
+        "vol_multiplier":    number, or {ticker or sector: number} (others stay at 1)
+        "correlation":       correlation every pair moves to — a breakdown regime
+        "correlation_blend": how far the correlations move there, 0-1 (default 1)
+    The instantaneous shock of an asset is the sum of its ticker, sector and
+    factor shocks; a ticker's vol multiplier wins over its sector's.
+
+    Args:
+        scenarios: list of scenario dicts
+        tickers: asset for each column
+        sectors: ticker -> sector
+        factor_names, betas: from factor_betas(), needed for "factor_moves"
+    Returns:
+        dict with "names", "shocks" and "vol_multipliers" ((scenarios × assets)),
+        "correlation" ((scenarios,), NaN = unchanged) and "correlation_blend"
+    """
+    sectors = sectors or {}
+    column = {asset: j for j, asset in enumerate(tickers)}
+    sector_columns = {}
+    for asset, sector in sectors.items():
+        if asset in column:
+            sector_columns.setdefault(sector, []).append(column[asset])
+    factor_row = {name: k for k, name in enumerate(factor_names or [])}
+
+    count, num_assets = len(scenarios), len(tickers)
+    shocks = np.zeros((count, num_assets))
+    multipliers = np.ones((count, num_assets))
+    correlation = np.full(count, np.nan)
+    blend = np.ones(count)
+    names = []
+    for s, scenario in enumerate(scenarios):
+        unknown = set(scenario) - set(SCENARIO_FIELDS)
+        if unknown:
+            raise ValueError(f"Scenario {scenario.get('name', s)}: unknown fields {sorted(unknown)}.")
+        names.append(str(scenario.get("name", f"scenario {s + 1}")))
+
+        for sector, shock in (scenario.get("sector_shocks") or {}).items():
+            shocks[s, sector_columns.get(sector, [])] += shock
+        for asset, shock in (scenario.get("shocks") or {}).items():
+            if asset in column:
+                shocks[s, column[asset]] += shock
+        for factor, move in (scenario.get("factor_moves") or {}).items():
+            if factor not in factor_row:
+                raise ValueError(f"Scenario {names[-1]}: unknown factor '{factor}'.")
+            shocks[s] += betas[factor_row[factor]] * move
+
+        vol = scenario.get("vol_multiplier", 1.0)
+        if isinstance(vol, dict):
+            # Sectors first, so a ticker's own multiplier overrides its sector's
+            for key, value in vol.items():
+                if key in sector_columns:
+                    multipliers[s, sector_columns[key]] = value
+            for key, value in vol.items():
+                if key in column:
+                    multipliers[s, column[key]] = value
+        else:
+            multipliers[s] = vol
+
+        if scenario.get("correlation") is not None:
+            correlation[s] = scenario["correlation"]
+            blend[s] = scenario.get("correlation_blend", 1.0)
+
+    return {"names": names, "shocks": shocks, "vol_multipliers": multipliers,
+            "correlation": correlation, "correlation_blend": blend}
+
+
+# Arrays shared by every block a pool worker evaluates: inputs and the output
+# tables. Set once per worker by _init_worker, so tasks only carry a range.
+# Only ever touched inside worker processes — in-process runs pass their own dict.
+_SHARED = {}
+_BLOCKS = []
+
+
+def _init_worker(specs: dict, confidence: float) -> None:
+    """
+    Process-pool initializer — attaches the shared-memory blocks once per
+    worker and maps them as arrays. Nothing is copied or pickled.
+    """
+    _SHARED.clear()
+    _BLOCKS.clear()
+    for key, (name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=name)
+        _BLOCKS.append(block)          # keep the mapping alive as long as the worker
+        _SHARED[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    _SHARED["confidence"] = confidence
+
+
+def _evaluate_block(task: tuple, shared: dict = None) -> int:
+    """
+    Evaluates scenarios start..stop for every portfolio and writes the rows
+    straight into the output tables of `shared` (default: the arrays this
+    worker attached in _init_worker). Top-level so it can run in a worker
+    process.
+
+    - P&L: instantaneous shocks times weights
+    - stressed historical VaR: every asset's history scaled by its vol
+      multiplier. A multiplier shared by all assets just scales the
+      unstressed VaR; the rest take one GEMM and one percentile call for
+      the whole block
+    - stressed parametric VaR: the covariance scaled by the multipliers and
+      moved towards the scenario's correlation, in closed form:
+      uᵀΣu → (1 − λ) uᵀΣu + λ (ρ (σᵀu)² + (1 − ρ) Σ (σ u)²) with u = m · w
+    """
+    start, stop = task
+    shared = _SHARED if shared is None else shared
+    returns, covariance, weights = shared["returns"], shared["covariance"], shared["weights"]
+    multipliers = shared["vol_multipliers"][start:stop]
+    correlation = shared["correlation"][start:stop]
+    blend = shared["correlation_blend"][start:stop]
+    confidence = shared["confidence"]
+    count, num_assets, num_portfolios = stop - start, len(weights), weights.shape[1]
+
+    shared["pnl"][start:stop] = shared["shocks"][start:stop] @ weights
+
+    # Scaling every asset by m scales the VaR by m and the variance by m²
+    uniform = np.all(multipliers == multipliers[:, :1], axis=1)
+    scale = multipliers[:, :1]
+    stressed_var = scale * shared["base_var"]
+    variance = scale ** 2 * shared["base_variance"]
+
+    mixed = np.nonzero(~uniform)[0]
+    if len(mixed):
+        # u = m · w for every mixed scenario: (assets × scenarios·portfolios)
+        scaled = (multipliers[mixed, :, None] * weights[None]).transpose(1, 0, 2).reshape(num_assets, -1)
+        stressed_var[mixed] = historical_var(returns @ scaled, confidence).reshape(len(mixed), num_portfolios)
+        variance[mixed] = np.sum(scaled * (covariance @ scaled), axis=0).reshape(len(mixed), num_portfolios)
+
+    regime = np.nonzero(~np.isnan(correlation))[0]
+    if len(regime):
+        sigma = np.sqrt(np.clip(np.diag(covariance), 0.0, None))
+        # σ · m · w per asset: (assets × regime scenarios × portfolios)
+        exposure = sigma[:, None, None] * multipliers[regime].T[:, :, None] * weights[:, None, :]
+        rho, lam = correlation[regime, None], blend[regime, None]
+        target = rho * exposure.sum(axis=0) ** 2 + (1 - rho) * (exposure ** 2).sum(axis=0)
+        variance[regime] = (1 - lam) * variance[regime] + lam * target
+
+    shared["stressed_var"][start:stop] = stressed_var
+    z = NormalDist().inv_cdf(confidence)
+    shared["stressed_parametric_var"][start:stop] = z * np.sqrt(np.clip(variance, 0.0, None))
+    return count
+
+
+def _share(arrays: dict) -> tuple:
+    """ Copies every array into a new shared-memory block once.
+    Returns (blocks, specs) — specs is what workers need to attach. """
+    blocks, specs = [], {}
+    for key, array in arrays.items():
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        blocks.append(block)
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        specs[key] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def run_scenarios(returns: np.ndarray, weights: np.ndarray, scenarios: list, tickers: list,
+                  covariance: np.ndarray = None, sectors: dict = None, factors: dict = None,
+                  confidence: float = DEFAULT_CONFIDENCE, block_size: int = DEFAULT_BLOCK_SIZE,
+                  workers: int = None) -> dict:
+    """
+    Hypothetical stress scenarios for many portfolios at once.
+
+    The returns, covariance, weights and compiled scenarios are placed in
+    shared memory once, and blocks of scenarios are fanned out over a
+    process pool. Each task is just a (start, stop) range and writes its
+    rows into shared output tables — nothing is pickled per task, in either
+    direction.
+
+    Args:
+        returns: (days × assets) historical daily returns (NaN counts as 0)
+        weights: (assets,) weights, or (assets × portfolios) for many portfolios
+        scenarios: scenario dicts, see compile_scenarios()
+        tickers: asset for each column of `returns`
+        covariance: (assets × assets) covariance (default: sample covariance of `returns`)
+        sectors: ticker -> sector, for sector shocks and sector vol multipliers
+        factors: name -> (days,) factor returns for factor moves ("market" is built in)
+        confidence: confidence of the stressed VaR figures
+        block_size: scenarios per task
+        workers: worker processes (default: all CPUs above PARALLEL_THRESHOLD cells, else 1)
+    Returns:
+        dict with "names", "confidence" and the (scenarios [× portfolios])
+        tables "pnl" (instantaneous return), "stressed_var" (historical) and
+        "stressed_parametric_var", losses as positive fractions
+    """
+    single = np.ndim(weights) == 1
+    weights = np.asarray(weights, dtype=np.float64).reshape(len(tickers), -1)
+    returns = np.asarray(returns, dtype=np.float64)
+    if covariance is None:
+        complete = returns[~np.isnan(returns).any(axis=1)]
+        covariance = np.atleast_2d(np.cov(complete, rowvar=False))
+
+    factor_names, betas = factor_betas(returns, factors)
+    compiled = compile_scenarios(scenarios, tickers, sectors, factor_names, betas)
+    count, num_portfolios = len(scenarios), weights.shape[1]
+
+    if np.any(compiled["vol_multipliers"] <= 0):
+        raise ValueError("Vol multipliers must be positive.")
+    history = np.nan_to_num(returns, nan=0.0)
+
+    inputs = {
+        "returns": history,
+        "covariance": covariance,
+        "weights": weights,
+        # Unstressed figures — scenarios with one vol multiplier only rescale them
+        "base_var": historical_var(history @ weights, confidence),
+        "base_variance": np.sum(weights * (covariance @ weights), axis=0),
+        "shocks": compiled["shocks"],
+        "vol_multipliers": compiled["vol_multipliers"],
+        "correlation": compiled["correlation"],
+        "correlation_blend": compiled["correlation_blend"]
+    }
+    outputs = {key: np.zeros((count, num_portfolios))
+               for key in ("pnl", "stressed_var", "stressed_parametric_var")}
+    tasks = [(start, min(start + block_size, count)) for start in range(0, count, block_size)]
+
+    if workers is None:
+        cells = count * num_portfolios * len(returns)
+        workers = (os.cpu_count() or 1) if cells >= PARALLEL_THRESHOLD else 1
+    workers = min(workers, len(tasks))
+
+    if workers > 1:
+        blocks, specs = _share({**inputs, **outputs})
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(specs, confidence)) as pool:
+                list(pool.map(_evaluate_block, tasks, chunksize=max(1, math.ceil(len(tasks) / (4 * workers)))))
+            # Copy the results out before the blocks go away
+            for key in outputs:
+                name, shape, dtype = specs[key]
+                block = next(b for b in blocks if b.name == name)
+                outputs[key] = np.ndarray(shape, dtype=dtype, buffer=block.buf).copy()
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+    else:
+        # Same code path in this process — the "shared" arrays are just ours,
+        # passed explicitly so concurrent calls never see each other's arrays
+        shared = {**inputs, **outputs, "confidence": confidence}
+        for task in tasks:
+            _evaluate_block(task, shared)
+
+    if single:
+        outputs = {key: table[:, 0] for key, table in outputs.items()}
+    return {"names": compiled["names"], "confidence": confidence, **outputs}
+
+
+def scenario_table(results: dict, column: int = None) -> list:
+    """
+    One portfolio's P&L table: a row per scenario, worst P&L first.
+
+    Args:
+        results: run_scenarios() result
+        column: which portfolio, when results hold several
+    """
+    pick = (lambda table: table) if column is None else (lambda table: table[:, column])
+    pnl, stressed, parametric = (pick(results[key]) for key in ("pnl", "stressed_var", "stressed_parametric_var"))
+    rows = [{"scenario": name, "pnl": round(float(pnl[s]), 4), "stressed_var": round(float(stressed[s]), 4),
+             "stressed_parametric_var": round(float(parametric[s]), 4)}
+            for s, name in enumerate(results["names"])]
+    return sorted(rows, key=lambda row: row["pnl"])
+
+
+def format_scenarios(scenario_results: dict, k: int = 10) -> str:
+    """ Formats the worst scenarios of one portfolio's P&L table as text for the report. """
+    table = scenario_results["table"]
+    confidence = scenario_results["confidence"]
+    lines = [f"Hypothetical Scenarios (worst {min(k, len(table))} of {len(table)} by instantaneous P&L; "
+             f"stressed 1-day VaR at {confidence * 100:.0f}%):"]
+    for row in table[:k]:
+        lines.append(f"  • {row['scenario']}: P&L {row['pnl'] * 100:+.2f}%, stressed VaR "
+                     f"{row['stressed_var'] * 100:.2f}% historical / "
+                     f"{row['stressed_parametric_var'] * 100:.2f}% parametric")
+    return "\n".join(lines)
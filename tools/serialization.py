@@ -0,0 +1,111 @@
+import numpy as np
+import ormsgpack
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+# Type tag for values written by ArraySerializer
+ARRAY_TYPE = "ndpack"
+# Every array's bytes start on this boundary, so loaded arrays are aligned views
+ALIGNMENT = 64
+_HEADER_SIZE = 8
+
+
+class _Unsupported(Exception):
+    """ Raised while packing a value that isn't plain data + arrays. """
+
+
+def _pack_tree(value, arrays: list):
+    """ Replaces every ndarray in a plain dict / list structure by a reference
+    into `arrays`, and NumPy scalars by Python ones. """
+    if isinstance(value, np.ndarray):
+        arrays.append(value)
+        return {"__ndarray__": len(arrays) - 1}
+    if isinstance(value, dict):
+        if not all(isinstance(key, str) for key in value):
+            raise _Unsupported()
+        return {key: _pack_tree(item, arrays) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Tuples come back as lists
+        return [_pack_tree(item, arrays) for item in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise _Unsupported()
+
+
+def _unpack_tree(value, arrays: list):
+    if isinstance(value, dict):
+        if len(value) == 1 and "__ndarray__" in value:
+            return arrays[value["__ndarray__"]]
+        return {key: _unpack_tree(item, arrays) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_unpack_tree(item, arrays) for item in value]
+    return value
+
+
+def _padding(size: int) -> int:
+    return -size % ALIGNMENT
+
+
+class ArraySerializer:
+    """
+    LangGraph checkpoint serializer for state values that hold NumPy arrays.
+
+    Values made of dicts, lists, scalars and arrays (market_data, returns,
+    correlation_matrix, ...) are written as one small msgpack header followed
+    by each array's raw bytes — no per-element encoding, and datetime64 dates
+    are supported. Loading wraps the bytes with np.frombuffer, so arrays come
+    back as read-only views without a copy. Every other value (messages, the
+    checkpoint itself) goes to LangGraph's default JsonPlusSerializer.
+
+    Usage:
+        InMemorySaver(serde=ArraySerializer())  or  risk_analyzer_graph(checkpointer=...)
+    """
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or JsonPlusSerializer()
+
+    def dumps_typed(self, obj) -> tuple:
+        arrays = []
+        try:
+            tree = _pack_tree(obj, arrays)
+        except _Unsupported:
+            return self.fallback.dumps_typed(obj)
+        if not arrays or any(a.dtype.hasobject for a in arrays):
+            return self.fallback.dumps_typed(obj)
+
+        # Byte layout: header size | header | (padding | array bytes) ...
+        arrays = [np.ascontiguousarray(a) for a in arrays]
+        specs = [[a.dtype.str, list(a.shape), a.nbytes] for a in arrays]
+        header = ormsgpack.packb({"tree": tree, "arrays": specs})
+
+        parts = [len(header).to_bytes(_HEADER_SIZE, "little"), header]
+        offset = _HEADER_SIZE + len(header)
+        for a in arrays:
+            pad = _padding(offset)
+            parts.append(b"\0" * pad)
+            # datetime64 has no buffer interface — its int64 view has the same bytes
+            parts.append(a.view(np.int64).data if a.dtype.kind in "mM" else a.data)
+            offset += pad + a.nbytes
+        return ARRAY_TYPE, b"".join(parts)
+
+    def loads_typed(self, data: tuple):
+        type_, payload = data
+        if type_ != ARRAY_TYPE:
+            return self.fallback.loads_typed(data)
+
+        buffer = memoryview(payload)
+        header_size = int.from_bytes(buffer[:_HEADER_SIZE], "little")
+        header = ormsgpack.unpackb(bytes(buffer[_HEADER_SIZE:_HEADER_SIZE + header_size]))
+
+        arrays, offset = [], _HEADER_SIZE + header_size
+        for dtype, shape, nbytes in header["arrays"]:
+            offset += _padding(offset)
+            dtype = np.dtype(dtype)
+            if nbytes == 0:
+                arrays.append(np.empty(shape, dtype=dtype))
+                continue
+            array = np.frombuffer(buffer, dtype=dtype, count=nbytes // dtype.itemsize, offset=offset)
+            arrays.append(array.reshape(shape))
+            offset += nbytes
+        return _unpack_tree(header["tree"], arrays)
@@ -0,0 +1,186 @@
+import numpy as np
+
+# Rolling windows (in trading days) the historical stress test looks at by default
+DEFAULT_STRESS_WINDOWS = [30, 60, 90]
+
+
+def log_wealth(returns: np.ndarray) -> np.ndarray:
+    """
+    Prefix sums of log returns: L[k] = log of wealth after the first k days.
+    The compounded return of days i .. i+w-1 is then exp(L[i+w] - L[i]) - 1,
+    so every window is one subtraction instead of a product over the window.
+
+    Args:
+        returns: (days,) or (days × portfolios) array of simple daily returns
+    Returns:
+        array with one more row than `returns`, starting at 0
+    """
+    # A -100% day would be log(0) — clamp just above it
+    logs = np.log1p(np.maximum(returns, -0.999999))
+    prefix = np.zeros((len(returns) + 1,) + returns.shape[1:])
+    np.cumsum(logs, axis=0, out=prefix[1:])
+    return prefix
+
+
+def worst_windows(prefix: np.ndarray, window: int):
+    """
+    Finds the worst compounded return over every `window`-day period in one pass.
+
+    Args:
+        prefix: log wealth from log_wealth()
+        window: window length in trading days
+    Returns:
+        (loss, start_idx) — loss is the worst compounded return (0 if no window
+        lost money, like the original scan) and start_idx the index of the first
+        return in that window. Both are arrays when prefix is 2-D. start_idx is
+        -1 when the history is shorter than the window.
+    """
+    days = len(prefix) - 1
+    if days < window:
+        shape = prefix.shape[1:]
+        return np.zeros(shape), np.full(shape, -1, dtype=int)
+
+    # All window sums at once: L[i + w] - L[i]
+    window_sums = prefix[window:] - prefix[:-window]
+    start_idx = np.argmin(window_sums, axis=0)
+    worst = np.take_along_axis(window_sums, np.expand_dims(start_idx, 0), axis=0)[0]
+    loss = np.minimum(np.expm1(worst), 0.0)
+    return loss, start_idx
+
+
+def max_drawdown(prefix: np.ndarray):
+    """
+    Largest peak-to-trough fall of the compounded wealth curve and its recovery.
+
+    Args:
+        prefix: 1-D log wealth from log_wealth()
+    Returns:
+        (depth, peak_idx, trough_idx, recovery_idx) as positions on the wealth
+        curve (0 = before the first return). recovery_idx is None if wealth
+        never climbed back to the peak.
+    """
+    running_peak = np.maximum.accumulate(prefix)
+    drawdowns = np.expm1(prefix - running_peak)
+    trough_idx = int(np.argmin(drawdowns))
+    depth = float(drawdowns[trough_idx])
+    peak_idx = int(np.argmax(prefix[:trough_idx + 1]))
+
+    # First point after the trough back at (or above) the peak
+    recovered = np.nonzero(prefix[trough_idx:] >= prefix[peak_idx])[0]
+    recovery_idx = int(trough_idx + recovered[0]) if len(recovered) and depth < 0 else None
+    return depth, peak_idx, trough_idx, recovery_idx
+
+
+def drawdown_depths(prefix: np.ndarray):
+    """
+    Maximum drawdown depth only, for many portfolios at once.
+
+    Args:
+        prefix: (days + 1) × portfolios log wealth from log_wealth()
+    Returns:
+        array with the largest peak-to-trough fall (≤ 0) per portfolio
+    """
+    running_peak = np.maximum.accumulate(prefix, axis=0)
+    return np.expm1(np.min(prefix - running_peak, axis=0))
+
+
+def run_stress_test(returns: np.ndarray, dates: list, windows: list = None) -> dict:
+    """
+    Historical stress test of one portfolio return series.
+
+    Args:
+        returns: (days,) array of portfolio daily returns
+        dates: one date per return — datetime64 array or "YYYY-MM-DD" strings
+        windows: window lengths in trading days (default DEFAULT_STRESS_WINDOWS)
+    Returns:
+        dict with
+            "windows": one dict per window — window, loss, start/end dates and indices
+            "max_drawdown": depth, peak/trough/recovery dates and the recovery time
+    """
+    windows = windows or DEFAULT_STRESS_WINDOWS
+    prefix = log_wealth(np.asarray(returns, dtype=np.float64))
+
+    window_results = []
+    for window in windows:
+        loss, start_idx = worst_windows(prefix, window)
+        start_idx = int(start_idx)
+        if start_idx < 0:
+            # Not enough history for this window
+            window_results.append({
+                "window": window, "loss": 0.0,
+                "start_date": "N/A", "end_date": "N/A",
+                "start_idx": None, "end_idx": None
+            })
+            continue
+
+        # dates line up with the returns, so the window covers dates[start_idx : start_idx + window]
+        end_idx = start_idx + window - 1
+        window_results.append({
+            "window": window,
+            "loss": float(round(float(loss), 4)),
+            "start_date": str(dates[start_idx]),
+            "end_date": str(dates[end_idx]),
+            "start_idx": start_idx,
+            "end_idx": end_idx
+        })
+
+    # Wealth-curve position k is the close after k returns — date it by the
+    # last return it includes (position 0 is the start of the history)
+    def wealth_date(k):
+        return str(dates[max(k - 1, 0)]) if len(dates) else "N/A"
+
+    depth, peak_idx, trough_idx, recovery_idx = max_drawdown(prefix)
+    drawdown = {
+        "depth": float(round(depth, 4)),
+        "peak_date": wealth_date(peak_idx),
+        "trough_date": wealth_date(trough_idx),
+        "recovery_date": wealth_date(recovery_idx) if recovery_idx is not None else None,
+        # Trading days from the bottom back to the old peak, and peak to recovery
+        "recovery_days": recovery_idx - trough_idx if recovery_idx is not None else None,
+        "duration_days": recovery_idx - peak_idx if recovery_idx is not None else None
+    }
+
+    return {"windows": window_results, "max_drawdown": drawdown}
+
+
+def format_stress_test(stress_test: dict, years: int = None) -> str:
+    """
+    Formats run_stress_test() results as the text block the report prompt uses.
+
+    Args:
+        stress_test: dict returned by run_stress_test
+        years: look-back of the stress history, for the heading
+            (defaults to stress_test["years"] as set by node b)
+    """
+    years = years or stress_test.get("years")
+    stress_results = stress_test["windows"]
+    drawdown = stress_test["max_drawdown"]
+
+    stress_lines = [f"Historical Stress Test — Worst Periods (Last {years} Years):"]
+    for r in stress_results:
+        stress_lines.append(
+            f"  • Worst {r['window']}-day period "
+            f"({r['start_date']} → {r['end_date']}): "
+            f"{abs(r['loss']) * 100:.1f}% loss"
+        )
+
+    # Identify the single most vulnerable period
+    worst = max(stress_results, key=lambda x: abs(x["loss"]))
+    stress_lines.append(
+        f"\n  Most vulnerable period: "
+        f"{worst['start_date']} → {worst['end_date']} "
+        f"({worst['window']}-day window, {abs(worst['loss']) * 100:.1f}% loss)"
+    )
+
+    # Maximum drawdown and recovery
+    if drawdown["recovery_date"] is not None:
+        recovery_text = (f"recovered by {drawdown['recovery_date']} "
+                         f"({drawdown['recovery_days']} trading days after the trough)")
+    else:
+        recovery_text = "not yet recovered"
+    stress_lines.append(
+        f"  Maximum drawdown: {abs(drawdown['depth']) * 100:.1f}% "
+        f"({drawdown['peak_date']} → {drawdown['trough_date']}), {recovery_text}"
+    )
+
+    return "\n".join(stress_lines)
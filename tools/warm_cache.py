@@ -0,0 +1,86 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# Entries a long-lived process keeps warm — can be set in .env
+MAX_ENTRIES = int(os.getenv("WARM_CACHE_MAX_ENTRIES", "32"))
+
+
+class WarmCache:
+    """
+    In-memory LRU cache that also coalesces concurrent misses.
+
+    The first caller for a key computes the value; callers asking for the
+    same key while it is being computed wait for that result instead of
+    computing it again. Finished values stay in memory, least recently used
+    evicted above `max_entries` — with max_entries=0 nothing is kept and only
+    the coalescing remains.
+
+    Values are shared between callers, so they must not be modified.
+    Thread-safe; errors are not cached, the next caller tries again.
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = MAX_ENTRIES if max_entries is None else max_entries
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def get_or_compute(self, key, compute) -> tuple:
+        """
+        Returns the value for `key`, computing it with compute() on a miss.
+
+        Returns:
+            (value, how) — how is "hit", "coalesced" (waited for another
+            caller's computation) or "miss" (computed it)
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return self._entries[key], "hit"
+            future = self._in_flight.get(key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[key] = Future()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        if not owner:
+            # Somebody else is computing it — wait for their result (or error)
+            return future.result(), "coalesced"
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+        with self._lock:
+            del self._in_flight[key]
+            if self.max_entries > 0:
+                self._entries[key] = value
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+        future.set_result(value)
+        return value, "miss"
+
+    def clear(self) -> None:
+        """ Drops every finished entry — computations in flight carry on. """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """ Hit / miss / coalesced / eviction counters, entries held and hit rate. """
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"] + self._stats["coalesced"]
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "in_flight": len(self._in_flight),
+                "hit_rate": round((self._stats["hits"] + self._stats["coalesced"]) / lookups, 4) if lookups else 0.0
+            }
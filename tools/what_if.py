@@ -0,0 +1,221 @@
+import math
+from statistics import NormalDist
+
+import numpy as np
+
+from tools.price_simulator import take_rows
+from tools.risk_metrics import TRADING_DAYS, RISK_FREE_RATE
+from tools.stress_test import log_wealth, worst_windows, drawdown_depths, DEFAULT_STRESS_WINDOWS
+
+
+class WhatIf:
+    """
+    Re-evaluates a base run's risk numbers for new weights without rerunning
+    the graph: no refetch, no stress scan over prices, no LLM.
+
+    Everything that does not depend on the weights is prepared once from
+    node A's output — the VaR and stress windows of the returns matrix as
+    contiguous NaN-free arrays, their mean and covariance, and the shrunk
+    covariance. A candidate then costs two matrix-vector products plus
+    O(days) work on the resulting portfolio return series, so one candidate
+    takes well under a millisecond. Compounding is not linear in the weights,
+    so the stress prefix sums are rebuilt per candidate from those products
+    (O(days)) rather than stored.
+
+    Figures are the same as the nodes' before rounding: historical and
+    parametric 1-day VaR (node B), Sharpe ratio and √(wᵀΣw) volatility
+    (node C), worst stress windows and maximum drawdown (node B).
+    """
+
+    def __init__(self, returns: dict, windows: dict, covariance: dict,
+                 stress_windows: list = None, confidence: float = 0.95,
+                 risk_free_rate: float = RISK_FREE_RATE):
+        """
+        Args:
+            returns: {"dates", "tickers", "returns"} from node A
+            windows: first row of the VaR and stress windows, {"var", "stress"}
+            covariance: node A's covariance of the VaR window (tools/covariance.py)
+            stress_windows: stress windows in trading days (default DEFAULT_STRESS_WINDOWS)
+            confidence: VaR confidence level
+            risk_free_rate: annual risk-free rate for the Sharpe ratio
+        """
+        var_window = take_rows(returns, windows["var"])
+        stress_window = take_rows(returns, windows["stress"])
+        self.tickers = list(returns["tickers"])
+        self.column = {asset: j for j, asset in enumerate(self.tickers)}
+        self.stress_windows = list(stress_windows or DEFAULT_STRESS_WINDOWS)
+        self.confidence = confidence
+        self.z = NormalDist().inv_cdf(confidence)
+        self.risk_free_daily = risk_free_rate / TRADING_DAYS
+
+        # Masked (NaN) returns count as 0, as in portfolio_returns()
+        self.var_returns = np.ascontiguousarray(np.nan_to_num(var_window["returns"], nan=0.0))
+        self.stress_returns = np.ascontiguousarray(np.nan_to_num(stress_window["returns"], nan=0.0))
+        self.stress_dates = np.asarray(stress_window["dates"])
+
+        # Sharpe ratio pieces: mean and population covariance of the VaR window
+        self.mean = self.var_returns.mean(axis=0)
+        centered = self.var_returns - self.mean
+        self.sample_covariance = centered.T @ centered / max(len(centered), 1)
+
+        # Node A's shrunk covariance, lined up with the same columns
+        order = [covariance["tickers"].index(asset) for asset in self.tickers]
+        self.covariance = np.ascontiguousarray(covariance["matrix"][np.ix_(order, order)])
+        self.covariance_mean = np.asarray(covariance["mean"])[order]
+
+        # Position of the VaR quantile in the sorted days, as np.percentile places it
+        position = (len(self.var_returns) - 1) * (1 - confidence)
+        self._lo = int(math.floor(position))
+        self._hi = min(self._lo + 1, len(self.var_returns) - 1)
+        self._fraction = position - self._lo
+
+    @classmethod
+    def from_state(cls, state: dict, **kwargs) -> "WhatIf":
+        """ From a base run's final state (or node A's output) — stress windows
+        default to the ones the base run used. """
+        kwargs.setdefault("stress_windows", state.get("stress_windows"))
+        return cls(state["returns"], state["windows"], state["covariance"], **kwargs)
+
+    def weights(self, portfolio) -> np.ndarray:
+        """ Weight vector over the base run's tickers from a {ticker: weight}
+        dict (others 0), or an array already in that order. Like
+        portfolio_weights(), tickers without data in the base run don't
+        appear — a what-if can only reweight the base run's tickers. """
+        if not isinstance(portfolio, dict):
+            return np.asarray(portfolio, dtype=np.float64)
+        weights = np.zeros(len(self.tickers))
+        for asset, weight in portfolio.items():
+            if asset in self.column:
+                weights[self.column[asset]] = weight
+        return weights
+
+    def _quantile(self, portfolio_returns: np.ndarray) -> tuple:
+        """ np.percentile's linear-interpolated quantile, and the two days it
+        sits between — a partial sort, no full sort. """
+        days = np.argpartition(portfolio_returns, (self._lo, self._hi))
+        lo, hi = days[self._lo], days[self._hi]
+        value = portfolio_returns[lo] + (portfolio_returns[hi] - portfolio_returns[lo]) * self._fraction
+        return value, lo, hi
+
+    def evaluate(self, portfolio) -> dict:
+        """
+        Risk numbers for one candidate weighting.
+
+        Args:
+            portfolio: {ticker: weight} or a weight vector over self.tickers
+        Returns:
+            dict with "value_at_risk", "parametric_var", "volatility"
+            (annualized), "sharpe_ratio", "max_drawdown" (depth) and "stress_windows"
+            (one {"window", "loss", "start_date", "end_date", "start_idx",
+            "end_idx"} per window, as in run_stress_test())
+        """
+        w = self.weights(portfolio)
+        daily = self.var_returns @ w
+        quantile, _, _ = self._quantile(daily)
+
+        sigma_w = self.covariance @ w
+        volatility = math.sqrt(max(float(w @ sigma_w), 0.0))
+        std = float(daily.std())
+        sharpe = (float(daily.mean()) - self.risk_free_daily) / std * math.sqrt(TRADING_DAYS) if std else 0.0
+
+        prefix = log_wealth(self.stress_returns @ w)
+        stress = []
+        for window in self.stress_windows:
+            loss, start = worst_windows(prefix, window)
+            start = int(start)
+            found = start >= 0
+            # Same entries as run_stress_test(), unrounded
+            stress.append({
+                "window": window,
+                "loss": float(loss) if found else 0.0,
+                "start_date": str(self.stress_dates[start]) if found else "N/A",
+                "end_date": str(self.stress_dates[start + window - 1]) if found else "N/A",
+                "start_idx": start if found else None,
+                "end_idx": start + window - 1 if found else None
+            })
+
+        return {
+            "value_at_risk": abs(float(quantile)),
+            "parametric_var": self.z * volatility - float(self.covariance_mean @ w),
+            "volatility": volatility * math.sqrt(TRADING_DAYS),
+            "sharpe_ratio": sharpe,
+            "max_drawdown": float(drawdown_depths(prefix)),
+            "stress_windows": stress
+        }
+
+    def evaluate_many(self, weights: np.ndarray) -> dict:
+        """
+        The same numbers for many candidates at once — one GEMM per window of
+        returns instead of a matrix-vector product per candidate.
+
+        Args:
+            weights: (assets × candidates) weights over self.tickers
+        Returns:
+            dict of (candidates,) arrays: "value_at_risk", "parametric_var",
+            "volatility", "sharpe_ratio", "max_drawdown" and
+            "worst_<window>d_loss" per stress window
+        """
+        weights = np.asarray(weights, dtype=np.float64)
+        daily = self.var_returns @ weights
+        quantile = np.percentile(daily, (1 - self.confidence) * 100, axis=0)
+        variance = np.clip(np.sum(weights * (self.covariance @ weights), axis=0), 0.0, None)
+        std = daily.std(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sharpe = np.where(std != 0, (daily.mean(axis=0) - self.risk_free_daily) / std
+                              * np.sqrt(TRADING_DAYS), 0.0)
+
+        prefix = log_wealth(self.stress_returns @ weights)
+        results = {
+            "value_at_risk": np.abs(quantile),
+            "parametric_var": self.z * np.sqrt(variance) - self.covariance_mean @ weights,
+            "volatility": np.sqrt(variance * TRADING_DAYS),
+            "sharpe_ratio": sharpe,
+            "max_drawdown": drawdown_depths(prefix)
+        }
+        for window in self.stress_windows:
+            results[f"worst_{window}d_loss"] = worst_windows(prefix, window)[0]
+        return results
+
+    def sensitivities(self, portfolio) -> dict:
+        """
+        Gradients of the risk numbers with respect to every weight — how much
+        each metric moves per unit of weight added to each ticker.
+
+        - historical VaR: the VaR is the return of one (interpolated) day, so
+          ∂VaR/∂wᵢ is minus that day's return of asset i — exact wherever the
+          day ranking does not change
+        - parametric VaR: z · Σw / σ − μ (the marginal VaR)
+        - volatility: √252 · Σw / σ
+        - Sharpe ratio: √252 · (μ / s − (m − r_f) · Cw / s³), with the sample
+          mean m, standard deviation s and covariance C of the VaR window
+
+        Args:
+            portfolio: {ticker: weight} or a weight vector over self.tickers
+        Returns:
+            dict with "tickers" and one (assets,) gradient per metric:
+            "value_at_risk", "parametric_var", "volatility", "sharpe_ratio"
+        """
+        w = self.weights(portfolio)
+        daily = self.var_returns @ w
+        quantile, lo, hi = self._quantile(daily)
+        # VaR = |quantile|; the quantile moves with the two days it sits between
+        quantile_gradient = (1 - self._fraction) * self.var_returns[lo] + self._fraction * self.var_returns[hi]
+        var_gradient = np.sign(quantile) * quantile_gradient if quantile else -quantile_gradient
+
+        sigma_w = self.covariance @ w
+        volatility = math.sqrt(max(float(w @ sigma_w), 0.0))
+        marginal = sigma_w / volatility if volatility else np.zeros(len(w))
+
+        c_w = self.sample_covariance @ w
+        s = math.sqrt(max(float(w @ c_w), 0.0))
+        excess = float(self.mean @ w) - self.risk_free_daily
+        sharpe_gradient = (np.sqrt(TRADING_DAYS) * (self.mean / s - excess * c_w / s ** 3)
+                           if s else np.zeros(len(w)))
+
+        return {
+            "tickers": self.tickers,
+            "value_at_risk": var_gradient,
+            "parametric_var": self.z * marginal - self.covariance_mean,
+            "volatility": marginal * np.sqrt(TRADING_DAYS),
+            "sharpe_ratio": sharpe_gradient
+        }